@@ -26,11 +26,72 @@ class Config:
     SEGMENTS_ENDPOINT: str = os.getenv('WEBUDDHIST_SEGMENTS_ENDPOINT', '/api/v1/segments')
     TOC_ENDPOINT: str = os.getenv('WEBUDDHIST_TOC_ENDPOINT', '/api/v1/texts/table-of-content')
     AUTH_ENDPOINT: str = os.getenv('WEBUDDHIST_AUTH_ENDPOINT', '/api/v1/auth/login')
+    MAPPINGS_ENDPOINT: str = os.getenv('WEBUDDHIST_MAPPINGS_ENDPOINT', '/api/v1/mappings')
+    GROUPS_ENDPOINT: str = os.getenv('WEBUDDHIST_GROUPS_ENDPOINT', '/api/v1/groups')
+    TEXTS_ENDPOINT: str = os.getenv('WEBUDDHIST_TEXTS_ENDPOINT', '/api/v1/texts')
+    
+    # HTTP client (connection pool and timeouts in seconds)
+    HTTP_POOL_SIZE: int = int(os.getenv('WEBUDDHIST_HTTP_POOL_SIZE', '10'))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv('WEBUDDHIST_HTTP_CONNECT_TIMEOUT', '10'))
+    HTTP_READ_TIMEOUT: float = float(os.getenv('WEBUDDHIST_HTTP_READ_TIMEOUT', '300'))
+    
+    # Gzip-compress JSON request bodies (sent uncompressed again if the server answers 415)
+    HTTP_GZIP_REQUESTS: bool = os.getenv('WEBUDDHIST_HTTP_GZIP_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Retries of transient errors (5xx, 429, timeouts) with jittered exponential backoff
+    HTTP_MAX_RETRIES: int = int(os.getenv('WEBUDDHIST_HTTP_MAX_RETRIES', '5'))
+    HTTP_BACKOFF_BASE_SECONDS: float = float(os.getenv('WEBUDDHIST_HTTP_BACKOFF_BASE_SECONDS', '1'))
+    HTTP_BACKOFF_MAX_SECONDS: float = float(os.getenv('WEBUDDHIST_HTTP_BACKOFF_MAX_SECONDS', '60'))
+    
+    # Client side flow control: token bucket rate limit (requests per second, 0 for none) and
+    # adaptive (AIMD) number of requests in flight, lowered on 429/503 and rising latency
+    HTTP_FLOW_CONTROL: bool = os.getenv('WEBUDDHIST_HTTP_FLOW_CONTROL', 'true').lower() in ('1', 'true', 'yes')
+    HTTP_RATE_LIMIT: float = float(os.getenv('WEBUDDHIST_HTTP_RATE_LIMIT', '0'))
+    HTTP_RATE_BURST: int = int(os.getenv('WEBUDDHIST_HTTP_RATE_BURST', '10'))
+    HTTP_INITIAL_CONCURRENCY: int = int(os.getenv('WEBUDDHIST_HTTP_INITIAL_CONCURRENCY', '4'))
+    HTTP_MAX_CONCURRENCY: int = int(os.getenv('WEBUDDHIST_HTTP_MAX_CONCURRENCY', '64'))
+    HTTP_LATENCY_TOLERANCE: float = float(os.getenv('WEBUDDHIST_HTTP_LATENCY_TOLERANCE', '2'))
+    
+    # Checkpoint journals used to resume interrupted uploads
+    UPLOAD_JOURNAL_DIR: str = os.getenv('WEBUDDHIST_UPLOAD_JOURNAL_DIR', 'upload_journals')
+    
+    # Batched segment upload limits (per request body)
+    SEGMENT_BATCH_MAX_BYTES: int = int(os.getenv('WEBUDDHIST_SEGMENT_BATCH_MAX_BYTES', str(512 * 1024)))
+    SEGMENT_BATCH_MAX_SEGMENTS: int = int(os.getenv('WEBUDDHIST_SEGMENT_BATCH_MAX_SEGMENTS', '200'))
+    
+    # Chunked mapping upload limits (per request body) and number of chunks sent at once
+    MAPPING_CHUNK_MAX_BYTES: int = int(os.getenv('WEBUDDHIST_MAPPING_CHUNK_MAX_BYTES', str(512 * 1024)))
+    MAPPING_CHUNK_MAX_MAPPINGS: int = int(os.getenv('WEBUDDHIST_MAPPING_CHUNK_MAX_MAPPINGS', '500'))
+    MAPPING_UPLOAD_WORKERS: int = int(os.getenv('WEBUDDHIST_MAPPING_UPLOAD_WORKERS', '4'))
+    
+    # Layout of the written payload and response artifacts: compact unless pretty, optionally gzip-compressed
+    JSON_PRETTY: bool = os.getenv('WEBUDDHIST_JSON_PRETTY', 'false').lower() in ('1', 'true', 'yes')
+    JSON_GZIP: bool = os.getenv('WEBUDDHIST_JSON_GZIP', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Metadata requests (group and text creations) sent at once by a bulk metadata upload
+    METADATA_UPLOAD_WORKERS: int = int(os.getenv('WEBUDDHIST_METADATA_UPLOAD_WORKERS', '8'))
+    
+    # Per-stage timing spans of CLI runs, one JSON line per span (empty to disable the file)
+    METRICS_PATH: str = os.getenv('WEBUDDHIST_METRICS_PATH', 'metrics/webuddhist_metrics.jsonl')
+    
+    # Threads used by batch fuzzy scoring of many queries at once (-1 for all cores)
+    FUZZY_WORKERS: int = int(os.getenv('WEBUDDHIST_FUZZY_WORKERS', '-1'))
+    
+    # Saved root alignment plans of text mappings, reused while their inputs are unchanged (empty to disable)
+    MAPPING_PLAN_DIR: str = os.getenv('WEBUDDHIST_MAPPING_PLAN_DIR', 'mapping_plans')
+    
+    # Cache of derived outputs (resolved TOCs, mapping payloads) keyed by their inputs (empty to disable)
+    ARTIFACT_CACHE_DIR: str = os.getenv('WEBUDDHIST_ARTIFACT_CACHE_DIR', 'artifact_cache')
+    ARTIFACT_CACHE_MAX_BYTES: int = int(os.getenv('WEBUDDHIST_ARTIFACT_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
     
     # Authentication (optional - can be provided at runtime)
     EMAIL: Optional[str] = os.getenv('WEBUDDHIST_EMAIL')
     PASSWORD: Optional[str] = os.getenv('WEBUDDHIST_PASSWORD')
     
+    # Auth token cache shared by all uploaders and concurrent processes
+    TOKEN_CACHE_PATH: str = os.getenv('WEBUDDHIST_TOKEN_CACHE_PATH', str(Path.home() / '.cache' / 'webuddhist' / 'token.json'))
+    TOKEN_REFRESH_MARGIN_SECONDS: int = int(os.getenv('WEBUDDHIST_TOKEN_REFRESH_MARGIN_SECONDS', '60'))
+    
     # Environment
     ENVIRONMENT: str = os.getenv('ENVIRONMENT', 'development')
     
@@ -57,6 +118,21 @@ class Config:
         """Get the full URL for authentication endpoint"""
         return cls.get_full_url(cls.AUTH_ENDPOINT)
     
+    @classmethod
+    def get_mappings_url(cls) -> str:
+        """Get the full URL for mappings endpoint"""
+        return cls.get_full_url(cls.MAPPINGS_ENDPOINT)
+    
+    @classmethod
+    def get_groups_url(cls) -> str:
+        """Get the full URL for groups endpoint"""
+        return cls.get_full_url(cls.GROUPS_ENDPOINT)
+    
+    @classmethod
+    def get_texts_url(cls) -> str:
+        """Get the full URL for texts endpoint"""
+        return cls.get_full_url(cls.TEXTS_ENDPOINT)
+    
     @classmethod
     def is_production(cls) -> bool:
         """Check if running in production environment"""
@@ -69,7 +145,10 @@ class Config:
             'API_BASE_URL',
             'SEGMENTS_ENDPOINT',
             'TOC_ENDPOINT',
-            'AUTH_ENDPOINT'
+            'AUTH_ENDPOINT',
+            'MAPPINGS_ENDPOINT',
+            'GROUPS_ENDPOINT',
+            'TEXTS_ENDPOINT'
         ]
         
         for var in required_vars:
@@ -0,0 +1,88 @@
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional, the pure Python automaton below is used without it
+    ahocorasick = None
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: built once over a set of patterns, it reports every occurrence of
+    every pattern in a text in a single left to right pass, whatever the number of patterns.
+    Uses the pyahocorasick C automaton when it is installed.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        # Empty patterns would match at every offset, they are left out
+        self.patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for pattern_index, pattern in enumerate(self.patterns):
+                self.automaton.add_word(pattern, pattern_index)
+            if self.patterns:
+                self.automaton.make_automaton()
+        else:
+            self.build_automaton()
+
+    def build_automaton(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        for pattern_index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = next_state
+                state = next_state
+            self.output[state].append(pattern_index)
+
+        # Breadth first, so the fail state of a state is always complete before the state itself
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                fail_next_state = self.goto[fail_state].get(char, 0)
+                self.fail[next_state] = fail_next_state if fail_next_state != next_state else 0
+                self.output[next_state].extend(self.output[self.fail[next_state]])
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yields (start offset, pattern index) for every occurrence, by end offset."""
+        if not self.patterns:
+            return
+        if ahocorasick is not None:
+            for end_offset, pattern_index in self.automaton.iter(text):
+                yield end_offset - len(self.patterns[pattern_index]) + 1, pattern_index
+            return
+
+        goto, fail, output, patterns = self.goto, self.fail, self.output, self.patterns
+        state = 0
+        for offset, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_index in output[state]:
+                yield offset - len(patterns[pattern_index]) + 1, pattern_index
+
+    def get_occurrences(self, texts: Iterable[str]) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Pattern -> (text index, offset) of each of its occurrences in texts, in order. Every
+        text is scanned once and a pattern never matches across two texts.
+        """
+        occurrences = {pattern: [] for pattern in self.patterns}
+        for text_index, text in enumerate(texts):
+            for offset, pattern_index in self.iter_matches(text or ""):
+                occurrences[self.patterns[pattern_index]].append((text_index, offset))
+        for pattern_occurrences in occurrences.values():
+            pattern_occurrences.sort()
+        return occurrences
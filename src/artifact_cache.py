@@ -0,0 +1,174 @@
+import argparse
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Ensure project root is on sys.path so we can import config
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from config import config
+from metrics import span
+from utils import get_json_hash, read_json_file, write_json_file
+
+logger = logging.getLogger(__name__)
+
+# Part of every cache key, bump it when the layout of the cached artifacts changes
+ARTIFACT_CACHE_VERSION = 1
+
+
+def get_look_up_list_key(look_up_list) -> list:
+    """The part of a look up list (JSON list or lookup store) a derived artifact depends on."""
+    return [[look_up["segment_content"], look_up["id"]] for look_up in look_up_list]
+
+
+class ArtifactCache:
+    """
+    Content-addressed cache of derived pipeline outputs (resolved TOC payloads, mapping
+    payloads, ...), so a re-run over unchanged inputs skips the matching that produced them.
+
+    An artifact is stored as cache_dir/<kind>/<key>.json, where the key is a hash of its
+    inputs and of the version of the code deriving it (see get_key). Reading an artifact
+    marks it as used; once the cache is larger than max_bytes, the least recently used
+    artifacts are deleted.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes: int = None):
+        cache_dir = cache_dir or config.ARTIFACT_CACHE_DIR
+        if not cache_dir:
+            raise ValueError("No artifact cache directory given and WEBUDDHIST_ARTIFACT_CACHE_DIR is empty")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = config.ARTIFACT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(kind: str, version: int, **inputs) -> str:
+        return get_json_hash({"cache_version": ARTIFACT_CACHE_VERSION, "kind": kind, "version": version, "inputs": inputs})
+
+    def get_path(self, kind: str, key: str) -> Path:
+        return self.cache_dir / kind / f"{key}.json"
+
+    def get(self, kind: str, key: str):
+        """The cached artifact, or None when there is none."""
+        path = self.get_path(kind, key)
+        try:
+            data = read_json_file(path) if path.exists() else None
+        except FileNotFoundError:
+            # Evicted in the meantime
+            data = None
+        if data is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        # The modification time is the last use the eviction goes by
+        path.touch()
+        with self.lock:
+            self.hits += 1
+        logger.info(f"Using cached {kind} {key}")
+        return data
+
+    def put(self, kind: str, key: str, data):
+        path = self.get_path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        write_json_file(data, temp_path)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def get_or_build(self, kind: str, key: str, build):
+        """The cached artifact, or the result of build() which is then cached."""
+        data = self.get(kind, key)
+        if data is None:
+            data = build()
+            self.put(kind, key, data)
+        return data
+
+    def iter_entries(self):
+        """(path, size, last use) of every cached artifact."""
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+    def evict(self, max_bytes: int = None) -> int:
+        """Deletes the least recently used artifacts until the cache fits in max_bytes, returns how many."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self.lock:
+            entries = sorted(self.iter_entries(), key=lambda entry: entry[2])
+            total_bytes = sum(size for _, size, _ in entries)
+            if total_bytes <= max_bytes:
+                return 0
+            with span("artifact_cache_evict") as evict_span:
+                evicted = 0
+                for path, size, _ in entries:
+                    if total_bytes <= max_bytes:
+                        break
+                    path.unlink(missing_ok=True)
+                    total_bytes -= size
+                    evicted += 1
+                evict_span.set(items=evicted, bytes=total_bytes)
+        logger.info(f"Evicted {evicted} cached artifacts, {total_bytes} bytes left")
+        return evicted
+
+    def clear(self) -> int:
+        return self.evict(max_bytes=0)
+
+    def get_stats(self) -> dict:
+        kinds = {}
+        for path, size, _ in self.iter_entries():
+            kind = kinds.setdefault(path.parent.name, {"entries": 0, "bytes": 0})
+            kind["entries"] += 1
+            kind["bytes"] += size
+        with self.lock:
+            return {
+                "cache_dir": str(self.cache_dir),
+                "entries": sum(kind["entries"] for kind in kinds.values()),
+                "bytes": sum(kind["bytes"] for kind in kinds.values()),
+                "max_bytes": self.max_bytes,
+                "kinds": dict(sorted(kinds.items())),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_default_artifact_cache = None
+_default_artifact_cache_lock = threading.Lock()
+
+
+def get_default_artifact_cache():
+    """The process-wide cache in WEBUDDHIST_ARTIFACT_CACHE_DIR, or None when it is empty (caching disabled)."""
+    global _default_artifact_cache
+    if not config.ARTIFACT_CACHE_DIR:
+        return None
+    with _default_artifact_cache_lock:
+        if _default_artifact_cache is None or _default_artifact_cache.cache_dir != Path(config.ARTIFACT_CACHE_DIR):
+            _default_artifact_cache = ArtifactCache()
+        return _default_artifact_cache
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Inspect and trim the cache of derived pipeline outputs")
+    parser.add_argument("command", choices=["stats", "evict", "clear"], help="stats: size per kind, evict: trim to --max-bytes, clear: delete everything")
+    parser.add_argument("--cache-dir", default=None, help="Cache directory (defaults to WEBUDDHIST_ARTIFACT_CACHE_DIR)")
+    parser.add_argument("--max-bytes", type=int, default=None, help="Size to trim the cache to (defaults to WEBUDDHIST_ARTIFACT_CACHE_MAX_BYTES)")
+    args = parser.parse_args()
+
+    artifact_cache = ArtifactCache(cache_dir=args.cache_dir, max_bytes=args.max_bytes)
+    if args.command == "evict":
+        print(f"Evicted {artifact_cache.evict()} artifacts")
+    elif args.command == "clear":
+        print(f"Deleted {artifact_cache.clear()} artifacts")
+
+    stats = artifact_cache.get_stats()
+    print(f"{stats['cache_dir']}: {stats['entries']} artifacts, {stats['bytes'] / 2**20:.2f} of {stats['max_bytes'] / 2**20:.2f} MiB")
+    for kind, kind_stats in stats["kinds"].items():
+        print(f"  {kind:<24}{kind_stats['entries']:>8} artifacts{kind_stats['bytes'] / 2**20:>10.2f} MiB")
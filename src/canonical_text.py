@@ -0,0 +1,132 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Tuple
+
+CANONICAL_CACHE_SIZE = 1 << 16
+
+# Invisible characters that show up in pasted texts, e.g. the zero-width space in the
+# heart_sutra root_display_text
+ZERO_WIDTH_CHARACTERS = {
+    "\u00AD": "SOFT HYPHEN",
+    "\u180E": "MONGOLIAN VOWEL SEPARATOR",
+    "\u200B": "ZERO WIDTH SPACE",
+    "\u200C": "ZERO WIDTH NON-JOINER",
+    "\u200D": "ZERO WIDTH JOINER",
+    "\u2060": "WORD JOINER",
+    "\uFEFF": "ZERO WIDTH NO-BREAK SPACE",
+}
+
+BIDI_CHARACTERS = {
+    "\u061C": "ARABIC LETTER MARK",
+    "\u200E": "LEFT-TO-RIGHT MARK",
+    "\u200F": "RIGHT-TO-LEFT MARK",
+    "\u202A": "LEFT-TO-RIGHT EMBEDDING",
+    "\u202B": "RIGHT-TO-LEFT EMBEDDING",
+    "\u202C": "POP DIRECTIONAL FORMATTING",
+    "\u202D": "LEFT-TO-RIGHT OVERRIDE",
+    "\u202E": "RIGHT-TO-LEFT OVERRIDE",
+    "\u2066": "LEFT-TO-RIGHT ISOLATE",
+    "\u2067": "RIGHT-TO-LEFT ISOLATE",
+    "\u2068": "FIRST STRONG ISOLATE",
+    "\u2069": "POP DIRECTIONAL ISOLATE",
+}
+
+HIDDEN_CHARACTERS = {**ZERO_WIDTH_CHARACTERS, **BIDI_CHARACTERS}
+
+TSHEG = "\u0F0B"
+NON_BREAKING_TSHEG = "\u0F0C"
+SHAD_CHARACTERS = "\u0F0D\u0F0E\u0F0F\u0F10\u0F11\u0F14"
+
+# Hidden characters are dropped and the non-breaking tsheg is written as a plain tsheg
+CANONICAL_TRANSLATE_TABLE = str.maketrans(
+    {**{hidden_char: None for hidden_char in HIDDEN_CHARACTERS}, NON_BREAKING_TSHEG: TSHEG}
+)
+
+HIDDEN_LITERALS_TRANSLATE_TABLE = str.maketrans(
+    {hidden_char: f"[U+{ord(hidden_char):04X} {name}]" for hidden_char, name in HIDDEN_CHARACTERS.items()}
+)
+
+# "། །" and "།།" are the same double shad
+SPACE_BETWEEN_SHADS_PATTERN = re.compile(f"(?<=[{SHAD_CHARACTERS}]) (?=[{SHAD_CHARACTERS}])")
+
+
+def _normalize_unicode_form(text: str) -> str:
+    if unicodedata.is_normalized("NFC", text):
+        return text
+    return unicodedata.normalize("NFC", text)
+
+
+@lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def canonicalize(text: str) -> str:
+    """
+    Canonical form used to compare segment contents: NFC, hidden (zero-width and bidi)
+    characters removed, non-breaking tsheg as tsheg, whitespace runs (including newlines)
+    collapsed to one space, no surrounding whitespace and no space between two shads.
+    Results are memoized, so canonicalizing the same segment again is a dict lookup.
+    """
+    if not text:
+        return ""
+    text = _normalize_unicode_form(text.translate(CANONICAL_TRANSLATE_TABLE))
+    return SPACE_BETWEEN_SHADS_PATTERN.sub("", " ".join(text.split()))
+
+
+def _normalize_unicode_form_with_offsets(chars: List[str], offsets: List[int]) -> Tuple[List[str], List[int]]:
+    """NFC per combining sequence, so that every output character keeps the offset of its sequence."""
+    if unicodedata.is_normalized("NFC", "".join(chars)):
+        return chars, offsets
+    normalized_chars, normalized_offsets = [], []
+    sequence_start = 0
+    for index in range(1, len(chars) + 1):
+        if index == len(chars) or unicodedata.combining(chars[index]) == 0:
+            sequence = unicodedata.normalize("NFC", "".join(chars[sequence_start:index]))
+            normalized_chars.extend(sequence)
+            normalized_offsets.extend([offsets[sequence_start]] * len(sequence))
+            sequence_start = index
+    return normalized_chars, normalized_offsets
+
+
+@lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def canonicalize_with_offsets(text: str) -> Tuple[str, Tuple[int, ...]]:
+    """
+    Returns (canonicalize(text), offsets) where offsets[i] is the index in text of the
+    i-th canonical character, to map a match in the canonical form back to the original.
+    """
+    chars, offsets = [], []
+    for index, char in enumerate(text or ""):
+        translated = char.translate(CANONICAL_TRANSLATE_TABLE)
+        if translated:
+            chars.append(translated)
+            offsets.append(index)
+    chars, offsets = _normalize_unicode_form_with_offsets(chars, offsets)
+
+    canonical_chars, canonical_offsets = [], []
+    for char, offset in zip(chars, offsets):
+        if char.isspace():
+            if not canonical_chars or canonical_chars[-1] == " ":
+                continue
+            char = " "
+        elif char in SHAD_CHARACTERS and len(canonical_chars) >= 2 and canonical_chars[-1] == " " and canonical_chars[-2] in SHAD_CHARACTERS:
+            canonical_chars.pop()
+            canonical_offsets.pop()
+        canonical_chars.append(char)
+        canonical_offsets.append(offset)
+    if canonical_chars and canonical_chars[-1] == " ":
+        canonical_chars.pop()
+        canonical_offsets.pop()
+
+    return "".join(canonical_chars), tuple(canonical_offsets)
+
+
+def get_original_span(text: str, canonical_start: int, canonical_end: int) -> Tuple[int, int]:
+    """Maps [canonical_start, canonical_end) of canonicalize(text) back to a span of text."""
+    _, offsets = canonicalize_with_offsets(text)
+    if canonical_start >= canonical_end:
+        original_offset = offsets[canonical_start] if canonical_start < len(offsets) else len(text)
+        return original_offset, original_offset
+    return offsets[canonical_start], offsets[canonical_end - 1] + 1
+
+
+def show_hidden_literals(text: str) -> str:
+    """Replaces hidden characters with their code point and name, e.g. [U+200B ZERO WIDTH SPACE]."""
+    return text.translate(HIDDEN_LITERALS_TRANSLATE_TABLE)
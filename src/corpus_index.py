@@ -0,0 +1,230 @@
+import argparse
+import gzip
+import json
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# Ensure project root is on sys.path so we can import config and utils
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+PROJECT_ROOT = Path(project_root)
+DEFAULT_INDEX_PATH = PROJECT_ROOT / "corpus_index.json.gz"
+DEFAULT_NGRAM_SIZE = 3
+INDEX_FORMAT_VERSION = 1
+
+from canonical_text import canonicalize
+from utils import read_json_file
+
+logger = logging.getLogger(__name__)
+
+# Tsheg, shad and other Tibetan punctuation marks, and whitespace
+SYLLABLE_DELIMITER_PATTERN = re.compile(r"[\u0F01-\u0F14\u0F34\u0F3A-\u0F3D\s]+")
+
+MAPPING_COLUMNS = ("root_display_text", "commentary_1", "commentary_2", "commentary_3", "sanskrit_text")
+
+
+def split_syllables(text: str) -> list:
+    """Splits the canonical form of text into tsheg/shad delimited syllables."""
+    return [syllable for syllable in SYLLABLE_DELIMITER_PATTERN.split(canonicalize(text)) if syllable]
+
+
+def get_ngrams(syllables: list, ngram_size: int) -> list:
+    """Returns the syllable n-grams of a segment; segments shorter than n give a single gram."""
+    if not syllables:
+        return []
+    if len(syllables) < ngram_size:
+        return ["་".join(syllables)]
+    return ["་".join(syllables[index:index + ngram_size]) for index in range(len(syllables) - ngram_size + 1)]
+
+
+def iter_corpus_segments(file_path):
+    """
+    Yields (text, segment id, position, content) for the segments of one corpus file:
+    a *_segment_content_with_segment_id.json look up list, a segment payload or a
+    commentaries_and_sanskrit mapping file (one text per column).
+    """
+    file_path = Path(file_path)
+    data = read_json_file(str(file_path))
+    text_name = file_path.stem.replace("_segment_content_with_segment_id", "")
+
+    if isinstance(data, dict) and "segments" in data:
+        for position, segment in enumerate(data["segments"]):
+            yield text_name, None, position, segment.get("content") or ""
+    elif isinstance(data, list) and data and "segment_content" in data[0]:
+        for position, segment in enumerate(data):
+            yield text_name, segment.get("id"), position, segment.get("segment_content") or ""
+    elif isinstance(data, list) and data and "root_display_text" in data[0]:
+        for column in MAPPING_COLUMNS:
+            for position, row in enumerate(data):
+                if row.get(column):
+                    yield f"{text_name}:{column}", None, position, row[column]
+    else:
+        logger.warning(f"Skipping {file_path}, unknown file format")
+
+
+def get_default_corpus_files():
+    return sorted(
+        set(PROJECT_ROOT.glob("src/**/*_segment_content_with_segment_id.json"))
+        | set(PROJECT_ROOT.glob("src/data/*/*_payload/*_segment_payload.json"))
+        | set(PROJECT_ROOT.glob("pecha_segment_upload_payload/*.json"))
+        | set(PROJECT_ROOT.glob("commentaries_and_sanskrit/*.json"))
+    )
+
+
+class CorpusIndex:
+    """
+    Syllable n-gram inverted index over the corpus.
+    Each n-gram maps to the documents (segments) containing it; a query is split the
+    same way and candidates are ranked by the share of the query's n-grams they contain.
+    """
+
+    def __init__(self, ngram_size: int = DEFAULT_NGRAM_SIZE):
+        self.ngram_size = ngram_size
+        # document index -> [source file, text, segment id, position]
+        self.documents = []
+        self.postings = {}
+
+    def add_segment(self, source_file: str, text: str, segment_id, position: int, content: str):
+        document_index = len(self.documents)
+        self.documents.append([source_file, text, segment_id, position])
+        for ngram in set(get_ngrams(split_syllables(content), self.ngram_size)):
+            self.postings.setdefault(ngram, []).append(document_index)
+
+    def add_file(self, file_path):
+        resolved_path = Path(file_path).resolve()
+        source_file = str(resolved_path.relative_to(PROJECT_ROOT)) if resolved_path.is_relative_to(PROJECT_ROOT) else str(file_path)
+        for text, segment_id, position, content in iter_corpus_segments(file_path):
+            self.add_segment(source_file, text, segment_id, position, content)
+
+    @classmethod
+    def build(cls, file_paths=None, ngram_size: int = DEFAULT_NGRAM_SIZE):
+        start_time = time.perf_counter()
+        corpus_index = cls(ngram_size)
+        for file_path in file_paths or get_default_corpus_files():
+            corpus_index.add_file(file_path)
+        logger.info(
+            f"Indexed {len(corpus_index.documents)} segments, {len(corpus_index.postings)} n-grams "
+            f"in {time.perf_counter() - start_time:.2f}s"
+        )
+        return corpus_index
+
+    def get_short_query_postings(self, syllables: list) -> list:
+        """
+        Postings for a query shorter than n syllables: the segments indexed as that exact
+        short gram plus every n-gram starting with it (found by scanning the vocabulary).
+        """
+        short_ngram = "་".join(syllables)
+        prefix = short_ngram + "་"
+        document_indices = set(self.postings.get(short_ngram, []))
+        for indexed_ngram, ngram_document_indices in self.postings.items():
+            if indexed_ngram.startswith(prefix):
+                document_indices.update(ngram_document_indices)
+        return sorted(document_indices)
+
+    def query(self, text: str, limit: int = 10, min_score: float = 0.5, source_text: str = None) -> list:
+        """
+        Returns up to `limit` candidate segments containing text, best first, as dicts with
+        source_file, text, segment_id, position and score (share of query n-grams found).
+        """
+        query_syllables = split_syllables(text)
+        query_ngrams = set(get_ngrams(query_syllables, self.ngram_size))
+        if not query_ngrams:
+            return []
+
+        hits = Counter()
+        if len(query_syllables) < self.ngram_size:
+            hits.update(self.get_short_query_postings(query_syllables))
+        else:
+            for ngram in query_ngrams:
+                hits.update(self.postings.get(ngram, []))
+
+        candidates = []
+        for document_index, hit_count in sorted(hits.items(), key=lambda hit: (-hit[1], hit[0])):
+            score = hit_count / len(query_ngrams)
+            if score < min_score:
+                break
+            source_file, document_text, segment_id, position = self.documents[document_index]
+            if source_text is not None and document_text != source_text:
+                continue
+            candidates.append({
+                "source_file": source_file,
+                "text": document_text,
+                "segment_id": segment_id,
+                "position": position,
+                "score": round(score, 4),
+            })
+            if len(candidates) >= limit:
+                break
+        return candidates
+
+    def shortlist_positions(self, text: str, source_text: str, limit: int = 10, min_score: float = 0.5) -> list:
+        """Positions in source_text worth fuzzy-scoring against text, in corpus order."""
+        return sorted(
+            candidate["position"]
+            for candidate in self.query(text, limit=limit, min_score=min_score, source_text=source_text)
+        )
+
+    def save(self, index_path=DEFAULT_INDEX_PATH):
+        index_path = Path(index_path)
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(index_path, "wt", encoding="utf-8", compresslevel=4) as file:
+            json.dump(
+                {
+                    "version": INDEX_FORMAT_VERSION,
+                    "ngram_size": self.ngram_size,
+                    "documents": self.documents,
+                    "postings": self.postings,
+                },
+                file,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        logger.info(f"Corpus index saved to {index_path}")
+
+    @classmethod
+    def load(cls, index_path=DEFAULT_INDEX_PATH):
+        with gzip.open(index_path, "rt", encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported corpus index version {data.get('version')} in {index_path}, rebuild it")
+        corpus_index = cls(data["ngram_size"])
+        corpus_index.documents = data["documents"]
+        corpus_index.postings = data["postings"]
+        return corpus_index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Build or query the Tibetan syllable n-gram corpus index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Index the corpus files")
+    build_parser.add_argument("files", nargs="*", help="Corpus files (defaults to every lookup, payload and commentaries_and_sanskrit file)")
+    build_parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), help="Index file to write")
+    build_parser.add_argument("--ngram-size", type=int, default=DEFAULT_NGRAM_SIZE, help="Syllables per n-gram")
+
+    query_parser = subparsers.add_parser("query", help="Find where a piece of text lives")
+    query_parser.add_argument("text", help="Text to look for")
+    query_parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), help="Index file to read")
+    query_parser.add_argument("--limit", type=int, default=10, help="Maximum number of candidates")
+    query_parser.add_argument("--min-score", type=float, default=0.5, help="Minimum share of query n-grams a candidate must contain")
+    query_parser.add_argument("--text-name", default=None, help="Only return candidates from this text")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        CorpusIndex.build(args.files, ngram_size=args.ngram_size).save(args.index)
+    else:
+        corpus_index = CorpusIndex.load(args.index)
+        start_time = time.perf_counter()
+        candidates = corpus_index.query(args.text, limit=args.limit, min_score=args.min_score, source_text=args.text_name)
+        for candidate in candidates:
+            print(json.dumps(candidate, ensure_ascii=False))
+        print(f"{len(candidates)} candidates in {(time.perf_counter() - start_time) * 1000:.1f} ms")
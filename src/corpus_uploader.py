@@ -0,0 +1,257 @@
+import argparse
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+# Ensure project root is on sys.path so we can import config and utils
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / "data"
+DEFAULT_LOG_DIR = Path("corpus_upload_logs")
+
+from config import config
+from utils import get_token
+from metrics import metrics_run, span
+from segment_uploader_webuddhist import SegmentUploader
+from upload_journal import UploadJournal
+from webuddhist_client import WebBuddhistClient
+
+LOG_FILE = "corpus_upload_log.txt"
+
+logging.basicConfig(
+    filename=LOG_FILE,
+    filemode="a",
+    encoding="utf-8",
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    level=logging.INFO,
+)
+
+logger = logging.getLogger(__name__)
+
+# choejuk_root_text.json, dorjee_choepa_commentary_1.json, heart_sutra_root_text_segment_payload.json
+PAYLOAD_FILE_NAME_PATTERN = re.compile(
+    r"^(?P<text_name>.+?)_(?P<root_or_commentary>root|commentary_\d+)(?:_text)?(?:_segment_payload)?$"
+)
+
+
+def parse_payload_file_name(payload_file_path):
+    """
+    Returns (text_name, root_or_commentary) for a segment payload file such as
+    choejuk_root_text.json or choejuk_commentary_1.json.
+    """
+    match = PAYLOAD_FILE_NAME_PATTERN.match(Path(payload_file_path).stem)
+    if not match:
+        raise ValueError(f"Cannot infer text name and root/commentary from {payload_file_path}")
+    return match.group("text_name"), match.group("root_or_commentary")
+
+
+def discover_upload_jobs(paths):
+    """
+    Builds the list of upload jobs from payload directories and/or payload files.
+    Jobs are sorted by text name with the root text before its commentaries.
+    """
+    payload_files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            payload_files.extend(sorted(path.glob("*.json")))
+        else:
+            payload_files.append(path)
+
+    jobs = []
+    for payload_file in payload_files:
+        text_name, root_or_commentary = parse_payload_file_name(payload_file)
+        jobs.append({
+            "text_name": text_name,
+            "root_or_commentary": root_or_commentary,
+            "payload_data_file_path": str(payload_file),
+        })
+
+    jobs.sort(key=lambda job: (job["text_name"], job["root_or_commentary"] != "root", job["root_or_commentary"]))
+    return jobs
+
+
+class CorpusUploader:
+    def __init__(
+        self,
+        jobs,
+        max_workers: int = 4,
+        output_dir: str = None,
+        log_dir: str = None,
+        root_before_commentary: bool = True,
+        batched: bool = False,
+        max_batch_bytes: int = None,
+        max_batch_segments: int = None,
+        segment_upload_url: str = None,
+        client: WebBuddhistClient = None,
+        resume: bool = False,
+        journal_dir: str = None,
+        stream: bool = False,
+    ):
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.log_dir = Path(log_dir) if log_dir else DEFAULT_LOG_DIR
+        self.root_before_commentary = root_before_commentary
+        self.batched = batched
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_segments = max_batch_segments
+        self.segment_upload_url = segment_upload_url
+        # One pooled client for every worker, sized so no worker waits for a connection
+        self.client = client or WebBuddhistClient(pool_size=max(max_workers, config.HTTP_POOL_SIZE))
+        self.resume = resume
+        self.journal_dir = Path(journal_dir or config.UPLOAD_JOURNAL_DIR)
+        self.stream = stream
+
+    @staticmethod
+    def get_job_name(job):
+        return f"{job['text_name']}_{job['root_or_commentary']}"
+
+    def get_output_file_path(self, job):
+        file_name = f"{self.get_job_name(job)}_segment_content_with_segment_id.json"
+        if self.output_dir:
+            return self.output_dir / file_name
+        return DATA_DIR / job["text_name"] / f"{job['text_name']}_api_response" / file_name
+
+    def get_job_logger(self, job):
+        """Returns a logger writing to the job's own log file."""
+        job_logger = logging.getLogger(f"{__name__}.{self.get_job_name(job)}")
+        log_file_path = (self.log_dir / f"{self.get_job_name(job)}_upload_log.txt").resolve()
+        if not any(
+            isinstance(handler, logging.FileHandler) and handler.baseFilename == str(log_file_path)
+            for handler in job_logger.handlers
+        ):
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            handler = logging.FileHandler(log_file_path, mode="a", encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+            job_logger.addHandler(handler)
+        job_logger.setLevel(logging.INFO)
+        job_logger.propagate = False
+        return job_logger
+
+    def get_job_journal(self, job):
+        return UploadJournal(self.journal_dir / f"{self.get_job_name(job)}_segments.jsonl", resume=self.resume)
+
+    def upload_job(self, job, token):
+        job_name = self.get_job_name(job)
+        output_file_path = self.get_output_file_path(job)
+        output_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+        start_time = time.perf_counter()
+        uploader = SegmentUploader(
+            segment_upload_url=self.segment_upload_url,
+            text_name=job["text_name"],
+            root_or_commentary=job["root_or_commentary"],
+            payload_data_file_path=job["payload_data_file_path"],
+            segment_content_with_segment_id_file_path=str(output_file_path),
+            logger=self.get_job_logger(job),
+            client=self.client,
+            stream=self.stream,
+        )
+        with span("upload_job", job=job_name):
+            uploader.upload_segments(
+                batched=self.batched,
+                max_batch_bytes=self.max_batch_bytes,
+                max_batch_segments=self.max_batch_segments,
+                token=token,
+                journal=self.get_job_journal(job),
+            )
+        elapsed = time.perf_counter() - start_time
+        logger.info(f"Uploaded {job_name} in {elapsed:.2f}s -> {output_file_path}")
+        return {
+            "job": job_name,
+            "status": "uploaded",
+            "output_file_path": str(output_file_path),
+            "seconds": round(elapsed, 3),
+        }
+
+    def run(self, token=None):
+        """
+        Uploads every job on a bounded thread pool. When root_before_commentary is set,
+        a text's commentaries are only submitted once its root text has been uploaded.
+        Returns the job results in the order of self.jobs.
+        """
+        token = token or get_token()
+        start_time = time.perf_counter()
+
+        roots = {job["text_name"] for job in self.jobs if job["root_or_commentary"] == "root"}
+        waiting_on_root = {}
+        ready = []
+        for job in self.jobs:
+            if self.root_before_commentary and job["root_or_commentary"] != "root" and job["text_name"] in roots:
+                waiting_on_root.setdefault(job["text_name"], []).append(job)
+            else:
+                ready.append(job)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {executor.submit(self.upload_job, job, token): job for job in ready}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    job_name = self.get_job_name(job)
+                    try:
+                        results[job_name] = future.result()
+                        root_succeeded = True
+                    except Exception as e:
+                        logger.error(f"Upload failed for {job_name}: {e}")
+                        results[job_name] = {"job": job_name, "status": "failed", "error": str(e)}
+                        root_succeeded = False
+
+                    if job["root_or_commentary"] != "root":
+                        continue
+                    for dependent_job in waiting_on_root.pop(job["text_name"], []):
+                        if root_succeeded:
+                            running[executor.submit(self.upload_job, dependent_job, token)] = dependent_job
+                        else:
+                            dependent_name = self.get_job_name(dependent_job)
+                            results[dependent_name] = {
+                                "job": dependent_name,
+                                "status": "skipped",
+                                "error": f"Root text {job_name} failed",
+                            }
+
+        logger.info(f"Corpus upload of {len(self.jobs)} texts finished in {time.perf_counter() - start_time:.2f}s")
+        return [results[self.get_job_name(job)] for job in self.jobs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload many segment payloads to webuddhist concurrently")
+    parser.add_argument("paths", nargs="+", help="Payload directories (e.g. pecha_segment_upload_payload) or payload files")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent uploads")
+    parser.add_argument("--output-dir", default=None, help="Directory for *_segment_content_with_segment_id.json files")
+    parser.add_argument("--log-dir", default=None, help="Directory for the per-text log files")
+    parser.add_argument("--no-root-first", action="store_true", help="Do not wait for a root text before its commentaries")
+    parser.add_argument("--batch", action="store_true", help="Upload each text in size-capped batches")
+    parser.add_argument("--max-batch-bytes", type=int, default=None, help="Maximum request body size per batch")
+    parser.add_argument("--max-batch-segments", type=int, default=None, help="Maximum number of segments per batch")
+    parser.add_argument("--stream", action="store_true", help="Stream each payload in batches instead of loading it whole")
+    parser.add_argument("--resume", action="store_true", help="Skip texts and batches completed by a previous interrupted run")
+    parser.add_argument("--journal-dir", default=None, help="Directory for the per-text checkpoint journals")
+    parser.add_argument("--metrics-path", default=None, help="JSON lines file for the timing spans (defaults to WEBUDDHIST_METRICS_PATH)")
+    args = parser.parse_args()
+
+    corpus_uploader = CorpusUploader(
+        discover_upload_jobs(args.paths),
+        max_workers=args.workers,
+        output_dir=args.output_dir,
+        log_dir=args.log_dir,
+        root_before_commentary=not args.no_root_first,
+        batched=args.batch,
+        max_batch_bytes=args.max_batch_bytes,
+        max_batch_segments=args.max_batch_segments,
+        resume=args.resume,
+        journal_dir=args.journal_dir,
+        stream=args.stream,
+    )
+
+    with metrics_run("corpus_upload", metrics_path=args.metrics_path):
+        for result in corpus_uploader.run():
+            print(result)
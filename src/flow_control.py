@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+
+from config import config
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Responses telling the client to slow down
+OVERLOAD_STATUS_CODES = {429, 503}
+
+# Weights of the latest latency in the short and long term moving averages of an endpoint
+SHORT_LATENCY_WEIGHT = 0.5
+LONG_LATENCY_WEIGHT = 0.05
+# Latency rises smaller than this are jitter, not a sign of overload
+MIN_LATENCY_RISE_SECONDS = 0.05
+
+
+class FlowSlot:
+    """One request admitted by a FlowController, handed back to release() once it is answered."""
+
+    def __init__(self, endpoint: str, limit: int, wait_seconds: float, saturated: bool):
+        self.endpoint = endpoint
+        self.limit = limit
+        self.wait_seconds = wait_seconds
+        # Whether at least half the slots were in use, so the limit may be what holds the requests back
+        self.saturated = saturated
+        self.started_at = time.monotonic()
+
+
+class FlowController:
+    """
+    Client side flow control of the API calls, shared by every thread using one client.
+
+    A token bucket caps the request rate (rate requests per second with bursts of burst,
+    no cap without rate) and an AIMD limit caps the requests in flight. While at least half
+    of the limit is in use, it grows by 1/limit per request answered in time (about one per
+    round trip). It is multiplied by decrease_factor on a 429/503, a timeout or connection
+    error, or when the short term latency of an endpoint exceeds latency_tolerance times
+    its long term latency (by at least MIN_LATENCY_RISE_SECONDS). Requests sent before a
+    decrease cannot decrease the limit again. A Retry-After pauses every request until it
+    has passed. Each change of the limit and each pause is recorded as a flow_control span.
+    """
+
+    def __init__(
+        self,
+        rate: float = None,
+        burst: int = None,
+        initial_limit: int = None,
+        max_limit: int = None,
+        min_limit: int = 1,
+        latency_tolerance: float = None,
+        decrease_factor: float = 0.5,
+    ):
+        self.rate = (config.HTTP_RATE_LIMIT if rate is None else rate) or None
+        self.burst = burst or config.HTTP_RATE_BURST
+        self.max_limit = max_limit or config.HTTP_MAX_CONCURRENCY
+        self.min_limit = min_limit
+        self.limit = float(min(max(initial_limit or config.HTTP_INITIAL_CONCURRENCY, min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance or config.HTTP_LATENCY_TOLERANCE
+        self.decrease_factor = decrease_factor
+
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease_at = 0.0
+        # Endpoint -> [short term, long term] moving average of its latency in seconds
+        self.latencies = {}
+        self.decisions = {"increase": 0, "decrease": 0, "pause": 0}
+
+    def refill_tokens(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def acquire(self, endpoint: str) -> FlowSlot:
+        """Waits until a request to endpoint may be sent: no pause, a free slot and a rate token."""
+        start_time = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                    continue
+                if self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                    continue
+                if self.rate is not None:
+                    self.refill_tokens(now)
+                    if self.tokens < 1:
+                        self.condition.wait((1 - self.tokens) / self.rate)
+                        continue
+                    self.tokens -= 1
+                self.in_flight += 1
+                return FlowSlot(endpoint, int(self.limit), now - start_time, self.in_flight * 2 >= int(self.limit))
+
+    def release(self, slot: FlowSlot, status_code: int = None, retry_after_seconds: float = None):
+        """
+        Frees the slot of an answered request (status_code None when it failed without a
+        response) and adapts the limit to how it went.
+        """
+        now = time.monotonic()
+        latency = now - slot.started_at
+        decisions = []
+        with self.condition:
+            self.in_flight -= 1
+            if retry_after_seconds:
+                self.paused_until = max(self.paused_until, now + retry_after_seconds)
+                decisions.append(("pause", f"Retry-After {retry_after_seconds:g}s"))
+
+            if status_code is None or status_code in OVERLOAD_STATUS_CODES:
+                reason = f"HTTP {status_code}" if status_code is not None else "no response"
+                decisions.append(self.decrease(slot, now, reason))
+            elif status_code < 500:
+                short_latency, long_latency = self.update_latency(slot.endpoint, latency)
+                if short_latency > max(long_latency * self.latency_tolerance, long_latency + MIN_LATENCY_RISE_SECONDS):
+                    decisions.append(self.decrease(slot, now, f"latency {short_latency:.3f}s > {self.latency_tolerance:g}x {long_latency:.3f}s"))
+                elif slot.saturated and self.limit < self.max_limit:
+                    previous_limit = int(self.limit)
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    if int(self.limit) > previous_limit:
+                        decisions.append(("increase", "saturated"))
+
+            decisions = [decision for decision in decisions if decision is not None]
+            for decision, _ in decisions:
+                self.decisions[decision] += 1
+            limit = int(self.limit)
+            self.condition.notify_all()
+
+        for decision, reason in decisions:
+            with span("flow_control", status=decision, reason=reason, limit=limit, endpoint=slot.endpoint):
+                pass
+            if decision != "increase":
+                logger.info(f"Flow control {decision} ({reason}), {limit} requests in flight at most")
+
+    def decrease(self, slot: FlowSlot, now: float, reason: str):
+        # Requests sent before the last decrease were sent under the previous limit
+        if slot.started_at < self.last_decrease_at:
+            return None
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.last_decrease_at = now
+        return "decrease", reason
+
+    def update_latency(self, endpoint: str, latency: float) -> list:
+        averages = self.latencies.get(endpoint)
+        if averages is None:
+            averages = self.latencies[endpoint] = [latency, latency]
+        else:
+            averages[0] += SHORT_LATENCY_WEIGHT * (latency - averages[0])
+            averages[1] += LONG_LATENCY_WEIGHT * (latency - averages[1])
+        return averages
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "rate": self.rate,
+                "decisions": dict(self.decisions),
+            }
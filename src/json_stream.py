@@ -0,0 +1,199 @@
+import gzip
+import json
+import os
+import re
+import textwrap
+from pathlib import Path
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+WHITESPACE_PATTERN = re.compile(r"[ \t\n\r]*")
+
+COMPACT_SEPARATORS = (",", ":")
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_COMPRESS_LEVEL = 4
+
+
+def is_gzip_file(file_path) -> bool:
+    with open(file_path, "rb") as file:
+        return file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def open_json_file(file_path, mode: str = "r", compress: bool = False):
+    """
+    Opens a JSON file in text mode. Reading detects gzip-compressed files by their magic
+    bytes, whatever their name, so compressed and plain files are read the same way.
+    Writing compresses with compress.
+    """
+    if "r" in mode:
+        compress = is_gzip_file(file_path)
+    if compress:
+        return gzip.open(file_path, f"{mode}t", encoding="utf-8", compresslevel=GZIP_COMPRESS_LEVEL)
+    return open(file_path, mode, encoding="utf-8")
+
+
+class JsonArrayStream:
+    """
+    Streams the items of a JSON array one at a time without loading the file.
+
+    With key=None the file must hold a top-level array. Otherwise it must hold a
+    top-level object and the array stored under `key` is streamed (e.g. the "segments"
+    of a segment payload); the object's other fields are collected in `header`.
+    Fields written before the array are available as soon as the stream is opened,
+    fields written after it once the array has been read to the end.
+    Only the current item and one read chunk are kept in memory.
+    """
+
+    def __init__(self, file_path, key: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.file_path = file_path
+        self.key = key
+        self.chunk_size = chunk_size
+        self.header = {}
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.file = open_json_file(file_path)
+        try:
+            if key is not None:
+                self._read_header_until_key()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.position += 1
+        else:
+            while True:
+                yield self._decode_value()
+                separator = self._peek()
+                self.position += 1
+                if separator == "]":
+                    break
+                if separator != ",":
+                    raise self._error("Expected ',' or ']'")
+        if self.key is not None:
+            self._read_header_after_key()
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"{message} in {self.file_path}")
+
+    def _read_more(self, size: int) -> bool:
+        chunk = self.file.read(max(size, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skips whitespace and returns the next character, or "" at the end of the file."""
+        while True:
+            self.position = WHITESPACE_PATTERN.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read_more(self.chunk_size):
+                return ""
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise self._error(f"Expected '{char}'")
+        self.position += 1
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A value ending at the end of the buffer may be a number cut by the chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # The value is cut by the end of the buffer, read at least as much again
+            self._read_more(len(self.buffer) - self.position)
+
+    def _read_header_field(self):
+        field = self._decode_value()
+        if not isinstance(field, str):
+            raise self._error("Expected an object key")
+        self._expect(":")
+        return field
+
+    def _read_header_until_key(self):
+        self._expect("{")
+        if self._peek() == "}":
+            raise self._error(f"Key '{self.key}' not found")
+        while True:
+            field = self._read_header_field()
+            if field == self.key:
+                return
+            self.header[field] = self._decode_value()
+            if self._peek() != ",":
+                raise self._error(f"Key '{self.key}' not found")
+            self.position += 1
+
+    def _read_header_after_key(self):
+        while self._peek() == ",":
+            self.position += 1
+            field = self._read_header_field()
+            self.header[field] = self._decode_value()
+        self._expect("}")
+
+
+def iter_json_array(file_path, key: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yields the items of the array in file_path (or of its top-level `key`) one at a time."""
+    with JsonArrayStream(file_path, key=key, chunk_size=chunk_size) as stream:
+        yield from stream
+
+
+class JsonArrayWriter:
+    """
+    Writes a JSON array item by item, with the same layout as json.dump(items, indent=indent)
+    (without any whitespace when indent is None), gzip-compressed with compress. The array is written to a temporary file that replaces
+    file_path only once it is complete, so an interrupted run never leaves a truncated file behind.
+    """
+
+    def __init__(self, file_path, indent: int = 4, compress: bool = False):
+        self.file_path = Path(file_path)
+        self.indent = indent
+        self.compress = compress
+        self.temp_path = self.file_path.with_name(f"{self.file_path.name}.{os.getpid()}.tmp")
+        self.count = 0
+        self.file = None
+
+    def __enter__(self):
+        self.file = open_json_file(self.temp_path, "w", compress=self.compress)
+        self.file.write("[")
+        return self
+
+    def write(self, item):
+        if self.indent is None:
+            self.file.write(("," if self.count else "") + json.dumps(item, ensure_ascii=False, separators=COMPACT_SEPARATORS))
+        else:
+            serialized = json.dumps(item, ensure_ascii=False, indent=self.indent)
+            self.file.write(("," if self.count else "") + "\n" + textwrap.indent(serialized, " " * self.indent))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.file.close()
+            os.remove(self.temp_path)
+            return
+        self.file.write("\n]" if self.count and self.indent is not None else "]")
+        self.file.close()
+        os.replace(self.temp_path, self.file_path)
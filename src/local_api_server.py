@@ -0,0 +1,322 @@
+import argparse
+import base64
+import gzip
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# Ensure project root is on sys.path so we can import config
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SERVER_ERROR_STATUS_CODES = (500, 502, 503, 504)
+
+
+def make_unsigned_jwt(claims: dict) -> str:
+    """A JWT with the given claims and no signature, enough for token_provider.decode_jwt_expiry."""
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).rstrip(b"=").decode("ascii")
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}."
+
+
+class LocalAPIServer:
+    """
+    Local stand-in for the webuddhist API, for load testing the uploaders without
+    touching production. It serves the auth, segments, TOC, mappings, groups and texts
+    endpoints of config.Config with responses shaped like the real ones (generated
+    UUID ids) and can add latency, cap throughput and inject 429 and 5xx responses.
+
+    Every request waits latency_seconds (+ up to latency_jitter_seconds) plus the time its
+    body takes through one link of bytes_per_second shared by all requests, so concurrent
+    bodies queue behind each other. With max_in_flight, a request other than login arriving
+    while max_in_flight others are being handled is answered with overload_status_code
+    (429 with Retry-After, or 503). Requests other than login then fail with a 429 (with
+    Retry-After) with probability rate_limit_rate, or with a random 5xx with probability
+    server_error_rate.
+    Gzip-compressed bodies (Content-Encoding: gzip) are decompressed, or answered with
+    415 when accept_gzip is off; throughput and received bytes count the compressed size.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_seconds: float = 0.0,
+        latency_jitter_seconds: float = 0.0,
+        bytes_per_second: float = None,
+        rate_limit_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        retry_after_seconds: int = 1,
+        token_lifetime_seconds: int = 3600,
+        seed: int = None,
+        accept_gzip: bool = True,
+        max_in_flight: int = None,
+        overload_status_code: int = 503,
+    ):
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.bytes_per_second = bytes_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.token_lifetime_seconds = token_lifetime_seconds
+        self.accept_gzip = accept_gzip
+        self.max_in_flight = max_in_flight
+        self.overload_status_code = overload_status_code
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests_by_endpoint = Counter()
+        self.responses_by_status = Counter()
+        self.received_bytes = 0
+        # When the shared link is done with the bodies already received
+        self.transfer_free_at = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        self.routes = {
+            config.AUTH_ENDPOINT: self.login,
+            config.SEGMENTS_ENDPOINT: self.create_segments,
+            config.TOC_ENDPOINT: self.create_toc,
+            config.MAPPINGS_ENDPOINT: self.create_mappings,
+            config.GROUPS_ENDPOINT: self.create_group,
+            config.TEXTS_ENDPOINT: self.create_text,
+        }
+
+        self.http_server = ThreadingHTTPServer((host, port), LocalAPIRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.api = self
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.http_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.http_server.serve_forever, kwargs={"poll_interval": 0.05}, name="local-api-server", daemon=True
+        )
+        self.thread.start()
+        logger.info(f"Local API server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_delay_seconds(self, body_bytes: int) -> float:
+        with self.lock:
+            delay = self.latency_seconds + self.random.uniform(0, self.latency_jitter_seconds)
+            if self.bytes_per_second:
+                # The body is transferred once the bodies before it are
+                now = time.monotonic()
+                self.transfer_free_at = max(now, self.transfer_free_at) + body_bytes / self.bytes_per_second
+                delay += self.transfer_free_at - now
+        return delay
+
+    def admit(self) -> bool:
+        """Counts a request in flight, False (and not counted) when max_in_flight are already."""
+        with self.lock:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def finish(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def choose_fault(self):
+        """Returns the status code of an injected failure, or None."""
+        with self.lock:
+            draw = self.random.random()
+            if draw < self.rate_limit_rate:
+                return 429
+            if draw < self.rate_limit_rate + self.server_error_rate:
+                return self.random.choice(SERVER_ERROR_STATUS_CODES)
+        return None
+
+    def record(self, endpoint: str, status_code: int, body_bytes: int):
+        with self.lock:
+            self.requests_by_endpoint[endpoint] += 1
+            self.responses_by_status[status_code] += 1
+            self.received_bytes += body_bytes
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": sum(self.requests_by_endpoint.values()),
+                "received_bytes": self.received_bytes,
+                "requests_by_endpoint": dict(self.requests_by_endpoint),
+                "responses_by_status": {str(status_code): count for status_code, count in sorted(self.responses_by_status.items())},
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+    def login(self, payload):
+        if not isinstance(payload, dict) or not payload.get("email") or not payload.get("password"):
+            return 401, {"detail": "Invalid email or password"}
+        access_token = make_unsigned_jwt({"sub": payload["email"], "exp": int(time.time()) + self.token_lifetime_seconds})
+        return 200, {"auth": {"access_token": access_token, "token_type": "Bearer"}}
+
+    def create_segments(self, payload):
+        if not isinstance(payload, dict) or "text_id" not in payload or not isinstance(payload.get("segments"), list):
+            return 422, {"detail": "text_id and segments are required"}
+        return 201, {
+            "text_id": payload["text_id"],
+            "segments": [{"id": str(uuid.uuid4()), **segment} for segment in payload["segments"]],
+            "status": "success",
+        }
+
+    def create_toc(self, payload):
+        if not isinstance(payload, dict) or "text_id" not in payload or not isinstance(payload.get("sections"), list):
+            return 422, {"detail": "text_id and sections are required"}
+        return 201, {"id": str(uuid.uuid4()), **payload}
+
+    def create_mappings(self, payload):
+        if not isinstance(payload, dict) or not isinstance(payload.get("text_mappings"), list):
+            return 422, {"detail": "text_mappings is required"}
+        return 201, {"message": "Mappings created successfully", "text_mappings": len(payload["text_mappings"])}
+
+    def create_group(self, payload):
+        if not isinstance(payload, dict) or not payload.get("type"):
+            return 422, {"detail": "type is required"}
+        return 201, {"id": str(uuid.uuid4()), "type": payload["type"]}
+
+    def create_text(self, payload):
+        if not isinstance(payload, dict) or not payload.get("title"):
+            return 422, {"detail": "title is required"}
+        return 201, {"id": str(uuid.uuid4()), **payload}
+
+
+class LocalAPIRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the pooled client reuses its connections like against the real API
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, status_code: int, data, headers: dict = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        api = self.server.api
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        endpoint = urlsplit(self.path).path
+        status_code, data, headers = self.handle_api_request(api, endpoint, body)
+        api.record(endpoint, status_code, len(body))
+        self.send_json(status_code, data, headers)
+
+    def handle_api_request(self, api: LocalAPIServer, endpoint: str, body: bytes):
+        route = api.routes.get(endpoint)
+        if route is None:
+            return 404, {"detail": "Not Found"}, None
+        if endpoint == config.AUTH_ENDPOINT:
+            return self.handle_admitted_request(api, endpoint, body, route)
+
+        if not api.admit():
+            if api.overload_status_code == 429:
+                return 429, {"detail": "Too Many Requests"}, {"Retry-After": str(api.retry_after_seconds)}
+            return api.overload_status_code, {"detail": "Server overloaded"}, None
+        try:
+            return self.handle_admitted_request(api, endpoint, body, route)
+        finally:
+            api.finish()
+
+    def handle_admitted_request(self, api: LocalAPIServer, endpoint: str, body: bytes, route):
+        time.sleep(api.get_delay_seconds(len(body)))
+
+        if endpoint != config.AUTH_ENDPOINT:
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return 401, {"detail": "Not authenticated"}, None
+            fault_status_code = api.choose_fault()
+            if fault_status_code == 429:
+                return 429, {"detail": "Too Many Requests"}, {"Retry-After": str(api.retry_after_seconds)}
+            if fault_status_code is not None:
+                return fault_status_code, {"detail": "Injected server error"}, None
+
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            if not api.accept_gzip:
+                return 415, {"detail": "Unsupported Content-Encoding gzip"}, None
+            try:
+                body = gzip.decompress(body)
+            except OSError:
+                return 400, {"detail": "Invalid gzip body"}, None
+
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            return 422, {"detail": "Invalid JSON body"}, None
+        status_code, data = route(payload)
+        return status_code, data, None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the webuddhist API")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--bytes-per-second", type=float, default=None, help="Request body throughput cap")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with a 5xx")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Requests handled at once, more are answered with --overload-status")
+    parser.add_argument("--overload-status", type=int, choices=[429, 503], default=503, help="Status of requests over --max-in-flight")
+    parser.add_argument("--no-gzip", action="store_true", help="Answer gzip-compressed request bodies with 415")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency jitter and fault injection")
+    args = parser.parse_args()
+
+    server = LocalAPIServer(
+        host=args.host,
+        port=args.port,
+        latency_seconds=args.latency,
+        latency_jitter_seconds=args.latency_jitter,
+        bytes_per_second=args.bytes_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        retry_after_seconds=args.retry_after,
+        seed=args.seed,
+        accept_gzip=not args.no_gzip,
+        max_in_flight=args.max_in_flight,
+        overload_status_code=args.overload_status,
+    )
+    print(f"Serving the webuddhist API stand-in on {server.url}")
+    print(f"Point the uploaders at it with: export WEBUDDHIST_API_BASE_URL={server.url}")
+    try:
+        server.http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.http_server.server_close()
+        print(json.dumps(server.get_stats(), indent=4))
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import uuid
+from pathlib import Path
+
+# Ensure project root is on sys.path so we can import config and utils
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from canonical_text import canonicalize
+from utils import read_json_file
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_STORE_SUFFIX = ".lookup"
+LOOKUP_STORE_MAGIC = b"WBLK"
+# Bump when the layout or canonical_text.canonicalize changes, stored hashes depend on it
+LOOKUP_STORE_VERSION = 1
+
+HEADER = struct.Struct("<4sIII")  # magic, version, segment count, reserved
+OFFSET = struct.Struct("<Q")
+INDEX = struct.Struct("<I")
+ID_SIZE = 16
+HASH_SIZE = 8
+HASH_ENTRY_SIZE = HASH_SIZE + INDEX.size
+ID_ENTRY_SIZE = ID_SIZE + INDEX.size
+
+
+def get_content_hash(segment_content: str) -> bytes:
+    """8 byte hash of the canonical form of a segment content."""
+    return hashlib.blake2b(canonicalize(segment_content).encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+
+def get_lookup_store_path(look_up_json_path) -> Path:
+    return Path(look_up_json_path).with_suffix(LOOKUP_STORE_SUFFIX)
+
+
+def write_lookup_store(look_up_list, lookup_store_path):
+    """
+    Writes a segment_content -> id look up list in the binary lookup format:
+
+        header | ids (16 byte UUIDs) | content offsets (count + 1) | content hashes
+               | (hash, index) table sorted by hash | (id, index) table sorted by id
+               | UTF-8 content blob
+    """
+    count = len(look_up_list)
+    try:
+        ids = [uuid.UUID(look_up["id"]).bytes for look_up in look_up_list]
+    except ValueError as e:
+        raise ValueError(f"Segment ids must be UUIDs to be stored in a lookup store: {e}")
+    contents = [look_up["segment_content"].encode("utf-8") for look_up in look_up_list]
+    hashes = [get_content_hash(look_up["segment_content"]) for look_up in look_up_list]
+
+    offsets = [0]
+    for content in contents:
+        offsets.append(offsets[-1] + len(content))
+
+    lookup_store_path = Path(lookup_store_path)
+    temp_path = lookup_store_path.with_name(f"{lookup_store_path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(LOOKUP_STORE_MAGIC, LOOKUP_STORE_VERSION, count, 0))
+        file.write(b"".join(ids))
+        file.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+        file.write(b"".join(hashes))
+        file.write(b"".join(content_hash + INDEX.pack(index) for content_hash, index in sorted(zip(hashes, range(count)))))
+        file.write(b"".join(segment_id + INDEX.pack(index) for segment_id, index in sorted(zip(ids, range(count)))))
+        file.write(b"".join(contents))
+    os.replace(temp_path, lookup_store_path)
+
+
+def convert_look_up_json(look_up_json_path, lookup_store_path=None) -> Path:
+    """Converts a *_segment_content_with_segment_id.json file, by default to a .lookup file next to it."""
+    lookup_store_path = Path(lookup_store_path or get_lookup_store_path(look_up_json_path))
+    write_lookup_store(read_json_file(str(look_up_json_path)), lookup_store_path)
+    return lookup_store_path
+
+
+class LookupStore:
+    """
+    Read-only, memory-mapped segment_content -> id look up list.
+
+    Opening a store only maps the file and reads its header, so it costs the same for
+    any text size. It behaves like the JSON look up list (len, iteration and
+    store[index] returning {"segment_content": ..., "id": ...}) and adds lookups by id
+    and by canonical content hash (binary search over the sorted tables, no parsing).
+    """
+
+    def __init__(self, lookup_store_path):
+        self.lookup_store_path = Path(lookup_store_path)
+        with open(self.lookup_store_path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, _ = HEADER.unpack_from(self.mmap, 0)
+        if magic != LOOKUP_STORE_MAGIC:
+            self.close()
+            raise ValueError(f"{lookup_store_path} is not a lookup store")
+        if version != LOOKUP_STORE_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported lookup store version {version} in {lookup_store_path}, convert it again")
+
+        self.count = count
+        self.ids_offset = HEADER.size
+        self.offsets_offset = self.ids_offset + ID_SIZE * count
+        self.hashes_offset = self.offsets_offset + OFFSET.size * (count + 1)
+        self.hash_table_offset = self.hashes_offset + HASH_SIZE * count
+        self.id_table_offset = self.hash_table_offset + HASH_ENTRY_SIZE * count
+        self.blob_offset = self.id_table_offset + ID_ENTRY_SIZE * count
+
+    def close(self):
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[item_index] for item_index in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("lookup store index out of range")
+        return {"segment_content": self.get_content(index), "id": self.get_id(index)}
+
+    def get_id(self, index: int) -> str:
+        start = self.ids_offset + ID_SIZE * index
+        return str(uuid.UUID(bytes=self.mmap[start:start + ID_SIZE]))
+
+    def get_content(self, index: int) -> str:
+        start, = OFFSET.unpack_from(self.mmap, self.offsets_offset + OFFSET.size * index)
+        end, = OFFSET.unpack_from(self.mmap, self.offsets_offset + OFFSET.size * (index + 1))
+        return self.mmap[self.blob_offset + start:self.blob_offset + end].decode("utf-8")
+
+    def get_hash(self, index: int) -> bytes:
+        start = self.hashes_offset + HASH_SIZE * index
+        return self.mmap[start:start + HASH_SIZE]
+
+    def _find_in_table(self, table_offset: int, entry_size: int, key: bytes) -> list:
+        """Indices stored under key in a sorted (key, index) table, in index order."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = table_offset + entry_size * middle
+            if self.mmap[start:start + len(key)] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        indices = []
+        for position in range(low, self.count):
+            start = table_offset + entry_size * position
+            if self.mmap[start:start + len(key)] != key:
+                break
+            indices.append(INDEX.unpack_from(self.mmap, start + len(key))[0])
+        return indices
+
+    def index_of_id(self, segment_id: str) -> int:
+        indices = self._find_in_table(self.id_table_offset, ID_ENTRY_SIZE, uuid.UUID(segment_id).bytes)
+        if not indices:
+            raise KeyError(segment_id)
+        return indices[0]
+
+    def positions_of_content(self, segment_content: str) -> list:
+        """Sorted indices of the segments whose canonical content equals that of segment_content."""
+        canonical_content = canonicalize(segment_content)
+        return [
+            index
+            for index in self._find_in_table(self.hash_table_offset, HASH_ENTRY_SIZE, get_content_hash(segment_content))
+            if canonicalize(self.get_content(index)) == canonical_content
+        ]
+
+
+def open_lookup_store(look_up_json_path):
+    """
+    Returns the LookupStore converted from look_up_json_path, or None when there is no
+    .lookup file next to it or the JSON file has changed since it was converted.
+    """
+    lookup_store_path = get_lookup_store_path(look_up_json_path)
+    if not lookup_store_path.exists():
+        return None
+    json_path = Path(look_up_json_path)
+    if json_path.exists() and json_path.stat().st_mtime > lookup_store_path.stat().st_mtime:
+        logger.warning(f"{lookup_store_path} is older than {json_path}, using the JSON file")
+        return None
+    logger.info(f"Using lookup store {lookup_store_path}")
+    return LookupStore(lookup_store_path)
+
+
+def get_default_look_up_json_files():
+    src_dir = Path(project_root) / "src"
+    return sorted(src_dir.glob("**/*_segment_content_with_segment_id.json"))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Convert segment content with segment id JSON files to memory-mapped lookup stores")
+    parser.add_argument("files", nargs="*", help="Look up JSON files (defaults to every *_segment_content_with_segment_id.json under src/)")
+    args = parser.parse_args()
+
+    for look_up_json_path in args.files or get_default_look_up_json_files():
+        lookup_store_path = convert_look_up_json(look_up_json_path)
+        logger.info(
+            f"{look_up_json_path} ({Path(look_up_json_path).stat().st_size} bytes) -> "
+            f"{lookup_store_path} ({lookup_store_path.stat().st_size} bytes)"
+        )
@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List
+
+from canonical_text import canonicalize
+from metrics import span
+from utils import FuzzyMatcher, fuzzy_substring_match, get_json_hash, read_json_file, write_json_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FUZZY_BAND = 20
+
+# Joins the mapping cells so an exact search can never match across two rows
+CELL_SEPARATOR = "\x00"
+
+# Part of the root alignment plan key, bump it when the plan format or the matching changes
+ROOT_ALIGNMENT_PLAN_VERSION = 1
+
+
+class RootAlignmentPlan:
+    """
+    Where every root_display_text of a mapping_data lies in the root look up list, found in
+    one monotonic fuzzy scan: for each mapping row with root text, the index of the first
+    matching root segment at or after the previous match, its id and the match score.
+    If a row has no match the scan stops there and the row is kept as missing_row.
+
+    The plan only depends on the root texts, the root look up list and the threshold, so it
+    is saved under a hash of them and a re-run with the same inputs loads it instead of
+    scanning again.
+    """
+
+    def __init__(self, key: str, rows: List[dict], missing_row: int = None):
+        self.key = key
+        self.rows = rows
+        self.missing_row = missing_row
+
+    @staticmethod
+    def get_key(mapping_data, look_up_list_root, threshold: float) -> str:
+        return get_json_hash({
+            "version": ROOT_ALIGNMENT_PLAN_VERSION,
+            "threshold": threshold,
+            "root_display_texts": [row["root_display_text"] for row in mapping_data],
+            "look_up_list_root": [[look_up["segment_content"], look_up["id"]] for look_up in look_up_list_root],
+        })
+
+    @classmethod
+    def build(cls, mapping_data, look_up_list_root, threshold: float = 0.95, key: str = None):
+        key = key or cls.get_key(mapping_data, look_up_list_root, threshold)
+        root_matcher = FuzzyMatcher(look_up_list_root, threshold=threshold, key=itemgetter("segment_content"))
+        rows = []
+        missing_row = None
+        last_found = 0
+        with span("root_alignment_build", items=len(mapping_data)) as build_span:
+            for row_index, mapping in enumerate(mapping_data):
+                if not mapping["root_display_text"]:
+                    continue
+                root_index = root_matcher.find(mapping["root_display_text"], start=last_found)
+                if root_index is None:
+                    missing_row = row_index
+                    break
+                rows.append({
+                    "row": row_index,
+                    "root_index": root_index,
+                    "root_id": look_up_list_root[root_index]["id"],
+                    "score": round(root_matcher.last_score, 6),
+                })
+                last_found = root_index + 1
+            build_span.set(fuzzy_comparisons=root_matcher.comparisons)
+        return cls(key, rows, missing_row)
+
+    def get_root_ids(self) -> Dict[int, str]:
+        """Mapping row index -> matched root segment id."""
+        return {row["row"]: row["root_id"] for row in self.rows}
+
+    def to_dict(self) -> dict:
+        return {"version": ROOT_ALIGNMENT_PLAN_VERSION, "key": self.key, "rows": self.rows, "missing_row": self.missing_row}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["key"], data["rows"], data["missing_row"])
+
+
+def get_root_alignment_plan(mapping_data, look_up_list_root, threshold: float = 0.95, plan_dir=None) -> RootAlignmentPlan:
+    """
+    Returns the RootAlignmentPlan of mapping_data, loaded from plan_dir when a plan with
+    the same inputs was saved there, otherwise built (and saved when plan_dir is set).
+    A saved plan that cannot be read is built again and overwritten.
+    """
+    key = RootAlignmentPlan.get_key(mapping_data, look_up_list_root, threshold)
+    plan_path = Path(plan_dir) / f"{key}.json" if plan_dir else None
+    if plan_path is not None and plan_path.exists():
+        try:
+            plan = RootAlignmentPlan.from_dict(read_json_file(plan_path))
+            logger.info(f"Using root alignment plan {plan_path}")
+            return plan
+        except (ValueError, KeyError, TypeError, EOFError, OSError) as error:
+            logger.warning(f"Rebuilding unreadable root alignment plan {plan_path}: {error!r}")
+
+    plan = RootAlignmentPlan.build(mapping_data, look_up_list_root, threshold=threshold, key=key)
+    if plan_path is not None:
+        plan_path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and moved in place, so a concurrent reader never sees a partial plan
+        temp_path = plan_path.with_name(f"{plan_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        write_json_file(plan.to_dict(), temp_path)
+        os.replace(temp_path, plan_path)
+    return plan
+
+
+class CommentaryAligner:
+    """
+    Aligns commentary lookup segments to the rows of a mapping_data commentary column
+    in one monotonic pass.
+
+    The column cells are canonicalized and concatenated once and every canonical segment
+    is located with an exact search starting at the end of the previous segment, so the
+    work grows with the size of the corpus instead of (segments x rows). From the row holding the occurrence the
+    segment's run is extended over the following rows exactly like the fuzzy scan did:
+    rows with an empty root_display_text are skipped, a row matches if it contains the
+    segment (or fuzzy_substring_match accepts it) and the run stops at the first row
+    that does not match. Segments without an exact occurrence (e.g. spanning two cells
+    or with small textual differences) fall back to fuzzy_substring_match over a band
+    of fuzzy_band rows after the current position.
+    """
+
+    def __init__(self, mapping_data, commentary_column: str, fuzzy_band: int = DEFAULT_FUZZY_BAND, threshold: float = 0.95):
+        self.mapping_data = mapping_data
+        self.commentary_column = commentary_column
+        self.fuzzy_band = fuzzy_band
+        self.threshold = threshold
+
+        with span("alignment_canonicalize", items=len(mapping_data)):
+            self.cells = [canonicalize(row.get(commentary_column) or "") for row in mapping_data]
+        self.row_starts = []
+        offset = 0
+        for cell in self.cells:
+            self.row_starts.append(offset)
+            offset += len(cell) + len(CELL_SEPARATOR)
+        self.column_text = CELL_SEPARATOR.join(self.cells)
+        # The fuzzy band only scores rows with root text, as one block per FuzzyMatcher call
+        self.root_rows = [row_index for row_index in range(len(mapping_data)) if self.has_root(row_index)]
+        self.root_cell_matcher = FuzzyMatcher([self.cells[row_index] for row_index in self.root_rows], threshold=threshold)
+
+        self.exact_anchors = 0
+        self.fuzzy_anchors = 0
+        self.fuzzy_comparisons = 0
+        # Ids of the commentary segments the last align() found no mapping row for
+        self.unaligned_ids = []
+
+    def has_root(self, row_index: int) -> bool:
+        return bool(self.mapping_data[row_index]["root_display_text"])
+
+    def row_matches(self, segment_content: str, row_index: int) -> bool:
+        cell = self.cells[row_index]
+        if segment_content in cell:
+            return True
+        self.fuzzy_comparisons += 1
+        return fuzzy_substring_match(segment_content, cell, threshold=self.threshold)
+
+    def get_row_of_offset(self, offset: int) -> int:
+        return bisect_right(self.row_starts, offset) - 1
+
+    def find_anchor_row(self, segment_content: str, cursor: int):
+        """Returns (first matching row, new cursor) or (None, cursor) if the segment is not found."""
+        position = self.column_text.find(segment_content, cursor)
+        if position != -1:
+            self.exact_anchors += 1
+            row_index = self.get_row_of_offset(position)
+            new_cursor = position + len(segment_content)
+            if self.has_root(row_index):
+                return row_index, new_cursor
+            # The occurrence is in a row without root text, which the mapping never uses
+            for next_row_index in range(row_index + 1, len(self.mapping_data)):
+                if self.has_root(next_row_index):
+                    if self.row_matches(segment_content, next_row_index):
+                        return next_row_index, new_cursor
+                    break
+            return None, new_cursor
+
+        start_row_index = self.get_row_of_offset(cursor)
+        end_row_index = len(self.mapping_data)
+        if self.fuzzy_band is not None:
+            end_row_index = min(end_row_index, start_row_index + self.fuzzy_band)
+        comparisons = self.root_cell_matcher.comparisons
+        root_row_position = self.root_cell_matcher.find_substring(
+            segment_content,
+            start=bisect_left(self.root_rows, start_row_index),
+            end=bisect_left(self.root_rows, end_row_index),
+        )
+        self.fuzzy_comparisons += self.root_cell_matcher.comparisons - comparisons
+        if root_row_position is not None:
+            row_index = self.root_rows[root_row_position]
+            self.fuzzy_anchors += 1
+            return row_index, max(cursor, self.row_starts[row_index])
+        return None, cursor
+
+    def get_run(self, segment_content: str, anchor_row_index: int) -> List[int]:
+        """Rows mapped to a segment: the anchor row and the following rows that still match."""
+        rows = [anchor_row_index]
+        for row_index in range(anchor_row_index + 1, len(self.mapping_data)):
+            if not self.has_root(row_index):
+                continue
+            if not self.row_matches(segment_content, row_index):
+                break
+            rows.append(row_index)
+        return rows
+
+    def align(self, look_up_list_commentary) -> List[tuple]:
+        """
+        Returns (commentary segment id, [row indices]) for every aligned segment, in order.
+        The ids of the segments without a mapping row are logged and kept in unaligned_ids.
+        """
+        alignment = []
+        self.unaligned_ids = []
+        cursor = 0
+        with span("alignment_align", items=len(look_up_list_commentary)) as align_span:
+            for commentary_text in look_up_list_commentary:
+                segment_content = canonicalize(commentary_text["segment_content"])
+                if not segment_content:
+                    continue
+
+                anchor_row_index, cursor = self.find_anchor_row(segment_content, cursor)
+                if anchor_row_index is None:
+                    logger.warning(f"Commentary segment {commentary_text['id']} not found in {self.commentary_column}, it is not mapped")
+                    self.unaligned_ids.append(commentary_text["id"])
+                    continue
+                alignment.append((commentary_text["id"], self.get_run(segment_content, anchor_row_index)))
+            align_span.set(
+                unaligned=len(self.unaligned_ids),
+                unaligned_ids=self.unaligned_ids,
+                fuzzy_comparisons=self.fuzzy_comparisons,
+            )
+
+        logger.info(
+            f"Aligned {len(alignment)} commentary segments ({len(self.unaligned_ids)} without a mapping row): "
+            f"{self.exact_anchors} exact anchors, {self.fuzzy_anchors} fuzzy anchors, "
+            f"{self.fuzzy_comparisons} fuzzy comparisons"
+        )
+        return alignment
+
+    def get_commentary_and_root_mapping_dict(self, look_up_list_commentary, root_ids: Dict[int, str] = None) -> Dict[str, List[str]]:
+        """
+        Commentary segment id -> root segment ids of its rows. The root ids come from root_ids
+        (see RootAlignmentPlan.get_root_ids) or else from the rows' root_display_text.
+        """
+        commentary_and_root_mapping_dict: Dict[str, List[str]] = {}
+        for commentary_segment_id, row_indices in self.align(look_up_list_commentary):
+            commentary_and_root_mapping_dict.setdefault(commentary_segment_id, []).extend(
+                root_ids[row_index] if root_ids is not None else self.mapping_data[row_index]["root_display_text"]
+                for row_index in row_indices
+            )
+        return commentary_and_root_mapping_dict
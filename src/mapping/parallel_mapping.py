@@ -0,0 +1,235 @@
+import argparse
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Add project root to Python path for imports
+project_root = str(Path(__file__).resolve().parent.parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Add src directory to Python path
+src_dir = str(Path(__file__).resolve().parent.parent)
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+from config import config
+from lookup_store import open_lookup_store
+from metrics import metrics_run, span
+from utils import read_json_file
+
+from mapping.text_mapping import LOOKUP_DIR, MAPPING_PAYLOAD_DIR, CommentaryTextMapping
+
+logger = logging.getLogger(__name__)
+
+LOOK_UP_FILE_SUFFIX = "_segment_content_with_segment_id.json"
+MAPPING_DATA_FILE_SUFFIX = "_mapping_data"
+
+
+class MappingTimeoutError(TimeoutError):
+    pass
+
+
+def get_mapping_text_name(mapping_data_file_path) -> str:
+    """sherab_nyinpo.json and sherab_nyinpo_mapping_data.json both map the text sherab_nyinpo."""
+    stem = Path(mapping_data_file_path).stem
+    return stem[:-len(MAPPING_DATA_FILE_SUFFIX)] if stem.endswith(MAPPING_DATA_FILE_SUFFIX) else stem
+
+
+def get_look_up_list_file_path(text_name: str, root_or_commentary: str, look_up_dir=None) -> str:
+    """
+    The look up list of a text as the segment and corpus uploaders name it. Without a
+    look_up_dir, the root/ and commentary/ directories of the mapping lookup directory are used.
+    """
+    file_name = f"{text_name}_{root_or_commentary}{LOOK_UP_FILE_SUFFIX}"
+    if look_up_dir is not None:
+        return str(Path(look_up_dir) / file_name)
+    return str(LOOKUP_DIR / ("root" if root_or_commentary == "root" else "commentary") / file_name)
+
+
+def get_commentary_numbers(mapping_data) -> list:
+    numbers = {
+        int(column.split("_", 1)[1])
+        for row in mapping_data for column, value in row.items()
+        if column.startswith("commentary_") and value
+    }
+    return sorted(numbers)
+
+
+def read_text_ids(text_ids_file_path) -> dict:
+    """
+    Text name -> text id, from a {"<text>_root": id, "<text>_commentary_1": id} file
+    or from the pipeline_results.json written by the pipeline runner.
+    """
+    text_ids = read_json_file(str(text_ids_file_path))
+    if isinstance(text_ids.get("texts"), dict):
+        return {name: text["text_id"] for name, text in text_ids["texts"].items() if text.get("text_id")}
+    return text_ids
+
+
+def discover_mapping_jobs(paths, text_ids: dict, look_up_dir=None, output_dir=None, plan_dir=None) -> list:
+    """
+    One job per (text, commentary) pair: every mapping data file in paths is mapped for each
+    of its commentary columns holding text. Jobs are sorted by text name and commentary number.
+    The commentaries of a text share their root alignment plan through plan_dir.
+    """
+    mapping_data_files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            mapping_data_files.extend(sorted(path.glob("*.json")))
+        else:
+            mapping_data_files.append(path)
+
+    output_dir = Path(output_dir) if output_dir else MAPPING_PAYLOAD_DIR
+    plan_dir = plan_dir if plan_dir is not None else config.MAPPING_PLAN_DIR
+    jobs = []
+    for mapping_data_file in mapping_data_files:
+        text_name = get_mapping_text_name(mapping_data_file)
+        for commentary_number in get_commentary_numbers(read_json_file(str(mapping_data_file))):
+            commentary = f"commentary_{commentary_number}"
+            jobs.append({
+                "job": f"{text_name}_{commentary}",
+                "mapping_data_file_path": str(mapping_data_file),
+                "commentary_number": str(commentary_number),
+                "root_text_id": text_ids.get(f"{text_name}_root"),
+                "commentary_text_id": text_ids.get(f"{text_name}_{commentary}"),
+                "look_up_list_root_file_path": get_look_up_list_file_path(text_name, "root", look_up_dir),
+                "look_up_list_commentary_file_path": get_look_up_list_file_path(text_name, commentary, look_up_dir),
+                "mapping_payload_file_path": str(output_dir / f"{text_name}_{commentary}_mapping_payload.json"),
+                "root_alignment_plan_dir": str(plan_dir),
+            })
+
+    jobs.sort(key=lambda job: (get_mapping_text_name(job["mapping_data_file_path"]), int(job["commentary_number"])))
+    return jobs
+
+
+def open_look_up_list(look_up_list_file_path):
+    # Converted lookup stores are memory-mapped, so the workers share their pages instead of each parsing the JSON
+    look_up_store = open_lookup_store(look_up_list_file_path)
+    return look_up_store if look_up_store is not None else read_json_file(look_up_list_file_path)
+
+
+def raise_mapping_timeout(signum, frame):
+    raise MappingTimeoutError("Mapping job exceeded its time budget")
+
+
+def run_mapping_job(job: dict, time_budget: float = None) -> dict:
+    """
+    Runs in a worker process: validates the root segments, replaces them with their ids,
+    aligns the commentary and writes the mapping payload to job["mapping_payload_file_path"].
+    Only the job paths go to the worker and only a small summary comes back.
+    With time_budget (seconds) the job is interrupted once the budget is spent, though never
+    while writing the payload; the budget is enforced with SIGALRM and is therefore ignored
+    on platforms without it.
+    """
+    start_time = time.perf_counter()
+    use_alarm = bool(time_budget) and hasattr(signal, "setitimer")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, raise_mapping_timeout)
+    try:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, time_budget)
+        for id_field in ("root_text_id", "commentary_text_id"):
+            if not job[id_field]:
+                raise ValueError(f"No {id_field} for {job['job']}")
+        text_mapping = CommentaryTextMapping(
+            root_text_id=job["root_text_id"],
+            commentary_text_id=job["commentary_text_id"],
+            mapping_data_file_path=job["mapping_data_file_path"],
+            commentary_number=job["commentary_number"],
+            look_up_list_root=open_look_up_list(job["look_up_list_root_file_path"]),
+            look_up_list_commentary=open_look_up_list(job["look_up_list_commentary_file_path"]),
+            mapping_payload_file_path=job["mapping_payload_file_path"],
+            root_alignment_plan_dir=job["root_alignment_plan_dir"],
+        )
+        text_mapping.validate_mapping_root_segment_present_in_root_lookup_list()
+        text_mapping.replace_mapping_root_display_text_with_id()
+        mapping_payload = text_mapping.generate_mapping_payload()
+        if use_alarm:
+            # The payload is what the next --diff run compares against, its write is never interrupted
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        text_mapping.write_mapping_payload_to_file(mapping_payload)
+        result = {
+            "job": job["job"],
+            "status": "done",
+            "text_mappings": len(mapping_payload.text_mappings),
+            "mapping_payload_file_path": job["mapping_payload_file_path"],
+        }
+    except MappingTimeoutError:
+        result = {"job": job["job"], "status": "timeout", "error": f"Exceeded the time budget of {time_budget}s"}
+    except Exception as e:
+        result = {"job": job["job"], "status": "failed", "error": str(e)}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
+    return result
+
+
+class ParallelMapping:
+    """
+    Maps many (text, commentary) pairs on a process pool, so the fuzzy alignment of a whole
+    corpus runs on every core. Results are returned in job order whatever order the workers
+    finish in, and each payload only depends on its own inputs, so a run is deterministic.
+    """
+
+    def __init__(self, jobs, max_workers: int = None, time_budget: float = None):
+        self.jobs = jobs
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.time_budget = time_budget
+
+    def run(self) -> list:
+        start_time = time.perf_counter()
+        output_dirs = {Path(job["mapping_payload_file_path"]).parent for job in self.jobs}
+        for output_dir in output_dirs:
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+        with ProcessPoolExecutor(max_workers=min(self.max_workers, max(len(self.jobs), 1))) as executor:
+            futures = [executor.submit(run_mapping_job, job, self.time_budget) for job in self.jobs]
+            results = []
+            for job, future in zip(self.jobs, futures):
+                with span("mapping_job", job=job["job"]) as job_span:
+                    result = future.result()
+                    job_span.set(status=result["status"], items=result.get("text_mappings"), worker_seconds=result["seconds"])
+                if result["status"] == "done":
+                    logger.info(f"Mapped {result['job']} in {result['seconds']:.2f}s -> {result['mapping_payload_file_path']}")
+                else:
+                    logger.error(f"Mapping {result['job']} {result['status']}: {result['error']}")
+                results.append(result)
+
+        logger.info(
+            f"Mapped {len(self.jobs)} commentaries with {self.max_workers} worker processes in {time.perf_counter() - start_time:.2f}s"
+        )
+        return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Generate the mapping payloads of every text and commentary on a process pool")
+    parser.add_argument("paths", nargs="+", help="Mapping data directories (e.g. commentaries_and_sanskrit) or files")
+    parser.add_argument("--text-ids", required=True, help="JSON file of text name -> text id, or a pipeline_results.json")
+    parser.add_argument("--look-up-dir", default=None, help="Directory holding the *_segment_content_with_segment_id.json files (defaults to mapping/lookup/root and commentary)")
+    parser.add_argument("--output-dir", default=None, help="Directory for the mapping payloads (defaults to mapping/mapping_payload)")
+    parser.add_argument("--plan-dir", default=None, help="Directory for the root alignment plans (defaults to WEBUDDHIST_MAPPING_PLAN_DIR)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (defaults to the number of cores)")
+    parser.add_argument("--time-budget", type=float, default=None, help="Seconds a single job may run before it is stopped")
+    parser.add_argument("--metrics-path", default=None, help="JSON lines file for the timing spans (defaults to WEBUDDHIST_METRICS_PATH)")
+    args = parser.parse_args()
+
+    jobs = discover_mapping_jobs(
+        args.paths, read_text_ids(args.text_ids), look_up_dir=args.look_up_dir, output_dir=args.output_dir,
+        plan_dir=args.plan_dir,
+    )
+    with metrics_run("parallel_mapping", metrics_path=args.metrics_path):
+        results = ParallelMapping(jobs, max_workers=args.workers, time_budget=args.time_budget).run()
+        for result in results:
+            print(result)
+    if any(result["status"] != "done" for result in results):
+        sys.exit(1)
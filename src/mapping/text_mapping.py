@@ -1,6 +1,9 @@
-import json
-import requests
+import argparse
+import logging
+import os
 import sys
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add project root to Python path for imports
@@ -19,13 +22,23 @@ MAPPING_DATA_DIR = BASE_DIR / "mapping_data"
 LOOKUP_DIR = BASE_DIR / "lookup"
 MAPPING_PAYLOAD_DIR = BASE_DIR / "mapping_payload"
 
+from config import config
 from utils import (
     read_json_file,
-    fuzzy_match,
-    fuzzy_substring_match,
-    get_token
+    get_json_hash,
+    get_json_size_in_bytes,
+    get_token,
+    iter_size_capped_batches,
+    write_json_file
 )
-
+from aho_corasick import AhoCorasick
+from artifact_cache import ArtifactCache, get_default_artifact_cache, get_look_up_list_key
+from lookup_store import open_lookup_store
+from metrics import metrics_run, span
+from upload_journal import UploadJournal, get_journal_path
+from webuddhist_client import WebBuddhistClient, check_response, get_default_client
+
+from mapping.alignment import DEFAULT_FUZZY_BAND, CELL_SEPARATOR, CommentaryAligner, RootAlignmentPlan, get_root_alignment_plan
 from mapping.mapping_models import (
     Mapping,
     TextMapping,
@@ -34,125 +47,190 @@ from mapping.mapping_models import (
 
 from typing import List
 
-class CommentaryTextMapping:
-
-    def __init__(self, mapping_upload_url: str = "https://api.webuddhist.com/api/v1/mappings"):
-        self.mapping_upload_url = mapping_upload_url
+logger = logging.getLogger(__name__)
 
-        self.root_text_id = input("Enter the root text id: ")
-        self.commentary_text_id = input("Enter the commentary text id: ")
-
-        self.mapping_file_name = input("Enter the mapping file name: ")
-        self.mapping_file_name_path = str(MAPPING_DATA_DIR / f"{self.mapping_file_name}.json")
-        self.mapping_data = read_json_file(self.mapping_file_name_path)
+# Part of the cache key of mapping payloads, bump it when the commentary alignment changes
+MAPPING_PAYLOAD_VERSION = 1
 
-        self.commentary_number = input("Enter the commentary number: ")
-        
-        self.look_up_list_file_name_root = input("Enter the look up list file name for root: ")
-        self.look_up_list_file_name_commentary = input("Enter the look up list file name for commentary: ")
-        
-        self.look_up_list_file_name_root_path = str(LOOKUP_DIR / "root" / f"{self.look_up_list_file_name_root}.json")
-        self.look_up_list_file_name_commentary_path = str(LOOKUP_DIR / "commentary" / f"{self.look_up_list_file_name_commentary}.json")
 
-        self.look_up_list_root = read_json_file(self.look_up_list_file_name_root_path)
-        self.look_up_list_commentary = read_json_file(self.look_up_list_file_name_commentary_path)
+def get_changed_text_mappings(text_mappings: list, previous_text_mappings: list) -> list:
+    """The text mappings that are not in previous_text_mappings exactly as they are now."""
+    previous_hashes = {get_json_hash(text_mapping) for text_mapping in previous_text_mappings}
+    return [text_mapping for text_mapping in text_mappings if get_json_hash(text_mapping) not in previous_hashes]
 
-        self.mapping_payload_file_path = str(MAPPING_PAYLOAD_DIR / f"{self.mapping_file_name}_mapping_payload.json")
 
-    def validate_mapping_root_segment_present_in_root_lookup_list(self):
-        last_found = 0
+def get_chunk_manifest_path(mapping_payload_file_path) -> str:
+    """Where the chunks of an upload are recorded: [name]_mapping_payload.json -> [name]_mapping_payload_chunks.json"""
+    mapping_payload_file_path = Path(mapping_payload_file_path)
+    return str(mapping_payload_file_path.with_name(f"{mapping_payload_file_path.stem}_chunks.json"))
 
-        for mapping in self.mapping_data:
-            if not mapping["root_display_text"] or len(mapping["root_display_text"]) == 0:
-                continue
 
-            root_text_found = False
-            for index in range(last_found, len(self.look_up_list_root)):
-                if fuzzy_match(self.look_up_list_root[index]["segment_content"], mapping["root_display_text"]):
-                    last_found = index + 1
-                    root_text_found = True
-                    break
+class CommentaryTextMapping:
+    # Computed on first use and shared by validation, root id replacement and payload generation
+    root_alignment_plan: RootAlignmentPlan = None
+    # Directory of saved root alignment plans, none are saved or loaded when not set
+    root_alignment_plan_dir: str = None
+    # Cache of generated mapping payloads, nothing is cached when not set
+    artifact_cache: ArtifactCache = None
+
+    def __init__(
+        self,
+        mapping_upload_url: str = None,
+        client: WebBuddhistClient = None,
+        root_text_id: str = None,
+        commentary_text_id: str = None,
+        mapping_data_file_path: str = None,
+        commentary_number: str = None,
+        look_up_list_root=None,
+        look_up_list_commentary=None,
+        mapping_payload_file_path: str = None,
+        root_alignment_plan_dir: str = None,
+        artifact_cache: ArtifactCache = None,
+    ):
+        """
+        Values not given are asked for interactively. The look up lists are the
+        segment_content -> id lists of the root and the commentary (read from the lookup
+        directory when not given). Root alignment plans are saved in root_alignment_plan_dir
+        (WEBUDDHIST_MAPPING_PLAN_DIR by default, empty to disable) and mapping payloads
+        are cached in artifact_cache (WEBUDDHIST_ARTIFACT_CACHE_DIR by default).
+        """
+        self.mapping_upload_url = mapping_upload_url or config.get_mappings_url()
+        self.client = client or get_default_client()
+
+        self.root_text_id = root_text_id or input("Enter the root text id: ")
+        self.commentary_text_id = commentary_text_id or input("Enter the commentary text id: ")
+
+        if mapping_data_file_path is None:
+            self.mapping_file_name = input("Enter the mapping file name: ")
+            self.mapping_file_name_path = str(MAPPING_DATA_DIR / f"{self.mapping_file_name}.json")
+        else:
+            self.mapping_file_name = Path(mapping_data_file_path).stem
+            self.mapping_file_name_path = str(mapping_data_file_path)
+        self.mapping_data = read_json_file(self.mapping_file_name_path)
 
-            if not root_text_found:
-                raise ValueError(f"Root {mapping['root_display_text']} not found in look up list\nMapping data: {mapping}")
+        self.commentary_number = str(commentary_number or input("Enter the commentary number: "))
+        
+        if look_up_list_root is None:
+            self.look_up_list_file_name_root = input("Enter the look up list file name for root: ")
+            self.look_up_list_file_name_root_path = str(LOOKUP_DIR / "root" / f"{self.look_up_list_file_name_root}.json")
+        if look_up_list_commentary is None:
+            self.look_up_list_file_name_commentary = input("Enter the look up list file name for commentary: ")
+            self.look_up_list_file_name_commentary_path = str(LOOKUP_DIR / "commentary" / f"{self.look_up_list_file_name_commentary}.json")
+
+        # Converted lookup stores are memory-mapped instead of parsing the JSON files
+        if look_up_list_root is None:
+            look_up_store_root = open_lookup_store(self.look_up_list_file_name_root_path)
+            look_up_list_root = look_up_store_root if look_up_store_root is not None else read_json_file(self.look_up_list_file_name_root_path)
+        if look_up_list_commentary is None:
+            look_up_store_commentary = open_lookup_store(self.look_up_list_file_name_commentary_path)
+            look_up_list_commentary = look_up_store_commentary if look_up_store_commentary is not None else read_json_file(self.look_up_list_file_name_commentary_path)
+        self.look_up_list_root = look_up_list_root
+        self.look_up_list_commentary = look_up_list_commentary
+
+        self.mapping_payload_file_path = mapping_payload_file_path or str(MAPPING_PAYLOAD_DIR / f"{self.mapping_file_name}_mapping_payload.json")
+        self.root_alignment_plan_dir = root_alignment_plan_dir if root_alignment_plan_dir is not None else config.MAPPING_PLAN_DIR
+        self.artifact_cache = artifact_cache or get_default_artifact_cache()
+
+    def get_root_alignment_plan(self) -> RootAlignmentPlan:
+        if self.root_alignment_plan is None:
+            self.root_alignment_plan = get_root_alignment_plan(
+                self.mapping_data, self.look_up_list_root, plan_dir=self.root_alignment_plan_dir or None
+            )
+        return self.root_alignment_plan
+
+    def raise_for_missing_root(self, root_alignment_plan: RootAlignmentPlan):
+        if root_alignment_plan.missing_row is not None:
+            mapping = self.mapping_data[root_alignment_plan.missing_row]
+            raise ValueError(f"Root {mapping['root_display_text']} not found in look up list\nMapping data: {mapping}")
 
+    def validate_mapping_root_segment_present_in_root_lookup_list(self):
+        self.raise_for_missing_root(self.get_root_alignment_plan())
         return True
 
+    def get_commentary_occurrences(self) -> dict:
+        """
+        Commentary segment content -> (row, offset) of every occurrence in the commentary column,
+        found by scanning the column once with an automaton of all commentary segments.
+        """
+        matcher = AhoCorasick(look_up["segment_content"] for look_up in self.look_up_list_commentary)
+        commentary_column = f"commentary_{self.commentary_number}"
+        with span("commentary_occurrences", items=len(self.mapping_data)):
+            return matcher.get_occurrences(mapping.get(commentary_column) for mapping in self.mapping_data)
+
     def validate_commentary_lookup_list_present_in_mapping_data(self):
+        # One forward pass over the joined column: each segment is searched from the start of the row
+        # after the previous segment's row, which is the first row at or after it containing the segment
+        commentary_column = f"commentary_{self.commentary_number}"
+        cells = [mapping[commentary_column] or "" for mapping in self.mapping_data]
+        row_starts = []
+        offset = 0
+        for cell in cells:
+            row_starts.append(offset)
+            offset += len(cell) + len(CELL_SEPARATOR)
+        column_text = CELL_SEPARATOR.join(cells)
+
         last_found = 0
         for commentary_text in self.look_up_list_commentary:
             if not commentary_text["segment_content"] or len(commentary_text["segment_content"]) == 0:
                 continue
 
-            commentary_text_found = False
-            for index in range(last_found, len(self.mapping_data)):
-                if commentary_text["segment_content"] in self.mapping_data[index][f"commentary_{self.commentary_number}"]:
-                    commentary_text_found = True
-                    last_found = index + 1
-                    break;
-
-            if not commentary_text_found:
+            position = -1
+            if last_found < len(row_starts):
+                position = column_text.find(commentary_text["segment_content"], row_starts[last_found])
+            if position == -1:
                 raise ValueError(f"Commentary {commentary_text['segment_content']} not found in mapping data\nMapping data: {self.mapping_data}")
+            last_found = bisect_right(row_starts, position)
 
         return True
-                    
-            
-    def replace_mapping_root_display_text_with_id(self):
-        last_found = 0
 
-        for mapping in self.mapping_data:
-            if not mapping["root_display_text"] or len(mapping["root_display_text"]) == 0:
-                continue
-
-            root_text_found = False
-            for index in range(last_found, len(self.look_up_list_root)):
-                if fuzzy_match(self.look_up_list_root[index]["segment_content"], mapping["root_display_text"]):
-                    mapping["root_display_text"] = self.look_up_list_root[index]["id"]
-                    last_found = index + 1
-                    root_text_found = True
-                    break
+    def replace_mapping_root_display_text_with_id(self):
+        root_alignment_plan = self.get_root_alignment_plan()
+        self.raise_for_missing_root(root_alignment_plan)
 
-            if not root_text_found:
-                raise ValueError(f"Root {mapping['root_display_text']} not found in look up list\nMapping data: {mapping}")
+        for row in root_alignment_plan.rows:
+            self.mapping_data[row["row"]]["root_display_text"] = row["root_id"]
 
         return True
 
     def get_commentary_and_root_mapping_dict(self):
-        commentary_segment_last_found_dict: dict[str, int] = {}
-
-        commentary_and_root_mapping_dict: dict[str, List[str]] = {}
-
-        for commentary_text in self.look_up_list_commentary:
-            if not commentary_text["segment_content"] or len(commentary_text["segment_content"]) == 0:
-                continue
-
-            commentary_segment_last_found_index = commentary_segment_last_found_dict.get(commentary_text["segment_content"], 0)
-            start_index = commentary_segment_last_found_index
-
-            commentary_segment_encountered_at_least_one = False
-            for index in range(start_index, len(self.mapping_data)):
-                if not self.mapping_data[index]["root_display_text"] or len(self.mapping_data[index]["root_display_text"]) == 0:
-                    continue
-
-                # Use fuzzy substring matching instead of exact substring match
-                # This handles minor variations like whitespace, punctuation, or typos
-                if fuzzy_substring_match(
-                    commentary_text["segment_content"], 
-                    self.mapping_data[index][f"commentary_{self.commentary_number}"],
-                    threshold=0.95
-                ):
-                    commentary_segment_last_found_index = index + 1
-                    commentary_segment_encountered_at_least_one = True
-                    if commentary_text["id"] not in commentary_and_root_mapping_dict:
-                        commentary_and_root_mapping_dict[commentary_text["id"]] = []
-                    commentary_and_root_mapping_dict[commentary_text["id"]].append(self.mapping_data[index]["root_display_text"])
-                elif commentary_segment_encountered_at_least_one:
-                    break
-        
-        return commentary_and_root_mapping_dict
-
+        aligner = CommentaryAligner(self.mapping_data, f"commentary_{self.commentary_number}")
+        root_ids = self.root_alignment_plan.get_root_ids() if self.root_alignment_plan is not None else None
+        return aligner.get_commentary_and_root_mapping_dict(self.look_up_list_commentary, root_ids=root_ids)
+
+
+    def get_mapping_payload_cache_key(self) -> str:
+        with span("mapping_cache_key"):
+            return ArtifactCache.get_key(
+                "mapping_payload",
+                MAPPING_PAYLOAD_VERSION,
+                threshold=0.95,
+                fuzzy_band=DEFAULT_FUZZY_BAND,
+                mapping_data=self.mapping_data,
+                commentary_number=self.commentary_number,
+                root_ids=self.root_alignment_plan.rows if self.root_alignment_plan is not None else None,
+                look_up_list_commentary=get_look_up_list_key(self.look_up_list_commentary),
+                root_text_id=self.root_text_id,
+                commentary_text_id=self.commentary_text_id,
+            )
 
     def generate_mapping_payload(self):
+        """
+        The mapping payload of the commentary. A payload already generated from the same
+        mapping data, look up list and text ids is taken from the artifact cache.
+        """
+        if self.artifact_cache is None:
+            return self.build_mapping_payload()
+
+        cache_key = self.get_mapping_payload_cache_key()
+        cached = self.artifact_cache.get("mapping_payload", cache_key)
+        if cached is not None:
+            return Mapping(**cached)
+
+        mapping_payload = self.build_mapping_payload()
+        self.artifact_cache.put("mapping_payload", cache_key, mapping_payload.model_dump())
+        return mapping_payload
+
+    def build_mapping_payload(self):
         
         commentary_and_root_mapping_dict: dict[str, List[str]] = self.get_commentary_and_root_mapping_dict()
 
@@ -182,33 +260,145 @@ class CommentaryTextMapping:
         )           
 
     def write_mapping_payload_to_file(self, mapping_payload):
-        with open(self.mapping_payload_file_path, "w", encoding="utf-8") as file:
-            json.dump(mapping_payload.model_dump(), file, ensure_ascii=False, indent=4)
-
-    def upload_mapping_payload_to_webuddhist(self, mapping_payload):
-        token = get_token()
-        # Ensure we send a JSON-serializable payload (dict) instead of a Pydantic model instance
-        response = requests.post(
-            self.mapping_upload_url,
-            json=mapping_payload.model_dump(),
-            headers={"Authorization": f"Bearer {token}"}
-        )
+        # Written aside and moved in place, so an interrupted write never leaves a truncated payload
+        mapping_payload_file_path = Path(self.mapping_payload_file_path)
+        temp_path = mapping_payload_file_path.with_name(f"{mapping_payload_file_path.name}.{os.getpid()}.tmp")
+        write_json_file(mapping_payload.model_dump(), temp_path)
+        os.replace(temp_path, mapping_payload_file_path)
+
+    def read_previous_mapping_payload(self):
+        """The mapping payload written by the last run, or None if there is none."""
+        if not Path(self.mapping_payload_file_path).exists():
+            return None
+        return read_json_file(self.mapping_payload_file_path)
+
+    def upload_mapping_chunk(self, chunk_number, chunk, token, journal=None, chunk_count=None):
+        """Uploads one chunk of text mappings, skipping it when the journal already has it."""
+        chunk_payload = {"text_mappings": chunk}
+        checkpoint_key = f"mapping:{self.commentary_text_id}:chunk_{chunk_number}:{get_json_hash(chunk_payload)}"
+        if journal is not None and journal.is_done(checkpoint_key):
+            return journal.get_result(checkpoint_key)
+
+        with span("mapping_chunk", chunk=chunk_number, items=len(chunk)):
+            response = self.client.post(self.mapping_upload_url, json=chunk_payload, token=token)
+            check_response(response)
+        if journal is not None:
+            journal.record(checkpoint_key, response.json())
+        logger.info(f"Chunk {chunk_number}/{chunk_count}: {len(chunk)} text mappings uploaded")
         return response.json()
 
-
-    def map_text_and_upload_to_webuddhist(self):
-        self.validate_mapping_root_segment_present_in_root_lookup_list()
+    def write_chunk_manifest(self, chunk_manifest):
+        chunk_manifest_file_path = get_chunk_manifest_path(self.mapping_payload_file_path)
+        write_json_file(chunk_manifest, chunk_manifest_file_path)
+        logger.info(f"Chunks recorded in {chunk_manifest_file_path}")
+
+    def upload_mapping_payload_to_webuddhist(
+        self,
+        mapping_payload,
+        journal=None,
+        token=None,
+        previous_mapping_payload=None,
+        max_chunk_bytes=None,
+        max_chunk_mappings=None,
+        max_workers=None,
+    ):
+        """
+        Uploads the mapping payload in chunks capped by serialized size and by number of text
+        mappings, up to max_workers chunks at once. With a previous_mapping_payload only the
+        text mappings added or changed since then are sent, and nothing when there are none.
+        The segment ids sent in each chunk and the server responses are written to the chunk
+        manifest next to the mapping payload, which is also what is returned.
+        """
+        # Ensure we send a JSON-serializable payload (dict) instead of a Pydantic model instance
+        mapping_payload_data = mapping_payload.model_dump()
+        text_mappings = mapping_payload_data["text_mappings"]
+        if previous_mapping_payload is not None:
+            text_mappings = get_changed_text_mappings(text_mappings, previous_mapping_payload["text_mappings"])
+            logger.info(
+                f"{len(text_mappings)} of {len(mapping_payload_data['text_mappings'])} "
+                "text mappings changed since the last upload"
+            )
+            if not text_mappings:
+                return None
+
+        max_chunk_bytes = max_chunk_bytes or config.MAPPING_CHUNK_MAX_BYTES
+        max_chunk_mappings = max_chunk_mappings or config.MAPPING_CHUNK_MAX_MAPPINGS
+        max_workers = max_workers or config.MAPPING_UPLOAD_WORKERS
+        chunks = list(iter_size_capped_batches(text_mappings, max_chunk_bytes, max_chunk_mappings))
+        if not chunks:
+            logger.info("No text mappings to upload")
+            return None
+        logger.info(f"Uploading {len(text_mappings)} text mappings in {len(chunks)} chunks")
+
+        token = token or get_token()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            responses = list(executor.map(
+                lambda numbered_chunk: self.upload_mapping_chunk(*numbered_chunk, token, journal, len(chunks)),
+                enumerate(chunks, start=1),
+            ))
+
+        chunk_manifest = {
+            "commentary_text_id": self.commentary_text_id,
+            "text_mappings": len(text_mappings),
+            "chunks": [
+                {
+                    "chunk": chunk_number,
+                    "text_mappings": len(chunk),
+                    "bytes": get_json_size_in_bytes({"text_mappings": chunk}),
+                    "segment_ids": [text_mapping["segment_id"] for text_mapping in chunk],
+                    "response": response,
+                }
+                for chunk_number, (chunk, response) in enumerate(zip(chunks, responses), start=1)
+            ],
+        }
+        self.write_chunk_manifest(chunk_manifest)
+        return chunk_manifest
+
+    def map_text_and_upload_to_webuddhist(self, journal=None, token=None, diff=False, max_chunk_bytes=None, max_chunk_mappings=None, max_workers=None):
+        """
+        Builds the mapping payload, uploads it in chunks and writes it to mapping_payload_file_path
+        once uploaded. With diff, only the text mappings changed since the payload last written are uploaded.
+        """
+        previous_mapping_payload = self.read_previous_mapping_payload() if diff else None
+
+        with span("mapping_validate_root", items=len(self.mapping_data)):
+            self.validate_mapping_root_segment_present_in_root_lookup_list()
         
-        self.replace_mapping_root_display_text_with_id()
+        with span("mapping_replace_root", items=len(self.mapping_data)):
+            self.replace_mapping_root_display_text_with_id()
 
-        mapping_payload = self.generate_mapping_payload()
+        with span("mapping_generate_payload") as generate_span:
+            mapping_payload = self.generate_mapping_payload()
+            generate_span.set(items=len(mapping_payload.text_mappings))
 
+        response = self.upload_mapping_payload_to_webuddhist(
+            mapping_payload, journal=journal, token=token, previous_mapping_payload=previous_mapping_payload,
+            max_chunk_bytes=max_chunk_bytes, max_chunk_mappings=max_chunk_mappings, max_workers=max_workers,
+        )
+        # Only written once uploaded, as it is what the next diff compares against
         self.write_mapping_payload_to_file(mapping_payload)
-
-        self.upload_mapping_payload_to_webuddhist(mapping_payload)
+        return response
 
 if __name__ == "__main__":
-
-    text_mapping = CommentaryTextMapping()
-
-    text_mapping.map_text_and_upload_to_webuddhist()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Map a commentary to its root text and upload the mappings")
+    parser.add_argument("--resume", action="store_true", help="Skip the upload if a previous run already completed it")
+    parser.add_argument("--diff", action="store_true", help="Only upload the mappings changed since the last written mapping payload")
+    parser.add_argument("--chunk-max-bytes", type=int, default=None, help="Max request body size of a chunk of mappings (defaults to WEBUDDHIST_MAPPING_CHUNK_MAX_BYTES)")
+    parser.add_argument("--chunk-max-mappings", type=int, default=None, help="Max text mappings per chunk (defaults to WEBUDDHIST_MAPPING_CHUNK_MAX_MAPPINGS)")
+    parser.add_argument("--workers", type=int, default=None, help="Chunks uploaded at once (defaults to WEBUDDHIST_MAPPING_UPLOAD_WORKERS)")
+    parser.add_argument("--metrics-path", default=None, help="JSON lines file for the timing spans (defaults to WEBUDDHIST_METRICS_PATH)")
+    args = parser.parse_args()
+
+    with metrics_run("text_mapping", metrics_path=args.metrics_path):
+        text_mapping = CommentaryTextMapping()
+
+        text_mapping.map_text_and_upload_to_webuddhist(
+            diff=args.diff,
+            max_chunk_bytes=args.chunk_max_bytes,
+            max_chunk_mappings=args.chunk_max_mappings,
+            max_workers=args.workers,
+            journal=UploadJournal(
+                get_journal_path(f"{text_mapping.mapping_file_name}_commentary_{text_mapping.commentary_number}_mapping"),
+                resume=args.resume,
+            )
+        )
\ No newline at end of file
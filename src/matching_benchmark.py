@@ -0,0 +1,347 @@
+import argparse
+import copy
+import logging
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Ensure project root and src are on sys.path so we can import config, utils and mapping
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+src_dir = str(Path(__file__).resolve().parent)
+if src_dir not in sys.path:
+    sys.path.insert(0, src_dir)
+
+PROJECT_ROOT = Path(project_root)
+SEGMENT_PAYLOAD_DIR = PROJECT_ROOT / "pecha_segment_upload_payload"
+MAPPING_DATA_DIR = PROJECT_ROOT / "commentaries_and_sanskrit"
+DEFAULT_RESULTS_DIR = PROJECT_ROOT / "benchmark_results"
+DEFAULT_THRESHOLD = 0.10
+RESULTS_FORMAT_VERSION = 1
+
+# Configured before the uploaders are imported so their log files are left alone
+logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.WARNING)
+logger = logging.getLogger("matching_benchmark")
+logger.setLevel(logging.INFO)
+
+import utils
+from mapping import alignment
+from mapping.text_mapping import CommentaryTextMapping
+from toc_uploader_webuddhist import TableOfContentsUploader
+from utils import read_json_file, write_json_file
+
+# Deterministic ids for the synthetic look up lists
+BENCHMARK_NAMESPACE = uuid.UUID("6f1c5e0a-3c1e-4f55-9a55-0c4b1f6a0b11")
+TOC_SECTION_SIZE = 20
+
+
+def make_look_up_list(text_name: str, contents) -> list:
+    return [
+        {"segment_content": content, "id": str(uuid.uuid5(BENCHMARK_NAMESPACE, f"{text_name}:{index}"))}
+        for index, content in enumerate(contents)
+    ]
+
+
+def load_segment_payloads(payload_dir=SEGMENT_PAYLOAD_DIR) -> dict:
+    """text name -> segment contents of every payload in pecha_segment_upload_payload/."""
+    return {
+        payload_file.stem: [segment["content"] for segment in read_json_file(str(payload_file))["segments"]]
+        for payload_file in sorted(Path(payload_dir).glob("*.json"))
+    }
+
+
+def load_mapping_data(mapping_data_dir=MAPPING_DATA_DIR) -> dict:
+    return {
+        mapping_file.stem: read_json_file(str(mapping_file))
+        for mapping_file in sorted(Path(mapping_data_dir).glob("*.json"))
+    }
+
+
+def get_commentary_columns(mapping_data) -> list:
+    return sorted({
+        column for row in mapping_data for column, value in row.items() if column.startswith("commentary_") and value
+    })
+
+
+def make_commentary_look_up_list(text_name: str, mapping_data, commentary_column: str) -> list:
+    """Commentary segments as the segmenter produces them: one per line of each commentary cell."""
+    return make_look_up_list(
+        f"{text_name}:{commentary_column}",
+        [line for row in mapping_data for line in (row.get(commentary_column) or "").split("\n") if line.strip()],
+    )
+
+
+def make_toc_payload(text_name: str, contents) -> dict:
+    """A TOC with a section every TOC_SECTION_SIZE segments referencing all non-empty segments."""
+    segments = [content for content in contents if content.strip()]
+    return {
+        "text_id": str(uuid.uuid5(BENCHMARK_NAMESPACE, text_name)),
+        "sections": [
+            {
+                "id": f"section_{section_number}",
+                "title": f"section {section_number}",
+                "section_number": section_number,
+                "segments": [
+                    {"segment_id": content, "segment_number": start + offset + 1}
+                    for offset, content in enumerate(segments[start:start + TOC_SECTION_SIZE])
+                ],
+            }
+            for section_number, start in enumerate(range(0, len(segments), TOC_SECTION_SIZE), start=1)
+        ],
+    }
+
+
+class FuzzyCallCounter:
+    """
+    Counts fuzzy_match / fuzzy_substring_match calls by patching them where the matchers look them up,
+    and the batch calls of utils.FuzzyMatcher (each scoring a block of candidates) under their qualified name.
+    """
+
+    PATCH_TARGETS = (
+        (utils, "fuzzy_match"),
+        (utils, "fuzzy_substring_match"),
+        (alignment, "fuzzy_substring_match"),
+        (utils.FuzzyMatcher, "find_first"),
+        (utils.FuzzyMatcher, "match_matrix"),
+    )
+
+    def __init__(self):
+        self.calls = {"fuzzy_match": 0, "fuzzy_substring_match": 0}
+
+    def wrap(self, function):
+        def counted(*args, **kwargs):
+            self.calls[function.__qualname__] = self.calls.get(function.__qualname__, 0) + 1
+            return function(*args, **kwargs)
+        return counted
+
+    @contextmanager
+    def patched(self):
+        originals = [(module, name, getattr(module, name)) for module, name in self.PATCH_TARGETS]
+        try:
+            for module, name, function in originals:
+                setattr(module, name, self.wrap(function))
+            yield self
+        finally:
+            for module, name, function in originals:
+                setattr(module, name, function)
+
+
+def benchmark_fuzzy_match(segment_payloads):
+    """fuzzy_match on consecutive segment pairs and on each segment against a whitespace variant."""
+    for contents in segment_payloads.values():
+        for previous_content, content in zip(contents, contents[1:]):
+            utils.fuzzy_match(previous_content, content)
+            utils.fuzzy_match(content, " " + content.strip())
+
+
+def benchmark_fuzzy_substring_match(mapping_data_by_text):
+    """fuzzy_substring_match of every commentary line against its own cell and the next one."""
+    for mapping_data in mapping_data_by_text.values():
+        for commentary_column in get_commentary_columns(mapping_data):
+            cells = [row.get(commentary_column) or "" for row in mapping_data]
+            for cell, next_cell in zip(cells, cells[1:] + [""]):
+                for line in cell.split("\n"):
+                    if line.strip():
+                        utils.fuzzy_substring_match(line, cell)
+                        utils.fuzzy_substring_match(line, next_cell)
+
+
+def benchmark_toc_replace(segment_payloads):
+    toc_uploader = TableOfContentsUploader.__new__(TableOfContentsUploader)
+    for text_name, contents in segment_payloads.items():
+        toc_uploader.replace_segment_content_with_id_in_toc(
+            make_toc_payload(text_name, contents), make_look_up_list(text_name, contents)
+        )
+
+
+def benchmark_mapping_dict(mapping_data_by_text):
+    for text_name, mapping_data in mapping_data_by_text.items():
+        for commentary_column in get_commentary_columns(mapping_data):
+            text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+            text_mapping.mapping_data = mapping_data
+            text_mapping.commentary_number = commentary_column.split("_", 1)[1]
+            text_mapping.look_up_list_commentary = make_commentary_look_up_list(text_name, mapping_data, commentary_column)
+            text_mapping.get_commentary_and_root_mapping_dict()
+
+
+def benchmark_mapping_validate_root(mapping_data_by_text):
+    for text_name, mapping_data in mapping_data_by_text.items():
+        text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        text_mapping.mapping_data = mapping_data
+        text_mapping.look_up_list_root = make_look_up_list(
+            f"{text_name}:root", [row["root_display_text"] for row in mapping_data if row["root_display_text"]]
+        )
+        text_mapping.validate_mapping_root_segment_present_in_root_lookup_list()
+
+
+def benchmark_commentary_containment(mapping_data_by_text):
+    """
+    Containment validation and the occurrence table of every commentary column. The validation
+    accepts one segment per row, so the look up list holds the last line of each cell.
+    """
+    for text_name, mapping_data in mapping_data_by_text.items():
+        for commentary_column in get_commentary_columns(mapping_data):
+            text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+            text_mapping.mapping_data = mapping_data
+            text_mapping.commentary_number = commentary_column.split("_", 1)[1]
+            text_mapping.look_up_list_commentary = make_look_up_list(
+                f"{text_name}:{commentary_column}",
+                [
+                    lines[-1]
+                    for lines in ([line for line in (row.get(commentary_column) or "").split("\n") if line.strip()] for row in mapping_data)
+                    if lines
+                ],
+            )
+            text_mapping.validate_commentary_lookup_list_present_in_mapping_data()
+            text_mapping.get_commentary_occurrences()
+
+
+# stage name -> (function, dataset)
+STAGES = {
+    "fuzzy_match": (benchmark_fuzzy_match, "segment_payloads"),
+    "fuzzy_substring_match": (benchmark_fuzzy_substring_match, "mapping_data"),
+    "toc_replace": (benchmark_toc_replace, "segment_payloads"),
+    "mapping_dict": (benchmark_mapping_dict, "mapping_data"),
+    "mapping_validate_root": (benchmark_mapping_validate_root, "mapping_data"),
+    "commentary_containment": (benchmark_commentary_containment, "mapping_data"),
+}
+
+
+def run_stage(function, dataset, repeat: int) -> dict:
+    """
+    Times function(dataset) `repeat` times, then runs it once more under tracemalloc
+    and the fuzzy call counter so neither slows down the timed runs.
+    Each run gets a fresh copy of the dataset since some stages modify it in place.
+    """
+    seconds = []
+    for _ in range(repeat):
+        run_dataset = copy.deepcopy(dataset)
+        start_time = time.perf_counter()
+        function(run_dataset)
+        seconds.append(time.perf_counter() - start_time)
+
+    run_dataset = copy.deepcopy(dataset)
+    fuzzy_call_counter = FuzzyCallCounter()
+    tracemalloc.start()
+    try:
+        with fuzzy_call_counter.patched():
+            function(run_dataset)
+        _, peak_memory_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "repeat": repeat,
+        "seconds": [round(value, 6) for value in seconds],
+        "median_seconds": round(statistics.median(seconds), 6),
+        "min_seconds": round(min(seconds), 6),
+        "fuzzy_calls": fuzzy_call_counter.calls,
+        "peak_memory_bytes": peak_memory_bytes,
+    }
+
+
+def run_benchmarks(stage_names=None, repeat: int = 3, payload_dir=SEGMENT_PAYLOAD_DIR, mapping_data_dir=MAPPING_DATA_DIR) -> dict:
+    datasets = {
+        "segment_payloads": load_segment_payloads(payload_dir),
+        "mapping_data": load_mapping_data(mapping_data_dir),
+    }
+    results = {
+        "version": RESULTS_FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "datasets": {
+            "segment_payloads": {text_name: len(contents) for text_name, contents in datasets["segment_payloads"].items()},
+            "mapping_data": {text_name: len(rows) for text_name, rows in datasets["mapping_data"].items()},
+        },
+        "stages": {},
+    }
+    for stage_name in stage_names or STAGES:
+        function, dataset_name = STAGES[stage_name]
+        logger.info(f"Running {stage_name}")
+        results["stages"][stage_name] = run_stage(function, datasets[dataset_name], repeat)
+        logger.info(f"{stage_name}: {results['stages'][stage_name]['median_seconds']}s")
+    return results
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Returns one row per stage present in both results. A stage regresses when its median
+    time grows by more than threshold (a fraction) or when it makes more fuzzy calls.
+    """
+    rows = []
+    for stage_name, current_stage in current["stages"].items():
+        baseline_stage = baseline["stages"].get(stage_name)
+        if baseline_stage is None:
+            continue
+        baseline_seconds = baseline_stage["median_seconds"]
+        time_change = (current_stage["median_seconds"] - baseline_seconds) / baseline_seconds if baseline_seconds else 0.0
+        baseline_fuzzy_calls = sum(baseline_stage["fuzzy_calls"].values())
+        current_fuzzy_calls = sum(current_stage["fuzzy_calls"].values())
+        rows.append({
+            "stage": stage_name,
+            "baseline_seconds": baseline_seconds,
+            "current_seconds": current_stage["median_seconds"],
+            "time_change": round(time_change, 4),
+            "baseline_fuzzy_calls": baseline_fuzzy_calls,
+            "current_fuzzy_calls": current_fuzzy_calls,
+            "baseline_peak_memory_bytes": baseline_stage["peak_memory_bytes"],
+            "current_peak_memory_bytes": current_stage["peak_memory_bytes"],
+            "regressed": time_change > threshold or current_fuzzy_calls > baseline_fuzzy_calls,
+        })
+    return rows
+
+
+def format_comparison(rows) -> str:
+    lines = [
+        f"{'stage':<24}{'baseline s':>12}{'current s':>12}{'change':>9}{'fuzzy calls':>22}{'peak MiB':>18}",
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['stage']:<24}{row['baseline_seconds']:>12.4f}{row['current_seconds']:>12.4f}"
+            f"{row['time_change']:>+9.1%}"
+            f"{str(row['baseline_fuzzy_calls']) + ' -> ' + str(row['current_fuzzy_calls']):>22}"
+            f"{row['baseline_peak_memory_bytes'] / 2**20:>8.1f} -> {row['current_peak_memory_bytes'] / 2**20:<6.1f}"
+            f"{'  REGRESSED' if row['regressed'] else ''}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the matching hot paths over the pecha corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and save the results as JSON")
+    run_parser.add_argument("--stage", action="append", choices=list(STAGES), help="Only run this stage (repeatable)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage")
+    run_parser.add_argument("--output", default=None, help="Results file (defaults to benchmark_results/<timestamp>.json)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline", help="Baseline results file")
+    compare_parser.add_argument("current", help="Current results file")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown as a fraction, e.g. 0.1 for 10%%")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.stage, repeat=args.repeat)
+        output_path = Path(args.output) if args.output else DEFAULT_RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_file(results, output_path, pretty=True, compress=False)
+        for stage_name, stage in results["stages"].items():
+            print(
+                f"{stage_name:<24}{stage['median_seconds']:>10.4f}s  fuzzy calls {sum(stage['fuzzy_calls'].values()):>8}  "
+                f"peak {stage['peak_memory_bytes'] / 2**20:.1f} MiB"
+            )
+        print(f"Results saved to {output_path}")
+    else:
+        rows = compare_results(read_json_file(args.baseline), read_json_file(args.current), threshold=args.threshold)
+        print(format_comparison(rows))
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
@@ -0,0 +1,219 @@
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLUMNS = ("span", "count", "errors", "total_s", "mean_ms", "max_ms", "bytes", "items", "status")
+
+
+class Span:
+    """
+    Times one pipeline step. Used as a context manager (see span()), it records its
+    duration, the name of the enclosing span on the same thread, the exception type if
+    the step failed and any attributes given at creation or through set(); the bytes,
+    items and status attributes are also summed per span name for the run summary.
+    """
+
+    def __init__(self, name: str, recorder: "MetricsRecorder", **attributes):
+        self.name = name
+        self.recorder = recorder
+        self.attributes = attributes
+        self.parent = None
+        self.started_at = None
+        self.start_time = None
+        self.duration_seconds = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self):
+        stack = self.recorder.get_span_stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.started_at = time.time()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration_seconds = time.perf_counter() - self.start_time
+        self.recorder.get_span_stack().pop()
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.recorder.record(self)
+
+
+class MetricsRecorder:
+    """
+    Collects finished spans: every span is summed per name in memory and, once a run
+    has been started with an output path, written as one JSON line to that file.
+    Thread-safe, so spans from the upload worker threads share one recorder.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.file = None
+        self.metrics_path = None
+        self.run_id = None
+        self.run_name = None
+        self.totals = {}
+
+    def get_span_stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(name, self, **attributes)
+
+    def start_run(self, run_name: str, metrics_path=None):
+        """Clears the totals and, if metrics_path is set, appends the run's spans to it."""
+        with self.lock:
+            self._close_file()
+            self.run_id = uuid.uuid4().hex[:12]
+            self.run_name = run_name
+            self.totals = {}
+            self.metrics_path = Path(metrics_path) if metrics_path else None
+            if self.metrics_path is not None:
+                self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+                self.file = open(self.metrics_path, "a", encoding="utf-8")
+        logger.info(f"Metrics run {run_name} ({self.run_id})" + (f" -> {self.metrics_path}" if self.metrics_path else ""))
+
+    def finish_run(self):
+        """Writes the run summary line and closes the output file."""
+        with self.lock:
+            self._write_line({"run_id": self.run_id, "run": self.run_name, "summary": self._get_summary()})
+            self._close_file()
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_line(self, data: dict):
+        if self.file is not None:
+            self.file.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+            self.file.flush()
+
+    def record(self, span: Span):
+        attributes = span.attributes
+        with self.lock:
+            total = self.totals.get(span.name)
+            if total is None:
+                total = self.totals[span.name] = {
+                    "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "items": 0, "status": Counter()
+                }
+            total["count"] += 1
+            total["errors"] += "error" in attributes
+            total["seconds"] += span.duration_seconds
+            total["max_seconds"] = max(total["max_seconds"], span.duration_seconds)
+            total["bytes"] += attributes.get("bytes") or 0
+            total["items"] += attributes.get("items") or 0
+            if attributes.get("status") is not None:
+                total["status"][attributes["status"]] += 1
+
+            self._write_line({
+                "run_id": self.run_id,
+                "span": span.name,
+                "parent": span.parent,
+                "thread": threading.current_thread().name,
+                "started_at": round(span.started_at, 6),
+                "duration_seconds": round(span.duration_seconds, 6),
+                **attributes,
+            })
+
+    def _get_summary(self) -> list:
+        return [
+            {
+                "span": name,
+                "count": total["count"],
+                "errors": total["errors"],
+                "total_seconds": round(total["seconds"], 6),
+                "mean_seconds": round(total["seconds"] / total["count"], 6),
+                "max_seconds": round(total["max_seconds"], 6),
+                "bytes": total["bytes"],
+                "items": total["items"],
+                "status": {str(status): count for status, count in sorted(total["status"].items(), key=str)},
+            }
+            for name, total in sorted(self.totals.items(), key=lambda item: -item[1]["seconds"])
+        ]
+
+    def get_summary(self) -> list:
+        """Per span name totals, slowest first."""
+        with self.lock:
+            return self._get_summary()
+
+    def format_summary(self) -> str:
+        rows = [
+            (
+                row["span"],
+                str(row["count"]),
+                str(row["errors"]),
+                f"{row['total_seconds']:.3f}",
+                f"{row['mean_seconds'] * 1000:.2f}",
+                f"{row['max_seconds'] * 1000:.2f}",
+                str(row["bytes"]),
+                str(row["items"]),
+                " ".join(f"{status}x{count}" for status, count in row["status"].items()),
+            )
+            for row in self.get_summary()
+        ]
+        widths = [max(len(cell) for cell in column) for column in zip(SUMMARY_COLUMNS, *rows)]
+        lines = [
+            "  ".join(cell.ljust(width) if index in (0, 8) else cell.rjust(width) for index, (cell, width) in enumerate(zip(row, widths))).rstrip()
+            for row in [SUMMARY_COLUMNS, *rows]
+        ]
+        lines.insert(1, "  ".join("-" * width for width in widths))
+        return "\n".join(lines)
+
+
+_default_recorder = MetricsRecorder()
+
+
+def get_default_recorder() -> MetricsRecorder:
+    """Returns the process-wide recorder the instrumented modules report to."""
+    return _default_recorder
+
+
+def span(name: str, **attributes) -> Span:
+    """Context manager timing a step on the default recorder, e.g. `with span("read_json", path=path) as s:`."""
+    return _default_recorder.span(name, **attributes)
+
+
+def timed(name: str = None):
+    """Decorator recording every call of the function as a span (named after the function by default)."""
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def metrics_run(run_name: str, metrics_path: str = None, recorder: MetricsRecorder = None):
+    """
+    Wraps a CLI run: spans are written to metrics_path (config.METRICS_PATH by default,
+    an empty path only keeps them in memory) and the summary table is printed at the end.
+    """
+    recorder = recorder or _default_recorder
+    recorder.start_run(run_name, config.METRICS_PATH if metrics_path is None else metrics_path)
+    try:
+        with recorder.span(run_name):
+            yield recorder
+    finally:
+        recorder.finish_run()
+        print(recorder.format_summary())
@@ -0,0 +1,374 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:
+    # PyYAML is optional, JSON manifests work without it
+    yaml = None
+
+# Ensure project root is on sys.path so we can import config and utils
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+DEFAULT_OUTPUT_DIR = Path("pipeline_output")
+LOG_FILE = "pipeline_log.txt"
+
+# Configured before the uploaders are imported so the pipeline logs to its own file
+logging.basicConfig(
+    filename=LOG_FILE,
+    filemode="a",
+    encoding="utf-8",
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    level=logging.INFO,
+)
+
+from config import config
+from utils import get_json_hash, get_token, read_json_file, write_json_file
+from json_stream import JsonArrayStream
+from metadata_uploader import MetadataUploader
+from metrics import metrics_run, span
+from segment_uploader_webuddhist import SegmentUploader
+from toc_uploader_webuddhist import TableOfContentsUploader
+from mapping.text_mapping import CommentaryTextMapping
+from upload_journal import UploadJournal
+from webuddhist_client import WebBuddhistClient
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = {
+    "name", "text_id", "metadata", "segment_payload", "toc_payload", "commentary_of", "commentary_number", "mapping_data"
+}
+PATH_FIELDS = ("segment_payload", "toc_payload", "mapping_data")
+
+
+def load_manifest(manifest_path) -> dict:
+    """
+    Reads and validates a pipeline manifest (JSON, or YAML when PyYAML is installed).
+    Payload and mapping data paths are resolved against the manifest's directory.
+    """
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        if manifest_path.suffix in (".yaml", ".yml"):
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML manifests, use a JSON manifest or pip install pyyaml")
+            manifest = yaml.safe_load(file)
+        else:
+            manifest = json.load(file)
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("texts"), list):
+        raise ValueError(f"{manifest_path} must hold an object with a list of texts")
+
+    names = set()
+    for text in manifest["texts"]:
+        name = text.get("name")
+        if not name:
+            raise ValueError(f"Every text of {manifest_path} needs a name")
+        if name in names:
+            raise ValueError(f"Text {name} appears twice in {manifest_path}")
+        names.add(name)
+        unknown_fields = set(text) - TEXT_FIELDS
+        if unknown_fields:
+            raise ValueError(f"Unknown fields {sorted(unknown_fields)} for text {name}")
+        if not text.get("segment_payload"):
+            raise ValueError(f"Text {name} needs a segment_payload")
+        if text.get("mapping_data") and not (text.get("commentary_of") and text.get("commentary_number")):
+            raise ValueError(f"Text {name} needs commentary_of and commentary_number to be mapped")
+        for field in PATH_FIELDS:
+            if text.get(field):
+                text[field] = str((manifest_path.parent / text[field]).resolve())
+
+    for text in manifest["texts"]:
+        if text.get("commentary_of") is not None and (text["commentary_of"] not in names or text["commentary_of"] == text["name"]):
+            raise ValueError(f"Text {text['name']} is a commentary of unknown text {text['commentary_of']}")
+    return manifest
+
+
+def get_payload_text_id(payload_data_file_path):
+    """text_id of a segment payload, read without loading its segments when it comes first."""
+    with JsonArrayStream(payload_data_file_path, key="segments") as payload_segments:
+        text_id = payload_segments.header.get("text_id")
+    return text_id if text_id is not None else read_json_file(payload_data_file_path)["text_id"]
+
+
+def get_stage_name(text_name: str, kind: str) -> str:
+    return f"{text_name}:{kind}"
+
+
+class PipelineStage:
+    def __init__(self, text: dict, kind: str, depends_on: list):
+        self.text = text
+        self.kind = kind
+        self.depends_on = depends_on
+
+    @property
+    def name(self) -> str:
+        return get_stage_name(self.text["name"], self.kind)
+
+
+def build_stages(manifest: dict) -> list:
+    """
+    Turns the texts of a manifest into stages: metadata -> segments -> TOC for every text,
+    and for a mapped commentary a mapping stage waiting for its own and its root's segments.
+    Stages without a dependency between them (e.g. two texts) can run in parallel.
+    """
+    stages = []
+    for text in manifest["texts"]:
+        segments_depends_on = []
+        if text.get("metadata"):
+            stages.append(PipelineStage(text, "metadata", []))
+            segments_depends_on.append(get_stage_name(text["name"], "metadata"))
+        stages.append(PipelineStage(text, "segments", segments_depends_on))
+        if text.get("toc_payload"):
+            stages.append(PipelineStage(text, "toc", [get_stage_name(text["name"], "segments")]))
+        if text.get("mapping_data"):
+            stages.append(PipelineStage(
+                text,
+                "mapping",
+                [get_stage_name(text["name"], "segments"), get_stage_name(text["commentary_of"], "segments")],
+            ))
+    return stages
+
+
+class PipelineRunner:
+    """
+    Runs the metadata, segment, TOC and mapping uploads of a manifest without prompting.
+    The text ids returned by the metadata uploads and the segment_content -> id lists
+    returned by the segment uploads are kept in memory and handed to the stages that
+    need them. Every stage checkpoints to its own journal, so a failed run can be
+    resumed; the stages depending on a failed stage are skipped.
+
+    With diff, a re-run after editing payloads only uploads what changed: the journals are
+    resumed (so texts keep their ids and an unchanged TOC is not sent again), only the
+    segments inserted or edited since the last look up list are uploaded and only the
+    changed text mappings are sent.
+    """
+
+    def __init__(
+        self,
+        manifest: dict,
+        max_workers: int = 4,
+        output_dir: str = None,
+        journal_dir: str = None,
+        resume: bool = False,
+        batched: bool = True,
+        stream: bool = False,
+        max_batch_bytes: int = None,
+        max_batch_segments: int = None,
+        client: WebBuddhistClient = None,
+        diff: bool = False,
+    ):
+        if diff and stream:
+            raise ValueError("A diff run needs whole payloads, it cannot be streamed")
+        self.manifest = manifest
+        self.stages = build_stages(manifest)
+        self.max_workers = max_workers
+        self.output_dir = Path(output_dir) if output_dir else DEFAULT_OUTPUT_DIR
+        self.journal_dir = Path(journal_dir or config.UPLOAD_JOURNAL_DIR)
+        self.diff = diff
+        self.resume = resume or diff
+        self.batched = batched
+        self.stream = stream
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_segments = max_batch_segments
+        # One pooled client for every worker, sized so no worker waits for a connection
+        self.client = client or WebBuddhistClient(pool_size=max(max_workers, config.HTTP_POOL_SIZE))
+        self.texts = {text["name"]: text for text in manifest["texts"]}
+        self.state = {name: {"text_id": text.get("text_id"), "look_up_list": None} for name, text in self.texts.items()}
+        self.token = None
+
+    def get_journal(self, stage: PipelineStage) -> UploadJournal:
+        return UploadJournal(self.journal_dir / f"{stage.text['name']}_{stage.kind}.jsonl", resume=self.resume)
+
+    def get_look_up_list_file_path(self, text_name: str) -> Path:
+        return self.output_dir / f"{text_name}_segment_content_with_segment_id.json"
+
+    def get_look_up_list(self, text_name: str):
+        look_up_list = self.state[text_name]["look_up_list"]
+        if look_up_list is None:
+            # Streamed uploads only write their look up list to the file
+            look_up_list = read_json_file(str(self.get_look_up_list_file_path(text_name)))
+            self.state[text_name]["look_up_list"] = look_up_list
+        return look_up_list
+
+    def run_metadata(self, stage: PipelineStage):
+        text = stage.text
+        journal = self.get_journal(stage)
+        checkpoint_key = f"metadata:{text['name']}:{get_json_hash(text['metadata'])}"
+        if journal.is_done(checkpoint_key):
+            logger.info(f"Skipping {checkpoint_key}, already uploaded")
+            text_id = journal.get_result(checkpoint_key)
+        else:
+            text_id = MetadataUploader(api_key=self.token, client=self.client).upload_metadata(text["metadata"])
+            journal.record(checkpoint_key, text_id)
+        self.state[text["name"]]["text_id"] = text_id
+        return text_id
+
+    def run_segments(self, stage: PipelineStage):
+        text = stage.text
+        state = self.state[text["name"]]
+        uploader = SegmentUploader(
+            text_name=text["name"],
+            root_or_commentary="commentary" if text.get("commentary_of") else "root",
+            payload_data_file_path=text["segment_payload"],
+            segment_content_with_segment_id_file_path=str(self.get_look_up_list_file_path(text["name"])),
+            client=self.client,
+            stream=self.stream,
+            text_id=state["text_id"],
+        )
+        state["look_up_list"] = uploader.upload_segments(
+            batched=self.batched,
+            max_batch_bytes=self.max_batch_bytes,
+            max_batch_segments=self.max_batch_segments,
+            token=self.token,
+            journal=self.get_journal(stage),
+            diff=self.diff,
+        )
+        if state["text_id"] is None:
+            state["text_id"] = get_payload_text_id(text["segment_payload"])
+        return state["text_id"]
+
+    def run_toc(self, stage: PipelineStage):
+        text = stage.text
+        toc_uploader = TableOfContentsUploader(
+            client=self.client,
+            text_name=text["name"],
+            root_or_commentary="commentary" if text.get("commentary_of") else "root",
+            payload_data_file_path=text["toc_payload"],
+            text_id_look_up_list=self.get_look_up_list(text["name"]),
+            text_id=self.state[text["name"]]["text_id"],
+        )
+        return toc_uploader.upload_toc(token=self.token, journal=self.get_journal(stage))
+
+    def run_mapping(self, stage: PipelineStage):
+        text = stage.text
+        root_name = text["commentary_of"]
+        text_mapping = CommentaryTextMapping(
+            client=self.client,
+            root_text_id=self.state[root_name]["text_id"],
+            commentary_text_id=self.state[text["name"]]["text_id"],
+            mapping_data_file_path=text["mapping_data"],
+            commentary_number=text["commentary_number"],
+            look_up_list_root=self.get_look_up_list(root_name),
+            look_up_list_commentary=self.get_look_up_list(text["name"]),
+            mapping_payload_file_path=str(self.output_dir / f"{text['name']}_mapping_payload.json"),
+            root_alignment_plan_dir=str(self.output_dir / "mapping_plans"),
+        )
+        return text_mapping.map_text_and_upload_to_webuddhist(journal=self.get_journal(stage), token=self.token, diff=self.diff)
+
+    def run_stage(self, stage: PipelineStage) -> dict:
+        start_time = time.perf_counter()
+        with span(f"stage_{stage.kind}", text=stage.text["name"]):
+            getattr(self, f"run_{stage.kind}")(stage)
+        elapsed = time.perf_counter() - start_time
+        logger.info(f"Stage {stage.name} finished in {elapsed:.2f}s")
+        return {"stage": stage.name, "status": "done", "seconds": round(elapsed, 3)}
+
+    def run(self, token=None):
+        """
+        Runs every stage once its dependencies are done, on a bounded thread pool.
+        Returns the stage results in the order of self.stages.
+        """
+        self.token = token or get_token()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        start_time = time.perf_counter()
+
+        results = {}
+        pending = {stage.name: stage for stage in self.stages}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+
+            def submit_ready_stages():
+                changed = True
+                while changed:
+                    changed = False
+                    for name, stage in list(pending.items()):
+                        statuses = [results.get(dependency, {}).get("status") for dependency in stage.depends_on]
+                        if any(status in ("failed", "skipped") for status in statuses):
+                            del pending[name]
+                            unfinished = next(
+                                dependency for dependency, status in zip(stage.depends_on, statuses) if status in ("failed", "skipped")
+                            )
+                            results[name] = {"stage": name, "status": "skipped", "error": f"Stage {unfinished} did not succeed"}
+                            changed = True
+                        elif all(status == "done" for status in statuses):
+                            del pending[name]
+                            running[executor.submit(self.run_stage, stage)] = stage
+
+            submit_ready_stages()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        results[stage.name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Stage {stage.name} failed: {e}")
+                        results[stage.name] = {"stage": stage.name, "status": "failed", "error": str(e)}
+                submit_ready_stages()
+
+        logger.info(f"Pipeline of {len(self.stages)} stages finished in {time.perf_counter() - start_time:.2f}s")
+        stage_results = [results[stage.name] for stage in self.stages]
+        self.write_results(stage_results)
+        return stage_results
+
+    def write_results(self, stage_results):
+        """Writes the text ids and stage results of the run next to the look up lists."""
+        write_json_file(
+            {
+                "texts": {name: {"text_id": state["text_id"]} for name, state in self.state.items()},
+                "stages": stage_results,
+            },
+            self.output_dir / "pipeline_results.json",
+            pretty=True,
+            compress=False,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the metadata, segment, TOC and mapping uploads of a manifest")
+    parser.add_argument("manifest", help="Pipeline manifest (JSON, or YAML with PyYAML installed)")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of concurrent stages")
+    parser.add_argument("--output-dir", default=None, help="Directory for look up lists, mapping payloads and pipeline_results.json")
+    parser.add_argument("--journal-dir", default=None, help="Directory for the per-stage checkpoint journals")
+    parser.add_argument("--resume", action="store_true", help="Skip steps completed by a previous interrupted run")
+    parser.add_argument("--no-batch", action="store_true", help="Upload each text's segments in a single request")
+    parser.add_argument("--stream", action="store_true", help="Stream segment payloads in batches instead of loading them whole")
+    parser.add_argument("--max-batch-bytes", type=int, default=None, help="Maximum request body size per batch")
+    parser.add_argument("--max-batch-segments", type=int, default=None, help="Maximum number of segments per batch")
+    parser.add_argument("--diff", action="store_true", help="Only upload segments, TOCs and mappings changed since the last run")
+    parser.add_argument("--dry-run", action="store_true", help="Print the stages and their dependencies without uploading")
+    parser.add_argument("--metrics-path", default=None, help="JSON lines file for the timing spans (defaults to WEBUDDHIST_METRICS_PATH)")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    if args.dry_run:
+        for stage in build_stages(manifest):
+            print(f"{stage.name}" + (f" <- {', '.join(stage.depends_on)}" if stage.depends_on else ""))
+        sys.exit(0)
+
+    pipeline_runner = PipelineRunner(
+        manifest,
+        max_workers=args.workers,
+        output_dir=args.output_dir,
+        journal_dir=args.journal_dir,
+        resume=args.resume,
+        batched=not args.no_batch,
+        stream=args.stream,
+        max_batch_bytes=args.max_batch_bytes,
+        max_batch_segments=args.max_batch_segments,
+        diff=args.diff,
+    )
+    with metrics_run("pipeline", metrics_path=args.metrics_path):
+        results = pipeline_runner.run()
+        for result in results:
+            print(result)
+
+    if any(result["status"] != "done" for result in results):
+        sys.exit(1)
@@ -0,0 +1,63 @@
+import difflib
+
+from utils import get_segment_hash
+
+
+class SegmentDiff:
+    """
+    Compares the segments of a new payload with the look up list of the last upload
+    (segment_content -> id, with the content_hash of each segment).
+
+    The two sequences of content hashes are aligned with difflib, so a segment keeps its
+    id when it is unchanged and still in the same order relative to its neighbours, even if
+    segments were inserted or removed around it. Only the segments without an id (inserted
+    or edited) need to be uploaded; the ids of the segments no longer in the payload are
+    listed in removed_ids.
+    """
+
+    def __init__(self, previous_look_up_list, segments):
+        self.segments = segments
+        previous_look_up_list = list(previous_look_up_list)
+        previous_hashes = [
+            look_up.get("content_hash") or get_segment_hash(look_up["segment_content"]) for look_up in previous_look_up_list
+        ]
+        hashes = [get_segment_hash(segment["content"]) for segment in segments]
+
+        self.ids = [None] * len(segments)
+        self.removed_ids = []
+        matcher = difflib.SequenceMatcher(None, previous_hashes, hashes, autojunk=False)
+        for tag, previous_start, previous_end, start, _ in matcher.get_opcodes():
+            if tag == "equal":
+                for offset in range(previous_end - previous_start):
+                    self.ids[start + offset] = previous_look_up_list[previous_start + offset]["id"]
+            elif tag in ("replace", "delete"):
+                self.removed_ids.extend(look_up["id"] for look_up in previous_look_up_list[previous_start:previous_end])
+        self.changed_indices = [index for index, segment_id in enumerate(self.ids) if segment_id is None]
+
+    @property
+    def changed_segments(self) -> list:
+        """Inserted or edited segments, in payload order."""
+        return [self.segments[index] for index in self.changed_indices]
+
+    def has_changes(self) -> bool:
+        return bool(self.changed_indices or self.removed_ids)
+
+    def get_segments(self, uploaded_ids) -> list:
+        """
+        Returns every segment of the payload as {"id", "content"}, with the previous ids for
+        unchanged segments and uploaded_ids (in order) for the changed ones.
+        """
+        if len(uploaded_ids) != len(self.changed_indices):
+            raise ValueError(f"Got {len(uploaded_ids)} uploaded ids for {len(self.changed_indices)} changed segments")
+        ids = list(self.ids)
+        for index, segment_id in zip(self.changed_indices, uploaded_ids):
+            ids[index] = segment_id
+        return [{"id": segment_id, "content": segment["content"]} for segment, segment_id in zip(self.segments, ids)]
+
+    def get_stats(self) -> dict:
+        return {
+            "segments": len(self.segments),
+            "reused": len(self.segments) - len(self.changed_indices),
+            "changed": len(self.changed_indices),
+            "removed": len(self.removed_ids),
+        }
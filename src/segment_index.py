@@ -0,0 +1,91 @@
+import time
+from bisect import bisect_left
+from operator import itemgetter
+
+from canonical_text import canonicalize
+from lookup_store import LookupStore
+from metrics import span
+from utils import FuzzyMatcher
+
+DEFAULT_FUZZY_WINDOW = 100
+
+
+class SegmentContentIndex:
+    """
+    Resolves segment contents to positions in a `segment_content -> id` look up list.
+    An exact hash lookup on canonical content (see canonical_text) is tried first; duplicates are disambiguated
+    by taking the first position at or after the expected one. Only when that fails, or the
+    exact position lies beyond the window, is fuzzy_match run, and only over the fuzzy_window
+    entries following the expected position (scored in blocks by FuzzyMatcher, which
+    canonicalizes each entry at most once). A fuzzy match there wins over the distant exact one.
+    A LookupStore look up list is queried through its own content hash table instead of
+    being indexed again.
+    """
+
+    def __init__(self, look_up_list, fuzzy_window: int = DEFAULT_FUZZY_WINDOW, threshold: float = 0.95):
+        self.look_up_list = look_up_list
+        self.fuzzy_window = fuzzy_window
+        self.threshold = threshold
+
+        self.positions = None
+        if not isinstance(look_up_list, LookupStore):
+            self.positions = {}
+            with span("segment_index_build", items=len(look_up_list)):
+                for index, look_up in enumerate(look_up_list):
+                    self.positions.setdefault(canonicalize(look_up["segment_content"]), []).append(index)
+
+        self.fuzzy_matcher = FuzzyMatcher(look_up_list, threshold=threshold, key=itemgetter("segment_content"))
+
+        self.exact_matches = 0
+        self.fuzzy_matches = 0
+        self.fuzzy_comparisons = 0
+        self.exact_seconds = 0.0
+        self.fuzzy_seconds = 0.0
+
+    def get_positions(self, content: str) -> list:
+        if self.positions is None:
+            return self.look_up_list.positions_of_content(content)
+        return self.positions.get(canonicalize(content))
+
+    def find(self, content: str, expected_index: int = 0) -> int:
+        """Returns the index of content in the look up list at or after expected_index."""
+        start_time = time.perf_counter()
+        exact_index = None
+        positions = self.get_positions(content)
+        if positions:
+            position = bisect_left(positions, expected_index)
+            if position < len(positions):
+                exact_index = positions[position]
+        self.exact_seconds += time.perf_counter() - start_time
+
+        window_end = None if self.fuzzy_window is None else expected_index + self.fuzzy_window
+        if exact_index is not None and (window_end is None or exact_index < window_end):
+            self.exact_matches += 1
+            return exact_index
+
+        # An exact copy beyond the window must not win over a fuzzy match close to the expected position
+        end_index = window_end if exact_index is None else min(exact_index, window_end)
+        start_time = time.perf_counter()
+        comparisons = self.fuzzy_matcher.comparisons
+        try:
+            index = self.fuzzy_matcher.find(content, start=expected_index, end=end_index)
+        finally:
+            self.fuzzy_comparisons += self.fuzzy_matcher.comparisons - comparisons
+            self.fuzzy_seconds += time.perf_counter() - start_time
+        if index is not None:
+            self.fuzzy_matches += 1
+            return index
+        if exact_index is not None:
+            self.exact_matches += 1
+            return exact_index
+
+        raise ValueError(f"Content {content} not found in look_up_list")
+
+    def get_stats(self) -> dict:
+        return {
+            "exact_matches": self.exact_matches,
+            "fuzzy_matches": self.fuzzy_matches,
+            "fuzzy_comparisons": self.fuzzy_comparisons,
+            "exact_seconds": round(self.exact_seconds, 6),
+            "fuzzy_seconds": round(self.fuzzy_seconds, 6),
+        }
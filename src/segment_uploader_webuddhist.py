@@ -1,7 +1,8 @@
+import argparse
 import json
-import requests
 import logging
 import sys
+import time
 from pathlib import Path
 
 # Ensure project root is on sys.path so we can import config and utils
@@ -15,8 +16,19 @@ DATA_DIR = BASE_DIR / "data"
 from config import config
 from utils import (
     get_token,
-    read_json_file
+    get_json_hash,
+    get_segment_hash,
+    get_json_size_in_bytes,
+    iter_size_capped_batches,
+    get_json_indent,
+    read_json_file,
+    write_json_file
 )
+from json_stream import JsonArrayStream, JsonArrayWriter
+from metrics import metrics_run, span
+from segment_diff import SegmentDiff
+from upload_journal import UploadJournal, get_journal_path
+from webuddhist_client import WebBuddhistClient, check_response, get_default_client
 
 LOG_FILE = "segment_upload_log.txt"
 
@@ -30,19 +42,76 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+
+def get_segment_size_in_bytes(segment):
+    """Size of a segment as it is serialized in the request body."""
+    return get_json_size_in_bytes(segment)
+
+
+def get_segments_from_ids(segments, segment_ids):
+    """Rebuilds the API response segments from the payload segments and their returned ids."""
+    return [
+        {"id": segment_id, "content": segment["content"]}
+        for segment, segment_id in zip(segments, segment_ids)
+    ]
+
+
+def get_look_up_entry(segment):
+    """segment_content -> id entry of the api_response files for a returned segment, with its content hash."""
+    return {"segment_content": segment["content"], "id": segment["id"], "content_hash": get_segment_hash(segment["content"])}
+
+
+def iter_segment_batches(segments, max_batch_bytes, max_batch_segments):
+    """
+    Yields ordered batches of segments capped by serialized size and by count,
+    consuming segments lazily so it can be fed by a streamed payload.
+    A single segment larger than max_batch_bytes is sent on its own batch.
+    """
+    return iter_size_capped_batches(segments, max_batch_bytes, max_batch_segments)
+
+
+def split_segments_into_batches(segments, max_batch_bytes, max_batch_segments):
+    """Splits segments into ordered batches capped by serialized size and by count."""
+    return list(iter_segment_batches(segments, max_batch_bytes, max_batch_segments))
+
+
 class SegmentUploader:
-    def __init__(self, segment_upload_url: str = None):
-        self.text_name = input("Enter the text name: ")
-        self.root_or_commentary = input("Enter the root or commentary_[1,2,3]: ")
-        self.payload_data_file_path = str(
+    logger = logger
+    stream = False
+    text_id = None
+
+    def __init__(
+        self,
+        segment_upload_url: str = None,
+        text_name: str = None,
+        root_or_commentary: str = None,
+        payload_data_file_path: str = None,
+        segment_content_with_segment_id_file_path: str = None,
+        logger: logging.Logger = None,
+        client: WebBuddhistClient = None,
+        stream: bool = False,
+        text_id: str = None,
+    ):
+        self.text_name = text_name or input("Enter the text name: ")
+        self.root_or_commentary = root_or_commentary or input("Enter the root or commentary_[1,2,3]: ")
+        if logger is not None:
+            self.logger = logger
+        self.payload_data_file_path = payload_data_file_path or str(
             DATA_DIR
             / self.text_name
             / f"{self.text_name}_payload"
             / f"{self.text_name}_{self.root_or_commentary}_text_segment_payload.json"
         )
-        self.payload_data = read_json_file(self.payload_data_file_path)
+        # A streamed payload is read segment by segment while uploading
+        self.stream = stream
+        self.payload_data = None if stream else read_json_file(self.payload_data_file_path)
+        # Overrides the payload's text_id, e.g. with the id just returned by the metadata upload
+        self.text_id = text_id
+        if self.payload_data is not None and text_id is not None:
+            self.payload_data["text_id"] = text_id
         self.segment_upload_url = segment_upload_url or config.get_segments_url()
-        self.segment_content_with_segment_id_file_path = str(
+        self.client = client or get_default_client()
+        self.segment_content_with_segment_id_file_path = segment_content_with_segment_id_file_path or str(
             DATA_DIR
             / self.text_name
             / f"{self.text_name}_api_response"
@@ -50,35 +119,238 @@ class SegmentUploader:
         )
 
     def upload_segments_to_webuddhist(self, payload_data,token):
-        logger.info("Uploading segments to webuddhist")
-        response = requests.post(self.segment_upload_url, json=payload_data, headers={"Authorization": f"Bearer {token}"})
-        logger.info("Segments uploaded, ", response.status_code)
+        self.logger.info("Uploading segments to webuddhist")
+        response = self.client.post(self.segment_upload_url, json=payload_data, token=token)
+        self.logger.info(f"Segments uploaded, {response.status_code}")
+        check_response(response)
         return response.json()
 
+    def upload_segments_with_checkpoint(self, payload_data, token, checkpoint_key, journal=None):
+        """
+        Uploads payload_data unless the journal already records checkpoint_key, in which
+        case the response is rebuilt from the segment ids stored in the journal.
+        """
+        if journal is not None and journal.is_done(checkpoint_key):
+            self.logger.info(f"Skipping {checkpoint_key}, already uploaded")
+            return {
+                "text_id": payload_data["text_id"],
+                "segments": get_segments_from_ids(payload_data["segments"], journal.get_result(checkpoint_key)),
+            }
+
+        response_data = self.upload_segments_to_webuddhist(payload_data, token)
+        if journal is not None:
+            journal.record(checkpoint_key, [segment["id"] for segment in response_data["segments"]])
+        return response_data
+
+    def upload_segment_batch(self, text_id, batch_number, batch, token, journal=None, batch_count=None):
+        """Uploads one batch of segments, checks the returned count and records its latency and throughput."""
+        batch_payload = {"text_id": text_id, "segments": batch}
+        with span("serialize_batch", items=len(batch)) as serialize_span:
+            batch_bytes = len(json.dumps(batch_payload).encode("utf-8"))
+            checkpoint_key = f"segments:{text_id}:batch_{batch_number}:{get_json_hash(batch_payload)}"
+            serialize_span.set(bytes=batch_bytes)
+        batch_label = f"{batch_number}/{batch_count}" if batch_count else str(batch_number)
+
+        start_time = time.perf_counter()
+        with span("segment_batch", text_id=text_id, batch=batch_number, bytes=batch_bytes, items=len(batch)):
+            response_data = self.upload_segments_with_checkpoint(batch_payload, token, checkpoint_key, journal)
+        latency = time.perf_counter() - start_time
+
+        if len(response_data.get("segments", [])) != len(batch):
+            raise ValueError(
+                f"Batch {batch_label} returned {len(response_data.get('segments', []))} segments, expected {len(batch)}"
+            )
+
+        batch_stat = {
+            "batch": batch_number,
+            "segments": len(batch),
+            "bytes": batch_bytes,
+            "latency_seconds": round(latency, 3),
+            "throughput_kb_per_second": round(batch_bytes / 1024 / latency, 2) if latency else None,
+            "segments_per_second": round(len(batch) / latency, 2) if latency else None,
+        }
+        self.batch_stats.append(batch_stat)
+        self.logger.info(
+            f"Batch {batch_label}: {batch_stat['segments']} segments, "
+            f"{batch_stat['bytes']} bytes in {batch_stat['latency_seconds']}s "
+            f"({batch_stat['throughput_kb_per_second']} KB/s, {batch_stat['segments_per_second']} segments/s)"
+        )
+        return response_data
+
+    def upload_segments_to_webuddhist_in_batches(self, payload_data, token, max_batch_bytes=None, max_batch_segments=None, journal=None):
+        max_batch_bytes = max_batch_bytes or config.SEGMENT_BATCH_MAX_BYTES
+        max_batch_segments = max_batch_segments or config.SEGMENT_BATCH_MAX_SEGMENTS
+        batches = split_segments_into_batches(payload_data["segments"], max_batch_bytes, max_batch_segments)
+        self.logger.info(f"Uploading {len(payload_data['segments'])} segments in {len(batches)} batches")
+
+        merged_response = None
+        self.batch_stats = []
+        for batch_number, batch in enumerate(batches, start=1):
+            response_data = self.upload_segment_batch(payload_data["text_id"], batch_number, batch, token, journal, batch_count=len(batches))
+
+            if merged_response is None:
+                merged_response = dict(response_data)
+                merged_response["segments"] = list(response_data["segments"])
+            else:
+                merged_response["segments"].extend(response_data["segments"])
+
+        if merged_response is None:
+            merged_response = {"text_id": payload_data["text_id"], "segments": []}
+        return merged_response
+
     def store_segment_content_with_segment_id_in_json(self, response_data):
-        logger.info("Storing segment content with segment id in json")
+        self.logger.info("Storing segment content with segment id in json")
         list_segment_content_with_segment_id = []
         for _ in response_data["segments"]:
-            segment_content = _["content"]
-            list_segment_content_with_segment_id.append({"segment_content": segment_content, "id": _["id"]})
+            list_segment_content_with_segment_id.append(get_look_up_entry(_))
         
-        with open(self.segment_content_with_segment_id_file_path, "w", encoding="utf-8") as file:
-            json.dump(list_segment_content_with_segment_id, file, ensure_ascii=False, indent=4)
+        write_json_file(list_segment_content_with_segment_id, self.segment_content_with_segment_id_file_path)
+
+
+        self.logger.info("Segment content with segment id and hash id with segment content stored in json")
+        return list_segment_content_with_segment_id
+
+    def upload_segments_streaming(self, max_batch_bytes=None, max_batch_segments=None, token=None, journal=None):
+        """
+        Streams the payload file in batches: each batch is uploaded as soon as it has been
+        parsed and its returned segments are appended to the segment content with segment id
+        file right away, so memory is bounded by one batch instead of the whole text.
+        Batches use the same checkpoint keys as upload_segments_to_webuddhist_in_batches.
+        """
+        token = token or get_token()
+        max_batch_bytes = max_batch_bytes or config.SEGMENT_BATCH_MAX_BYTES
+        max_batch_segments = max_batch_segments or config.SEGMENT_BATCH_MAX_SEGMENTS
+        self.logger.info(f"Streaming segments from {self.payload_data_file_path}")
+
+        self.batch_stats = []
+        segment_count = 0
+        with span("stream_segments", path=self.payload_data_file_path) as stream_span, \
+                JsonArrayStream(self.payload_data_file_path, key="segments") as payload_segments:
+            text_id = self.text_id or payload_segments.header.get("text_id")
+            if text_id is None:
+                raise ValueError(f"text_id must come before segments in {self.payload_data_file_path} to stream it")
+
+            with JsonArrayWriter(
+                self.segment_content_with_segment_id_file_path, indent=get_json_indent(), compress=config.JSON_GZIP
+            ) as writer:
+                batches = iter_segment_batches(payload_segments, max_batch_bytes, max_batch_segments)
+                for batch_number, batch in enumerate(batches, start=1):
+                    response_data = self.upload_segment_batch(text_id, batch_number, batch, token, journal)
+                    for segment in response_data["segments"]:
+                        writer.write(get_look_up_entry(segment))
+                    segment_count += len(batch)
+            stream_span.set(items=segment_count, bytes=Path(self.payload_data_file_path).stat().st_size)
 
+        self.logger.info(f"{segment_count} segments uploaded successfully for text_id: {text_id}")
 
-        logger.info("Segment content with segment id and hash id with segment content stored in json")
+    def read_previous_look_up_list(self):
+        """The look up list written by the last upload of this text, or [] if there is none."""
+        if not Path(self.segment_content_with_segment_id_file_path).exists():
+            self.logger.info(f"No previous upload in {self.segment_content_with_segment_id_file_path}, every segment is new")
+            return []
+        return read_json_file(self.segment_content_with_segment_id_file_path)
 
-    def upload_segments(self):
-        token = get_token()
-        response = self.upload_segments_to_webuddhist(self.payload_data, token)
-        self.store_segment_content_with_segment_id_in_json(response)
+    def upload_segments_diff(self, previous_look_up_list=None, batched=False, max_batch_bytes=None, max_batch_segments=None, token=None, journal=None):
+        """
+        Uploads only the segments inserted or edited since the last upload (see SegmentDiff),
+        reuses the ids of the unchanged ones and rewrites the segment content with segment id file.
+        """
+        if previous_look_up_list is None:
+            previous_look_up_list = self.read_previous_look_up_list()
+        self.segment_diff = SegmentDiff(previous_look_up_list, self.payload_data["segments"])
+        stats = self.segment_diff.get_stats()
+        self.logger.info(
+            f"Diff against the last upload: {stats['reused']} segments reused, "
+            f"{stats['changed']} inserted or changed, {stats['removed']} removed"
+        )
+
+        uploaded_ids = []
+        if self.segment_diff.changed_indices:
+            token = token or get_token()
+            changed_payload = {"text_id": self.payload_data["text_id"], "segments": self.segment_diff.changed_segments}
+            if batched:
+                response = self.upload_segments_to_webuddhist_in_batches(
+                    changed_payload,
+                    token,
+                    max_batch_bytes=max_batch_bytes,
+                    max_batch_segments=max_batch_segments,
+                    journal=journal,
+                )
+            else:
+                checkpoint_key = f"segments:{self.payload_data['text_id']}:diff:{get_json_hash(changed_payload)}"
+                response = self.upload_segments_with_checkpoint(changed_payload, token, checkpoint_key, journal)
+            uploaded_ids = [segment["id"] for segment in response["segments"]]
+
+        look_up_list = self.store_segment_content_with_segment_id_in_json(
+            {"text_id": self.payload_data["text_id"], "segments": self.segment_diff.get_segments(uploaded_ids)}
+        )
+        self.logger.info(f"Segments updated successfully for text_id: {self.payload_data['text_id']}")
+        return look_up_list
+
+    def upload_segments(self, batched=False, max_batch_bytes=None, max_batch_segments=None, token=None, journal=None, diff=False):
+        """
+        Uploads the payload and writes the segment content with segment id file. Returns the
+        segment_content -> id list, or None when streaming (it is then only written to the file).
+        With diff, only the segments changed since the last upload are sent.
+        """
+        if diff:
+            if self.stream:
+                raise ValueError("A diff upload needs the whole payload, it cannot be streamed")
+            return self.upload_segments_diff(
+                batched=batched,
+                max_batch_bytes=max_batch_bytes,
+                max_batch_segments=max_batch_segments,
+                token=token,
+                journal=journal,
+            )
 
-        logger.info("Segments uploaded successfully for text_id: ", self.payload_data["text_id"])
+        if self.stream:
+            return self.upload_segments_streaming(
+                max_batch_bytes=max_batch_bytes,
+                max_batch_segments=max_batch_segments,
+                token=token,
+                journal=journal,
+            )
+
+        token = token or get_token()
+        if batched:
+            response = self.upload_segments_to_webuddhist_in_batches(
+                self.payload_data,
+                token,
+                max_batch_bytes=max_batch_bytes,
+                max_batch_segments=max_batch_segments,
+                journal=journal,
+            )
+        else:
+            checkpoint_key = f"segments:{self.payload_data['text_id']}:all:{get_json_hash(self.payload_data)}"
+            response = self.upload_segments_with_checkpoint(self.payload_data, token, checkpoint_key, journal)
+        look_up_list = self.store_segment_content_with_segment_id_in_json(response)
+
+        self.logger.info(f"Segments uploaded successfully for text_id: {self.payload_data['text_id']}")
+        return look_up_list
 
 
 if __name__ == "__main__":
-    
-    segment_uploader = SegmentUploader()
+    parser = argparse.ArgumentParser(description="Upload text segments to webuddhist")
+    parser.add_argument("--batch", action="store_true", help="Upload segments in size-capped batches")
+    parser.add_argument("--max-batch-bytes", type=int, default=None, help="Maximum request body size per batch")
+    parser.add_argument("--max-batch-segments", type=int, default=None, help="Maximum number of segments per batch")
+    parser.add_argument("--stream", action="store_true", help="Read the payload and write the response file incrementally, uploading batches while parsing")
+    parser.add_argument("--resume", action="store_true", help="Skip batches already uploaded by a previous interrupted run")
+    parser.add_argument("--diff", action="store_true", help="Only upload segments inserted or changed since the last upload, reusing the other ids")
+    parser.add_argument("--metrics-path", default=None, help="JSON lines file for the timing spans (defaults to WEBUDDHIST_METRICS_PATH)")
+    args = parser.parse_args()
 
-    segment_uploader.upload_segments()
-    
\ No newline at end of file
+    with metrics_run("segment_upload", metrics_path=args.metrics_path):
+        segment_uploader = SegmentUploader(stream=args.stream)
+
+        segment_uploader.upload_segments(
+            batched=args.batch,
+            max_batch_bytes=args.max_batch_bytes,
+            max_batch_segments=args.max_batch_segments,
+            diff=args.diff,
+            journal=UploadJournal(
+                get_journal_path(f"{segment_uploader.text_name}_{segment_uploader.root_or_commentary}_segments"),
+                resume=args.resume,
+            ),
+        )
@@ -1,4 +1,4 @@
-import requests
+import argparse
 import logging
 import sys
 from pathlib import Path
@@ -14,9 +14,15 @@ DATA_DIR = BASE_DIR / "data"
 from config import config
 from utils import (
     get_token,
-    read_json_file,
-    fuzzy_match
+    get_json_hash,
+    read_json_file
 )
+from artifact_cache import ArtifactCache, get_default_artifact_cache, get_look_up_list_key
+from lookup_store import open_lookup_store
+from metrics import metrics_run, span
+from segment_index import DEFAULT_FUZZY_WINDOW, SegmentContentIndex
+from upload_journal import UploadJournal, get_journal_path
+from webuddhist_client import WebBuddhistClient, check_response, get_default_client
 
 LOG_FILE = "toc_upload_log.txt"
 
@@ -29,57 +35,145 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Part of the cache key of resolved TOC payloads, bump it when the segment matching changes
+TOC_RESOLVE_VERSION = 2
+
 class TableOfContentsUploader:
-    def __init__(self, toc_upload_url: str = None):
-        self.text_name = input("Enter the text name: ")
-        self.root_or_commentary = input("Enter the root or commentary_[1,2,3]: ")
-        self.payload_data_file_path = str(
+    # Cache of resolved TOC payloads, nothing is cached when not set
+    artifact_cache: ArtifactCache = None
+
+    def __init__(
+        self,
+        toc_upload_url: str = None,
+        client: WebBuddhistClient = None,
+        text_name: str = None,
+        root_or_commentary: str = None,
+        payload_data_file_path: str = None,
+        text_id_look_up_list=None,
+        text_id: str = None,
+        artifact_cache: ArtifactCache = None,
+    ):
+        """
+        Values not given are asked for interactively. text_id_look_up_list is the
+        segment_content -> id list returned by the segment upload (read from the api_response
+        file when not given) and text_id overrides the text_id of the TOC payload.
+        Resolved TOC payloads are cached in artifact_cache (WEBUDDHIST_ARTIFACT_CACHE_DIR by default).
+        """
+        self.artifact_cache = artifact_cache or get_default_artifact_cache()
+        self.text_name = text_name or input("Enter the text name: ")
+        self.root_or_commentary = root_or_commentary or input("Enter the root or commentary_[1,2,3]: ")
+        self.payload_data_file_path = payload_data_file_path or str(
             DATA_DIR
             / self.text_name
             / f"{self.text_name}_payload"
             / f"{self.text_name}_{self.root_or_commentary}_text_toc_payload.json"
         )
         self.payload_data = read_json_file(self.payload_data_file_path)
+        if text_id is not None:
+            self.payload_data["text_id"] = text_id
         self.toc_upload_url = toc_upload_url or config.get_toc_url()
+        self.client = client or get_default_client()
         self.text_id_look_up_json_path = str(
             DATA_DIR
             / self.text_name
             / f"{self.text_name}_api_response"
             / f"{self.text_name}_{self.root_or_commentary}_segment_content_with_segment_id.json"
         )
-        self.text_id_look_up_list = read_json_file(self.text_id_look_up_json_path)
+        if text_id_look_up_list is not None:
+            self.text_id_look_up_list = text_id_look_up_list
+            return
+        # A converted lookup store is memory-mapped instead of parsing the JSON file
+        look_up_store = open_lookup_store(self.text_id_look_up_json_path)
+        self.text_id_look_up_list = look_up_store if look_up_store is not None else read_json_file(self.text_id_look_up_json_path)
 
     def upload_toc_to_webuddhist(self, payload_data, token):
-        response = requests.post(self.toc_upload_url, json=payload_data, headers={"Authorization": f"Bearer {token}"})
+        response = self.client.post(self.toc_upload_url, json=payload_data, token=token)
+        check_response(response)
         return response.json()
 
-    def search_matching_content_index(self, content, look_up_list, last_found):
-        for i in range(last_found, len(look_up_list)):
-            if fuzzy_match(look_up_list[i]["segment_content"], content):
-                return i
-        raise ValueError(f"Content {content} not found in look_up_list")
+    def search_matching_content_index(self, content, look_up_list, last_found, segment_index=None):
+        segment_index = segment_index or SegmentContentIndex(look_up_list)
+        return segment_index.find(content, last_found)
 
     def replace_segment_content_with_id_in_toc(self, payload_data, text_id_look_up_list):
+        """
+        Replaces the segment contents of the TOC sections with their segment ids, in place.
+        A payload already resolved against the same look up list is taken from the artifact cache.
+        """
+        if self.artifact_cache is None:
+            return self.resolve_segment_ids_in_toc(payload_data, text_id_look_up_list)
+
+        with span("toc_cache_key"):
+            cache_key = ArtifactCache.get_key(
+                "toc_resolve",
+                TOC_RESOLVE_VERSION,
+                threshold=0.95,
+                fuzzy_window=DEFAULT_FUZZY_WINDOW,
+                payload_data=payload_data,
+                look_up_list=get_look_up_list_key(text_id_look_up_list),
+            )
+        cached = self.artifact_cache.get("toc_resolve", cache_key)
+        if cached is not None:
+            payload_data.update(cached["payload_data"])
+            self.match_stats = cached["match_stats"]
+            return payload_data
+
+        self.resolve_segment_ids_in_toc(payload_data, text_id_look_up_list)
+        self.artifact_cache.put("toc_resolve", cache_key, {"payload_data": payload_data, "match_stats": self.match_stats})
+        return payload_data
+
+    def resolve_segment_ids_in_toc(self, payload_data, text_id_look_up_list):
+        segment_index = SegmentContentIndex(text_id_look_up_list)
         last_found = 0
-        for section in payload_data["sections"]:
-            for segment in section["segments"]:
-                found_index = self.search_matching_content_index(content = segment['segment_id'], look_up_list = text_id_look_up_list, last_found = last_found)
-                segment['segment_id'] = text_id_look_up_list[found_index]["id"]
-                last_found = found_index + 1
+        with span("toc_resolve") as resolve_span:
+            for section in payload_data["sections"]:
+                for segment in section["segments"]:
+                    found_index = self.search_matching_content_index(content = segment['segment_id'], look_up_list = text_id_look_up_list, last_found = last_found, segment_index = segment_index)
+                    segment['segment_id'] = text_id_look_up_list[found_index]["id"]
+                    last_found = found_index + 1
+
+            self.match_stats = segment_index.get_stats()
+            resolve_span.set(
+                items=self.match_stats["exact_matches"] + self.match_stats["fuzzy_matches"],
+                fuzzy_comparisons=self.match_stats["fuzzy_comparisons"],
+            )
+        logger.info(
+            f"Resolved TOC segments: {self.match_stats['exact_matches']} exact "
+            f"({self.match_stats['exact_seconds']}s), {self.match_stats['fuzzy_matches']} fuzzy "
+            f"with {self.match_stats['fuzzy_comparisons']} comparisons ({self.match_stats['fuzzy_seconds']}s)"
+        )
         return payload_data
 
-    def upload_toc(self):
-        token = get_token()
+    def upload_toc(self, token=None, journal=None):
         updated_toc_data = self.replace_segment_content_with_id_in_toc(self.payload_data, self.text_id_look_up_list)
+
+        checkpoint_key = f"toc:{updated_toc_data['text_id']}:{get_json_hash(updated_toc_data)}"
+        if journal is not None and journal.is_done(checkpoint_key):
+            logger.info(f"Skipping {checkpoint_key}, already uploaded")
+            return journal.get_result(checkpoint_key)
+
+        token = token or get_token()
         response = self.upload_toc_to_webuddhist(updated_toc_data, token)
-        logger.info("Table of contents uploaded successfully for text_id: ", self.payload_data["text_id"])
+        if journal is not None:
+            journal.record(checkpoint_key, response)
+        logger.info(f"Table of contents uploaded successfully for text_id: {self.payload_data['text_id']}")
         return response
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload a table of contents to webuddhist")
+    parser.add_argument("--resume", action="store_true", help="Skip the upload if a previous run already completed it")
+    parser.add_argument("--metrics-path", default=None, help="JSON lines file for the timing spans (defaults to WEBUDDHIST_METRICS_PATH)")
+    args = parser.parse_args()
 
-    toc_uploader = TableOfContentsUploader()
+    with metrics_run("toc_upload", metrics_path=args.metrics_path):
+        toc_uploader = TableOfContentsUploader()
 
-    response = toc_uploader.upload_toc()
+        response = toc_uploader.upload_toc(
+            journal=UploadJournal(
+                get_journal_path(f"{toc_uploader.text_name}_{toc_uploader.root_or_commentary}_toc"),
+                resume=args.resume,
+            )
+        )
 
     print(response)
 
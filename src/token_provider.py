@@ -0,0 +1,191 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, the cache then works without an inter-process lock
+    fcntl = None
+
+from config import config
+from metrics import span
+from webuddhist_client import WebBuddhistClient, check_response, get_default_client
+
+logger = logging.getLogger(__name__)
+
+
+def decode_jwt_expiry(token: str) -> Optional[float]:
+    """
+    Returns the `exp` claim (seconds since epoch) of a JWT without verifying it,
+    or None if the token is not a JWT or has no expiry.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenProvider:
+    """
+    Hands out a webuddhist access token, logging in only when needed.
+    The token is cached in memory and in a user-only file (keyed by API base URL),
+    so every uploader in a process and concurrent processes share one login.
+    A cached token is refreshed once it is within refresh_margin_seconds of its expiry.
+    """
+
+    def __init__(
+        self,
+        cache_path: str = None,
+        refresh_margin_seconds: int = None,
+        client: WebBuddhistClient = None,
+        email: str = None,
+        password: str = None,
+    ):
+        self.cache_path = Path(os.path.expanduser(cache_path or config.TOKEN_CACHE_PATH))
+        self.refresh_margin_seconds = (
+            config.TOKEN_REFRESH_MARGIN_SECONDS if refresh_margin_seconds is None else refresh_margin_seconds
+        )
+        self.client = client
+        self.email = email
+        self.password = password
+        self.cache_key = config.API_BASE_URL.rstrip("/")
+        self._token = None
+        self._expires_at = None
+        # Rejected token -> the token obtained in its place
+        self._replaced_tokens = {}
+        self._lock = threading.Lock()
+
+    def is_valid(self, token: Optional[str], expires_at: Optional[float]) -> bool:
+        if not token:
+            return False
+        if expires_at is None:
+            return True
+        return time.time() < expires_at - self.refresh_margin_seconds
+
+    def get_token(self) -> str:
+        with self._lock:
+            return self._get_token()
+
+    def _get_token(self) -> str:
+        if self.is_valid(self._token, self._expires_at):
+            return self._token
+
+        with span("token_fetch") as token_span, self._cache_file_lock():
+            cached = self._read_cache()
+            if cached and self.is_valid(cached.get("access_token"), cached.get("expires_at")):
+                logger.info("Using cached token")
+                token_span.set(source="cache")
+                self._token, self._expires_at = cached["access_token"], cached.get("expires_at")
+                return self._token
+
+            token_span.set(source="login")
+            token = self.login()
+            expires_at = decode_jwt_expiry(token)
+            if expires_at is not None:
+                # Tokens without an expiry are only kept for this process
+                self._write_cache({"access_token": token, "expires_at": expires_at})
+            self._token, self._expires_at = token, expires_at
+            return token
+
+    def invalidate(self, token: str = None):
+        """Drops the current token (only if it is token, when given), e.g. after the API rejected it."""
+        with self._lock:
+            self._drop_token(token)
+
+    def _drop_token(self, token: str = None):
+        if token is None or self._token == token:
+            self._token, self._expires_at = None, None
+        with self._cache_file_lock():
+            cache = self._read_cache_file()
+            cached = cache.get(self.cache_key)
+            if cached is not None and (token is None or cached.get("access_token") == token):
+                del cache[self.cache_key]
+                self._write_cache_file(cache)
+
+    def refresh(self, rejected_token: str) -> Optional[str]:
+        """
+        Logs in again after the API answered rejected_token with 401 and returns the new token,
+        or None when rejected_token was not handed out by this provider. Threads that were
+        rejected with the same token share one login.
+        """
+        with self._lock:
+            replaced_by = self._replaced_tokens.get(rejected_token)
+            if replaced_by is not None:
+                return replaced_by
+            if rejected_token != self._token:
+                return None
+            logger.warning("Token rejected by the API, logging in again")
+            self._drop_token(rejected_token)
+            token = self._replaced_tokens[rejected_token] = self._get_token()
+            return token
+
+    def login(self) -> str:
+        email = self.email or config.EMAIL or input("Enter your email: ")
+        password = self.password or config.PASSWORD or input("Enter your password: ")
+
+        client = self.client or get_default_client()
+        response = client.post(config.get_auth_url(), json={"email": email, "password": password})
+        logger.info(f"Token obtained, {response.status_code}")
+        check_response(response)
+        return response.json()["auth"]["access_token"]
+
+    @contextmanager
+    def _cache_file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        lock_file_descriptor = os.open(str(self.cache_path) + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(lock_file_descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(lock_file_descriptor, fcntl.LOCK_UN)
+            os.close(lock_file_descriptor)
+
+    def _read_cache_file(self) -> dict:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return cache if isinstance(cache, dict) else {}
+
+    def _read_cache(self) -> Optional[dict]:
+        return self._read_cache_file().get(self.cache_key)
+
+    def _write_cache(self, entry: dict):
+        cache = self._read_cache_file()
+        cache[self.cache_key] = entry
+        self._write_cache_file(cache)
+
+    def _write_cache_file(self, cache: dict):
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        temp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        file_descriptor = os.open(temp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            json.dump(cache, file)
+        os.replace(temp_path, self.cache_path)
+
+
+_default_token_provider = None
+_default_token_provider_lock = threading.Lock()
+
+
+def get_default_token_provider() -> TokenProvider:
+    """Returns the process-wide token provider shared by all uploaders."""
+    global _default_token_provider
+    with _default_token_provider_lock:
+        if _default_token_provider is None:
+            _default_token_provider = TokenProvider()
+        return _default_token_provider
@@ -0,0 +1,158 @@
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Ensure project root is on sys.path so we can import config and utils
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+PROJECT_ROOT = Path(project_root)
+DEFAULT_PAYLOAD_DIR = PROJECT_ROOT / "pecha_segment_upload_payload"
+
+# Configured before the uploaders are imported so their log files are left alone
+logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.WARNING)
+logger = logging.getLogger("upload_benchmark")
+logger.setLevel(logging.INFO)
+
+from config import Config, config
+from corpus_uploader import CorpusUploader, discover_upload_jobs
+from local_api_server import LocalAPIServer
+from token_provider import TokenProvider
+from utils import read_json_file, write_json_file
+from webuddhist_client import WebBuddhistClient
+
+
+def count_segments(jobs) -> int:
+    return sum(len(read_json_file(job["payload_data_file_path"])["segments"]) for job in jobs)
+
+
+def run_upload_benchmark(
+    jobs,
+    base_url: str,
+    workers: int,
+    batched: bool = True,
+    stream: bool = False,
+    max_batch_bytes: int = None,
+    max_batch_segments: int = None,
+    backoff_base_seconds: float = 0.1,
+    backoff_max_seconds: float = 2.0,
+) -> dict:
+    """Uploads every job to base_url with CorpusUploader and returns the elapsed time and throughput."""
+    payload_bytes = sum(Path(job["payload_data_file_path"]).stat().st_size for job in jobs)
+    segment_count = count_segments(jobs)
+
+    # Every config URL (auth, segments, ...) points at the server for the run
+    original_base_url = Config.API_BASE_URL
+    Config.API_BASE_URL = base_url
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir, WebBuddhistClient(
+            base_url=base_url,
+            pool_size=max(workers, config.HTTP_POOL_SIZE),
+            backoff_base_seconds=backoff_base_seconds,
+            backoff_max_seconds=backoff_max_seconds,
+        ) as client:
+            token = TokenProvider(
+                cache_path=str(Path(temp_dir) / "token.json"),
+                client=client,
+                email="benchmark@example.com",
+                password="benchmark",
+            ).get_token()
+            corpus_uploader = CorpusUploader(
+                jobs,
+                max_workers=workers,
+                output_dir=str(Path(temp_dir) / "api_response"),
+                log_dir=str(Path(temp_dir) / "logs"),
+                batched=batched,
+                stream=stream,
+                max_batch_bytes=max_batch_bytes,
+                max_batch_segments=max_batch_segments,
+                client=client,
+                journal_dir=str(Path(temp_dir) / "journals"),
+            )
+            start_time = time.perf_counter()
+            results = corpus_uploader.run(token=token)
+            elapsed = time.perf_counter() - start_time
+    finally:
+        Config.API_BASE_URL = original_base_url
+
+    return {
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "texts": len(jobs),
+        "uploaded_texts": sum(result["status"] == "uploaded" for result in results),
+        "segments": segment_count,
+        "payload_bytes": payload_bytes,
+        "segments_per_second": round(segment_count / elapsed, 2) if elapsed else None,
+        "megabytes_per_second": round(payload_bytes / 2**20 / elapsed, 3) if elapsed else None,
+        "flow_control": client.flow_controller.get_stats() if client.flow_controller is not None else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure corpus upload throughput against the local API stand-in")
+    parser.add_argument("paths", nargs="*", help="Payload directories or files (defaults to pecha_segment_upload_payload)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="Worker counts to compare")
+    parser.add_argument("--no-batch", action="store_true", help="Upload each text in a single request")
+    parser.add_argument("--stream", action="store_true", help="Stream payloads in batches")
+    parser.add_argument("--max-batch-bytes", type=int, default=None, help="Maximum request body size per batch")
+    parser.add_argument("--max-batch-segments", type=int, default=None, help="Maximum number of segments per batch")
+    parser.add_argument("--base-url", default=None, help="Use an already running server instead of starting one")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--bytes-per-second", type=float, default=None, help="Request body throughput cap")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with a 5xx")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Requests the server handles at once, more are answered with 503")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency jitter and fault injection")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    jobs = discover_upload_jobs(args.paths or [DEFAULT_PAYLOAD_DIR])
+    runs = []
+    for workers in args.workers:
+        server = None
+        if args.base_url is None:
+            server = LocalAPIServer(
+                latency_seconds=args.latency,
+                latency_jitter_seconds=args.latency_jitter,
+                bytes_per_second=args.bytes_per_second,
+                rate_limit_rate=args.rate_limit_rate,
+                server_error_rate=args.server_error_rate,
+                retry_after_seconds=0,
+                seed=args.seed,
+                max_in_flight=args.max_in_flight,
+            ).start()
+        try:
+            run = run_upload_benchmark(
+                jobs,
+                args.base_url or server.url,
+                workers,
+                batched=not args.no_batch,
+                stream=args.stream,
+                max_batch_bytes=args.max_batch_bytes,
+                max_batch_segments=args.max_batch_segments,
+            )
+        finally:
+            if server is not None:
+                server.stop()
+        if server is not None:
+            run["server"] = server.get_stats()
+        runs.append(run)
+        print(
+            f"workers {run['workers']:>3}: {run['seconds']:>8.2f}s  {run['segments_per_second']:>9.1f} segments/s  "
+            f"{run['megabytes_per_second']:>6.2f} MB/s  {run['uploaded_texts']}/{run['texts']} texts uploaded"
+            + (f"  responses {run['server']['responses_by_status']}" if "server" in run else "")
+        )
+
+    if args.output:
+        write_json_file(
+            {"created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "runs": runs},
+            args.output,
+            pretty=True,
+            compress=False,
+        )
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+def get_journal_path(job_name: str) -> Path:
+    """Returns the default journal file for an upload job."""
+    return Path(config.UPLOAD_JOURNAL_DIR) / f"{job_name}.jsonl"
+
+
+class UploadJournal:
+    """
+    Durable checkpoint journal for one upload job.
+    Every completed step (a segment batch, a TOC, a mapping chunk, a whole text) is appended
+    as one JSON line together with what the server returned, and fsynced, so an interrupted
+    run can be resumed by skipping the steps already recorded.
+    Keys should include a hash of the uploaded data so a changed payload is never skipped.
+    """
+
+    def __init__(self, path, resume: bool = True):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if resume:
+            self.load()
+        else:
+            self.reset()
+
+    def load(self):
+        self.entries = {}
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash while appending can leave a truncated last line
+                    logger.warning(f"Ignoring incomplete journal line in {self.path}")
+                    continue
+                self.entries[entry["key"]] = entry.get("result")
+        logger.info(f"Loaded {len(self.entries)} completed steps from {self.path}")
+
+    def reset(self):
+        self.entries = {}
+        if self.path.exists():
+            self.path.unlink()
+
+    def is_done(self, key: str) -> bool:
+        return key in self.entries
+
+    def get_result(self, key: str):
+        return self.entries.get(key)
+
+    def record(self, key: str, result=None):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps({"key": key, "result": result}, ensure_ascii=False) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            self.entries[key] = result
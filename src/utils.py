@@ -1,39 +1,109 @@
-import requests
+import gzip
 import json
-from typing import Any, Dict, Iterator, List, Optional
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
 import hashlib
-import unicodedata
 import Levenshtein
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import JaroWinkler
 
+try:
+    import numpy
+except ImportError:  # process.cdist needs numpy, FuzzyMatcher.match_matrix then scores one query at a time
+    numpy = None
+
+from canonical_text import canonicalize, show_hidden_literals
 from config import config
+from json_stream import COMPACT_SEPARATORS, GZIP_COMPRESS_LEVEL, open_json_file
+from metrics import span
+from token_provider import get_default_token_provider
 
 def get_token():
-    # Try to get credentials from environment first
-    email = config.EMAIL or input("Enter your email: ")
-    password = config.PASSWORD or input("Enter your password: ")
-    
-    auth_url = config.get_auth_url()
-    response = requests.post(auth_url, json={"email": email, "password": password})
-    return response.json()["auth"]["access_token"]
+    """
+    Returns a cached access token, logging in only when there is no cached token
+    or it is about to expire. See token_provider.TokenProvider.
+    """
+    return get_default_token_provider().get_token()
 
 def read_json_file(file_path):
-
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = json.load(file)
+    """Reads a JSON file written plain or gzip-compressed (detected from its content)."""
+    with span("read_json", path=str(file_path)) as read_span:
+        with open_json_file(file_path) as file:
+            data = json.load(file)
+        read_span.set(bytes=os.path.getsize(file_path))
+        if isinstance(data, list):
+            read_span.set(items=len(data))
 
     return data
 
+def get_json_indent(pretty: bool = None) -> Optional[int]:
+    """Indentation of written JSON files: 4 in pretty mode (WEBUDDHIST_JSON_PRETTY by default), none otherwise."""
+    pretty = config.JSON_PRETTY if pretty is None else pretty
+    return 4 if pretty else None
+
+def write_json_file(data, file_path, pretty: bool = None, compress: bool = None):
+    """
+    Writes data as UTF-8 JSON, compact (no whitespace) unless pretty, and gzip-compressed
+    with compress. pretty and compress default to WEBUDDHIST_JSON_PRETTY and WEBUDDHIST_JSON_GZIP.
+    read_json_file reads every combination back.
+    """
+    indent = get_json_indent(pretty)
+    compress = config.JSON_GZIP if compress is None else compress
+    with span("write_json", path=str(file_path), compressed=compress) as write_span:
+        serialized = json.dumps(data, ensure_ascii=False, indent=indent, separators=None if indent else COMPACT_SEPARATORS)
+        body = serialized.encode("utf-8")
+        if compress:
+            body = gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+        with open(file_path, "wb") as file:
+            file.write(body)
+        write_span.set(bytes=len(body))
+        if isinstance(data, list):
+            write_span.set(items=len(data))
+
+def get_json_hash(data) -> str:
+    """Returns a stable sha256 hex digest of JSON-serializable data."""
+    serialized = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+def get_segment_hash(segment_content: str) -> str:
+    """Fingerprint of a segment's exact content, stored next to its id in the api_response files."""
+    return hashlib.sha256(segment_content.encode("utf-8")).hexdigest()
+
+def get_json_size_in_bytes(data) -> int:
+    """Size of data as it is serialized in a JSON request body."""
+    return len(json.dumps(data).encode("utf-8"))
+
+def iter_size_capped_batches(items, max_batch_bytes: int, max_batch_items: int):
+    """
+    Yields ordered batches of items capped by serialized size and by count, consuming
+    items lazily. An item larger than max_batch_bytes is sent on its own batch.
+    """
+    current_batch = []
+    current_batch_bytes = 0
+    for item in items:
+        item_bytes = get_json_size_in_bytes(item)
+        if current_batch and (
+            current_batch_bytes + item_bytes > max_batch_bytes
+            or len(current_batch) >= max_batch_items
+        ):
+            yield current_batch
+            current_batch = []
+            current_batch_bytes = 0
+        current_batch.append(item)
+        current_batch_bytes += item_bytes
+    if current_batch:
+        yield current_batch
+
 def temp_json_write(data):
-    with open("temp.json", "w", encoding="utf-8") as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    write_json_file(data, "temp.json")
 
 
     # INSERT_YOUR_CODE
 def fuzzy_match(a: str, b: str, threshold: float = 0.95) -> bool:
     """
     Returns True if the similarity ratio between a and b is greater than or equal to the threshold percentage.
-    Uses a simple Levenshtein distance algorithm for similarity.
+    Canonical forms (see canonical_text.canonicalize) are compared exactly first,
+    the Jaro-Winkler similarity is only computed when they differ.
     """
 
     if not a and not b:
@@ -41,6 +111,10 @@ def fuzzy_match(a: str, b: str, threshold: float = 0.95) -> bool:
     if not a or not b:
         return False
 
+    a, b = canonicalize(a), canonicalize(b)
+    if a == b:
+        return True
+
     distance = Levenshtein.jaro_winkler(a, b)
 
     return distance >= threshold
@@ -50,7 +124,8 @@ def fuzzy_substring_match(substring: str, text: str, threshold: float = 0.95) ->
     """
     Returns True if the substring fuzzy-matches any part of the text with a similarity 
     ratio greater than or equal to the threshold percentage.
-    Uses partial_ratio for substring matching within larger text.
+    Canonical forms are checked for exact containment first, partial_ratio is only
+    used for substring matching within larger text when that fails.
     """
 
     if not substring and not text:
@@ -58,37 +133,144 @@ def fuzzy_substring_match(substring: str, text: str, threshold: float = 0.95) ->
     if not substring or not text:
         return False
 
+    substring, text = canonicalize(substring), canonicalize(text)
+    if substring in text:
+        return True
+
     similarity = fuzz.partial_ratio(substring, text) / 100.0
 
     return similarity >= threshold
 
 
-    # INSERT_YOUR_CODE
-def show_hidden_literals(text: str) -> str:
+# Candidates scored per batch call double from the first size to the maximum, so a match right
+# after the start position (the common case of the monotonic scans) costs one comparison while
+# a long scan needs few calls
+FUZZY_FIRST_BLOCK_SIZE = 1
+FUZZY_MAX_BLOCK_SIZE = 1024
+
+
+class FuzzyMatcher:
     """
-    Returns a string where hidden/zero-width characters are replaced with their Unicode codepoint in brackets.
-    Useful for visualizing invisible characters like zero-width space, joiner, etc.
+    Scores queries against a sequence of candidates with rapidfuzz's batch functions instead of
+    one fuzzy_match / fuzzy_substring_match call per pair. Every result is the one the per-pair
+    functions give with the same threshold: candidates are canonicalized the same way (once each,
+    on first use), rapidfuzz's Jaro-Winkler is the implementation behind Levenshtein.jaro_winkler
+    and the score cutoffs make rapidfuzz skip the candidates that cannot reach the threshold.
+
+    find and find_substring return the first matching candidate, like the existing scans, so
+    they score blocks of candidates with process.extract rather than taking the best match
+    of process.extractOne. match_matrix scores many queries against every candidate with
+    process.cdist on `workers` threads (-1 for all cores, see WEBUDDHIST_FUZZY_WORKERS).
     """
-    # List of common zero-width and hidden characters
-    hidden_chars = [
-        '\u200B', # ZERO WIDTH SPACE
-        '\u200C', # ZERO WIDTH NON-JOINER
-        '\u200D', # ZERO WIDTH JOINER
-        '\u2060', # WORD JOINER
-        '\uFEFF', # ZERO WIDTH NO-BREAK SPACE
-        '\u180E', # MONGOLIAN VOWEL SEPARATOR
-        '\u202A', # LEFT-TO-RIGHT EMBEDDING
-        '\u202B', # RIGHT-TO-LEFT EMBEDDING
-        '\u202C', # POP DIRECTIONAL FORMATTING
-        '\u202D', # LEFT-TO-RIGHT OVERRIDE
-        '\u202E', # RIGHT-TO-LEFT OVERRIDE
-    ]
-    def replace_hidden(c):
-        if c in hidden_chars:
-            name = unicodedata.name(c, "UNKNOWN")
-            return f"[U+{ord(c):04X} {name}]"
-        return c
-    return ''.join(replace_hidden(c) for c in text)
+
+    def __init__(self, candidates: Sequence, threshold: float = 0.95, key: Callable = None, workers: int = None):
+        self.candidates = candidates
+        self.threshold = threshold
+        self.key = key
+        self.workers = workers if workers is not None else config.FUZZY_WORKERS
+        # None: not canonicalized yet, False: empty candidate (only matches an empty query)
+        self.canonical_candidates = [None] * len(candidates)
+        self.comparisons = 0
+        # Score of the last match found, as a similarity in [0, 1]
+        self.last_score = None
+
+    def get_canonical_candidates(self, start: int, end: int) -> list:
+        canonical_candidates = self.canonical_candidates
+        for index in range(start, end):
+            if canonical_candidates[index] is None:
+                candidate = self.candidates[index]
+                if self.key is not None:
+                    candidate = self.key(candidate)
+                canonical_candidates[index] = canonicalize(candidate) if candidate else False
+        # rapidfuzz skips None choices, so empty candidates are never scored
+        return [candidate if candidate is not False else None for candidate in canonical_candidates[start:end]]
+
+    def find_first(self, query: str, start: int, end: Optional[int], scorer, score_cutoff: float, is_match) -> Optional[int]:
+        end = len(self.candidates) if end is None else min(end, len(self.candidates))
+        block_size = FUZZY_FIRST_BLOCK_SIZE
+        block_start = start
+        while block_start < end:
+            block_end = min(end, block_start + block_size)
+            block = self.get_canonical_candidates(block_start, block_end)
+            if not query:
+                # An empty query matches any candidate that is empty (or canonical empty for fuzzy_match)
+                matches = [(index, 1.0) for index, candidate in enumerate(block) if is_match(candidate, None)]
+            else:
+                matches = [
+                    (index, score)
+                    for _, score, index in process.extract(query, block, scorer=scorer, score_cutoff=score_cutoff, limit=None)
+                    if is_match(block[index], score)
+                ]
+            if matches:
+                index, self.last_score = min(matches)
+                self.comparisons += index + 1
+                return block_start + index
+            self.comparisons += block_end - block_start
+            block_start = block_end
+            block_size = min(block_size * 2, FUZZY_MAX_BLOCK_SIZE)
+        return None
+
+    def find(self, query: str, start: int = 0, end: int = None) -> Optional[int]:
+        """Index of the first candidate in [start, end) for which fuzzy_match(candidate, query) is True."""
+        if not query:
+            return self.find_first("", start, end, None, None, lambda candidate, _: candidate is None)
+        canonical_query = canonicalize(query)
+        if not canonical_query:
+            return self.find_first("", start, end, None, None, lambda candidate, _: candidate == "")
+        return self.find_first(
+            canonical_query, start, end, JaroWinkler.similarity, self.threshold,
+            lambda candidate, score: score >= self.threshold,
+        )
+
+    def find_substring(self, query: str, start: int = 0, end: int = None) -> Optional[int]:
+        """Index of the first candidate in [start, end) for which fuzzy_substring_match(query, candidate) is True."""
+        if not query:
+            return self.find_first("", start, end, None, None, lambda candidate, _: candidate is None)
+        canonical_query = canonicalize(query)
+        if not canonical_query:
+            # The empty canonical form is contained in every non-empty candidate
+            return self.find_first("", start, end, None, None, lambda candidate, _: candidate is not None)
+        # The cutoff is lowered by a rounding margin, the exact threshold is checked on score / 100
+        index = self.find_first(
+            canonical_query, start, end, fuzz.partial_ratio, self.threshold * 100 - 1e-6,
+            lambda candidate, score: score / 100.0 >= self.threshold,
+        )
+        if index is not None:
+            self.last_score /= 100.0
+        return index
+
+    def match_matrix(self, queries: Sequence[str]) -> List[List[bool]]:
+        """[query][candidate] -> fuzzy_match(candidate, query) for every query and candidate."""
+        candidates = self.get_canonical_candidates(0, len(self.candidates))
+        rows = [None] * len(queries)
+        scored_queries = []
+        for query_index, query in enumerate(queries):
+            canonical_query = canonicalize(query) if query else None
+            if not canonical_query:
+                # Empty queries only match empty candidates, canonical empty queries only canonical empty ones
+                rows[query_index] = [candidate == canonical_query for candidate in candidates]
+            else:
+                scored_queries.append((query_index, canonical_query))
+
+        if scored_queries:
+            scorable = [candidate if candidate else "" for candidate in candidates]
+            if numpy is not None:
+                scores = process.cdist(
+                    [query for _, query in scored_queries], scorable, scorer=JaroWinkler.similarity,
+                    score_cutoff=self.threshold, dtype=numpy.float64, workers=self.workers,
+                ).tolist()
+            else:
+                scores = [
+                    [JaroWinkler.similarity(query, candidate, score_cutoff=self.threshold) for candidate in scorable]
+                    for _, query in scored_queries
+                ]
+            for (query_index, _), query_scores in zip(scored_queries, scores):
+                rows[query_index] = [
+                    candidate is not None and score >= self.threshold for candidate, score in zip(candidates, query_scores)
+                ]
+        self.comparisons += len(queries) * len(candidates)
+        return rows
+
 
 def print_hidden_literals(text: str):
     """
@@ -0,0 +1,253 @@
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import config
+from flow_control import FlowController
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class WebBuddhistAPIError(Exception):
+    """Raised when the webuddhist API answers with a non-2xx status code."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+def get_body_size(body) -> int:
+    return len(body) if isinstance(body, (bytes, str)) else 0
+
+
+def get_gzip_json_body(data) -> bytes:
+    """data serialized like requests does for json= bodies, then gzip-compressed."""
+    return gzip.compress(json.dumps(data).encode("utf-8"))
+
+
+def get_retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """The Retry-After of a response in seconds (from seconds or an HTTP date), None without one."""
+    retry_after = response.headers.get("Retry-After")
+    if not isinstance(retry_after, str):
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def check_response(response: requests.Response) -> requests.Response:
+    """Raises WebBuddhistAPIError unless the response has a 2xx status code."""
+    if not 200 <= response.status_code < 300:
+        raise WebBuddhistAPIError(response.status_code, response.text)
+    return response
+
+
+class WebBuddhistClient:
+    """
+    Shared HTTP layer for the webuddhist uploaders.
+    Holds one keep-alive requests.Session with a connection pool so consecutive
+    calls reuse TCP/TLS connections instead of opening a new one per request.
+    Every attempt goes through the client's FlowController (see flow_control), so all
+    the uploaders and threads sharing a client share its rate and concurrency limits.
+    A token answered with 401 is replaced through the token provider (see token_provider)
+    and the request is sent once more with the new token.
+    """
+
+    def __init__(
+        self,
+        base_url: str = None,
+        token: str = None,
+        pool_size: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_retries: int = None,
+        backoff_base_seconds: float = None,
+        backoff_max_seconds: float = None,
+        gzip_requests: bool = None,
+        flow_controller: FlowController = None,
+        token_provider=None,
+    ):
+        self.base_url = (base_url or config.API_BASE_URL).rstrip("/")
+        self.pool_size = pool_size or config.HTTP_POOL_SIZE
+        self.timeout = (
+            connect_timeout or config.HTTP_CONNECT_TIMEOUT,
+            read_timeout or config.HTTP_READ_TIMEOUT,
+        )
+        self.max_retries = config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base_seconds = (
+            config.HTTP_BACKOFF_BASE_SECONDS if backoff_base_seconds is None else backoff_base_seconds
+        )
+        self.backoff_max_seconds = (
+            config.HTTP_BACKOFF_MAX_SECONDS if backoff_max_seconds is None else backoff_max_seconds
+        )
+
+        self.gzip_requests = config.HTTP_GZIP_REQUESTS if gzip_requests is None else gzip_requests
+        # Set once a server answers a gzip body with 415, later bodies are then sent uncompressed
+        self.gzip_rejected = False
+
+        if flow_controller is None and config.HTTP_FLOW_CONTROL:
+            flow_controller = FlowController()
+        self.flow_controller = flow_controller
+
+        # The process-wide token provider when not set
+        self.token_provider = token_provider
+        # Token rejected with 401 -> the token sent in its place
+        self.replaced_tokens = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if token:
+            self.set_token(token)
+
+    def set_token(self, token: str):
+        """Sets the default Authorization header sent with every request."""
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def build_url(self, url_or_endpoint: str) -> str:
+        """Returns absolute URLs unchanged and prefixes endpoints with the base URL."""
+        if url_or_endpoint.startswith(("http://", "https://")):
+            return url_or_endpoint
+        return f"{self.base_url}{url_or_endpoint}"
+
+    def get_backoff_seconds(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (starting at 0)."""
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt)))
+
+    def refresh_token(self, rejected_token: str) -> Optional[str]:
+        """The token replacing rejected_token, None when the token provider did not hand it out."""
+        token_provider = self.token_provider
+        if token_provider is None:
+            # Imported here, token_provider itself logs in through this module
+            from token_provider import get_default_token_provider
+
+            token_provider = get_default_token_provider()
+        token = token_provider.refresh(rejected_token)
+        if token is not None and token != rejected_token:
+            self.replaced_tokens[rejected_token] = token
+            return token
+        return None
+
+    def request(self, method: str, url: str, token: str = None, **kwargs) -> requests.Response:
+        """
+        Sends a request, retrying timeouts, connection errors and 5xx/429 responses
+        up to max_retries times, waiting at least their Retry-After when they have one.
+        A 401 to token is retried once with a new token (see refresh_token).
+        The last response (or error) is returned (or raised).
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        token = self.replaced_tokens.get(token, token)
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        kwargs.setdefault("timeout", self.timeout)
+        full_url = self.build_url(url)
+        path = urlsplit(full_url).path
+
+        attempt = 0
+        token_refreshed = False
+        while True:
+            retry_after_seconds = None
+            try:
+                with span(f"http {method} {path}", attempt=attempt) as request_span:
+                    flow_slot = self.flow_controller.acquire(path) if self.flow_controller is not None else None
+                    status_code = None
+                    try:
+                        response = self.session.request(method, full_url, headers=headers, **kwargs)
+                        status_code = response.status_code
+                        if status_code in RETRYABLE_STATUS_CODES:
+                            retry_after_seconds = get_retry_after_seconds(response)
+                    finally:
+                        if flow_slot is not None:
+                            self.flow_controller.release(flow_slot, status_code, retry_after_seconds)
+                            request_span.set(wait_seconds=round(flow_slot.wait_seconds, 6), concurrency_limit=flow_slot.limit)
+                    request_span.set(
+                        status=response.status_code,
+                        bytes=get_body_size(getattr(response.request, "body", None)),
+                        response_bytes=get_body_size(response.content),
+                    )
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                reason = type(e).__name__
+            else:
+                if response.status_code == 401 and token and not token_refreshed:
+                    token_refreshed = True
+                    new_token = self.refresh_token(token)
+                    if new_token is not None:
+                        token = new_token
+                        headers = dict(headers, Authorization=f"Bearer {token}")
+                        logger.warning(f"{method} {full_url} rejected the token (HTTP 401), retrying with a new one")
+                        continue
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                reason = f"HTTP {response.status_code}"
+
+            backoff_seconds = self.get_backoff_seconds(attempt)
+            if retry_after_seconds is not None:
+                backoff_seconds = max(backoff_seconds, retry_after_seconds)
+            attempt += 1
+            logger.warning(
+                f"{method} {full_url} failed ({reason}), retry {attempt}/{self.max_retries} in {backoff_seconds:.2f}s"
+            )
+            time.sleep(backoff_seconds)
+
+    def get(self, url: str, token: str = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, token=token, **kwargs)
+
+    def post(self, url: str, json=None, token: str = None, compress: bool = None, **kwargs) -> requests.Response:
+        """
+        With compress (gzip_requests by default), the json body is sent gzip-compressed with
+        Content-Encoding: gzip. A server answering 415 gets the body again uncompressed, and
+        no compressed body is sent to it afterwards.
+        """
+        compress = self.gzip_requests if compress is None else compress
+        if compress and json is not None and not self.gzip_rejected:
+            headers = dict(kwargs.get("headers") or {})
+            headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+            response = self.request(
+                "POST", url, token=token, data=get_gzip_json_body(json), **dict(kwargs, headers=headers)
+            )
+            if response.status_code != 415:
+                return response
+            logger.warning(f"POST {self.build_url(url)} does not accept gzip bodies, sending them uncompressed")
+            self.gzip_rejected = True
+        return self.request("POST", url, token=token, json=json, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> WebBuddhistClient:
+    """Returns the process-wide client shared by all uploaders."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = WebBuddhistClient()
+        return _default_client
@@ -1,6 +1,8 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 SRC_DIR = PROJECT_ROOT / "src"
@@ -13,3 +15,34 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 
+@pytest.fixture(autouse=True, scope="session")
+def artifact_cache_dir(tmp_path_factory):
+    """Keeps the artifacts cached by the tests out of the working tree."""
+    from config import Config
+
+    original_artifact_cache_dir = Config.ARTIFACT_CACHE_DIR
+    Config.ARTIFACT_CACHE_DIR = str(tmp_path_factory.mktemp("artifact_cache"))
+    yield Config.ARTIFACT_CACHE_DIR
+    Config.ARTIFACT_CACHE_DIR = original_artifact_cache_dir
+
+
+@pytest.fixture(autouse=True, scope="session")
+def upload_journal_dir(tmp_path_factory):
+    """Keeps the journals of the tests (fake ids under real payload hashes) away from the ones --resume reads."""
+    from config import Config
+
+    original_upload_journal_dir = Config.UPLOAD_JOURNAL_DIR
+    Config.UPLOAD_JOURNAL_DIR = str(tmp_path_factory.mktemp("upload_journals"))
+    yield Config.UPLOAD_JOURNAL_DIR
+    Config.UPLOAD_JOURNAL_DIR = original_upload_journal_dir
+
+
+@pytest.fixture(autouse=True, scope="session")
+def metrics_path(tmp_path_factory):
+    """Keeps the spans of runs started by the tests out of the metrics file of real runs."""
+    from config import Config
+
+    original_metrics_path = Config.METRICS_PATH
+    Config.METRICS_PATH = str(tmp_path_factory.mktemp("metrics") / "webuddhist_metrics.jsonl")
+    yield Config.METRICS_PATH
+    Config.METRICS_PATH = original_metrics_path
@@ -0,0 +1,93 @@
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mapping.parallel_mapping import (
+    ParallelMapping,
+    discover_mapping_jobs,
+    get_mapping_text_name,
+    read_text_ids,
+    run_mapping_job,
+)
+from mapping.text_mapping import CommentaryTextMapping
+from utils import read_json_file
+
+MAPPING_DIR = Path(__file__).parent.parent.parent / "src" / "mapping"
+HEART_SUTRA_MAPPING_DATA = MAPPING_DIR / "mapping_data" / "heart_sutra_mapping_data.json"
+TEXT_IDS = {"heart_sutra_root": "root_text_id", "heart_sutra_commentary_3": "commentary_text_id"}
+
+
+class TestParallelMapping(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.temp_dir.name)
+        self.jobs = discover_mapping_jobs(
+            [HEART_SUTRA_MAPPING_DATA], TEXT_IDS, output_dir=self.output_dir, plan_dir=self.output_dir / "plans"
+        )
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_discover_one_job_per_commentary(self):
+        self.assertEqual(get_mapping_text_name(HEART_SUTRA_MAPPING_DATA), "heart_sutra")
+        self.assertEqual(
+            [job["job"] for job in self.jobs],
+            ["heart_sutra_commentary_1", "heart_sutra_commentary_2", "heart_sutra_commentary_3"],
+        )
+        job = self.jobs[2]
+        self.assertEqual((job["root_text_id"], job["commentary_text_id"]), ("root_text_id", "commentary_text_id"))
+        self.assertEqual(
+            job["look_up_list_commentary_file_path"],
+            str(MAPPING_DIR / "lookup" / "commentary" / "heart_sutra_commentary_3_segment_content_with_segment_id.json"),
+        )
+        self.assertEqual(job["mapping_payload_file_path"], str(self.output_dir / "heart_sutra_commentary_3_mapping_payload.json"))
+
+    def test_read_text_ids_from_pipeline_results(self):
+        pipeline_results_path = self.output_dir / "pipeline_results.json"
+        with open(pipeline_results_path, "w", encoding="utf-8") as file:
+            json.dump({"texts": {"heart_sutra_root": {"text_id": "root_text_id"}, "heart_sutra_commentary_3": {"text_id": None}}, "stages": []}, file)
+
+        self.assertEqual(read_text_ids(pipeline_results_path), {"heart_sutra_root": "root_text_id"})
+
+    def test_results_are_in_job_order_and_match_a_serial_run(self):
+        results = ParallelMapping(self.jobs, max_workers=3).run()
+
+        self.assertEqual([result["job"] for result in results], [job["job"] for job in self.jobs])
+        # No text ids and no look up lists for commentaries 1 and 2
+        self.assertEqual([result["status"] for result in results], ["failed", "failed", "done"])
+        self.assertIn("No commentary_text_id", results[0]["error"])
+        parallel_payload = read_json_file(results[2]["mapping_payload_file_path"])
+
+        serial_job = dict(self.jobs[2], mapping_payload_file_path=str(self.output_dir / "serial_mapping_payload.json"))
+        serial_result = run_mapping_job(serial_job)
+
+        self.assertEqual(serial_result["text_mappings"], results[2]["text_mappings"])
+        self.assertEqual(read_json_file(serial_job["mapping_payload_file_path"]), parallel_payload)
+        self.assertTrue(all(text_mapping["text_id"] == "commentary_text_id" for text_mapping in parallel_payload["text_mappings"]))
+
+    def test_job_over_its_time_budget_is_stopped(self):
+        result = run_mapping_job(self.jobs[2], time_budget=1e-6)
+
+        self.assertEqual(result["status"], "timeout")
+        self.assertFalse(Path(self.jobs[2]["mapping_payload_file_path"]).exists())
+
+    def test_payload_write_is_not_interrupted_by_the_time_budget(self):
+        write_mapping_payload_to_file = CommentaryTextMapping.write_mapping_payload_to_file
+
+        def slow_write(text_mapping, mapping_payload):
+            time.sleep(1.2)
+            write_mapping_payload_to_file(text_mapping, mapping_payload)
+
+        with patch.object(CommentaryTextMapping, "write_mapping_payload_to_file", slow_write):
+            result = run_mapping_job(self.jobs[2], time_budget=1.0)
+
+        self.assertEqual(result["status"], "done")
+        payload = read_json_file(self.jobs[2]["mapping_payload_file_path"])
+        self.assertEqual(len(payload["text_mappings"]), result["text_mappings"])
+        self.assertEqual([path.name for path in self.output_dir.glob("*.tmp")], [])
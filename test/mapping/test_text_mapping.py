@@ -1,14 +1,20 @@
-from src.mapping.text_mapping import CommentaryTextMapping
+from src.mapping.text_mapping import CommentaryAligner, CommentaryTextMapping, RootAlignmentPlan, get_root_alignment_plan
 from unittest import TestCase
 from unittest.mock import patch
 import os
 import sys
+import tempfile
 from pathlib import Path
 
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from config import config
+from local_api_server import LocalAPIServer
+from mapping.mapping_models import Mapping
+from upload_journal import UploadJournal
 from utils import read_json_file
+from webuddhist_client import WebBuddhistClient
 
 
 class TestCommentaryTextMapping(TestCase):
@@ -86,3 +92,215 @@ class TestCommentaryTextMapping(TestCase):
             text_mapping.validate_mapping_root_segment_present_in_root_lookup_list()
 
 
+
+
+    def test_get_commentary_and_root_mapping_dict(self):
+
+        text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        text_mapping.mapping_data = self.mapping_data
+        text_mapping.look_up_list_root = self.look_up_list_root
+        text_mapping.look_up_list_commentary = self.look_up_list_commentary
+        text_mapping.commentary_number = self.commentary_number
+
+        text_mapping.replace_mapping_root_display_text_with_id()
+
+        self.assertEqual(text_mapping.get_commentary_and_root_mapping_dict(), self.expected_mapping_dict)
+
+    def test_generate_mapping_payload(self):
+
+        text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        text_mapping.mapping_data = self.mapping_data
+        text_mapping.look_up_list_root = self.look_up_list_root
+        text_mapping.look_up_list_commentary = self.look_up_list_commentary
+        text_mapping.commentary_number = self.commentary_number
+        text_mapping.root_text_id = self.root_text_id
+        text_mapping.commentary_text_id = self.commentary_text_id
+
+        text_mapping.replace_mapping_root_display_text_with_id()
+
+        self.assertEqual(text_mapping.generate_mapping_payload().model_dump(), self.expected_mapping_payload)
+
+    def test_failed_upload_is_sent_again_by_the_next_diff_run(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            def make_text_mapping():
+                text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+                text_mapping.mapping_data = read_json_file(self.mapping_file_name_path)
+                text_mapping.look_up_list_root = self.look_up_list_root
+                text_mapping.look_up_list_commentary = self.look_up_list_commentary
+                text_mapping.commentary_number = self.commentary_number
+                text_mapping.root_text_id = self.root_text_id
+                text_mapping.commentary_text_id = self.commentary_text_id
+                text_mapping.mapping_payload_file_path = str(Path(temp_dir) / "dummy_mapping_payload.json")
+                return text_mapping
+
+            with patch.object(CommentaryTextMapping, "upload_mapping_payload_to_webuddhist", side_effect=RuntimeError("HTTP 500")):
+                with self.assertRaises(RuntimeError):
+                    make_text_mapping().map_text_and_upload_to_webuddhist(token="token")
+            self.assertFalse(os.path.exists(Path(temp_dir) / "dummy_mapping_payload.json"))
+
+            with patch.object(CommentaryTextMapping, "upload_mapping_payload_to_webuddhist", return_value={}) as mock_upload:
+                make_text_mapping().map_text_and_upload_to_webuddhist(token="token", diff=True)
+
+            self.assertIsNone(mock_upload.call_args.kwargs["previous_mapping_payload"])
+            self.assertEqual(read_json_file(str(Path(temp_dir) / "dummy_mapping_payload.json")), self.expected_mapping_payload)
+
+    def test_unaligned_commentary_segments_are_reported(self):
+        mapping_data = [
+            {"root_display_text": "ཀ", "commentary_1": "ཤེས་རབ་ཀྱི་ཕ་རོལ།"},
+            {"root_display_text": "ཁ", "commentary_1": "སྙིང་པོ།"},
+        ]
+        aligner = CommentaryAligner(mapping_data, "commentary_1")
+
+        with self.assertLogs(CommentaryAligner.__module__, level="WARNING") as logs:
+            alignment = aligner.align([
+                {"segment_content": "ཤེས་རབ་ཀྱི་ཕ་རོལ།", "id": "id_1"},
+                {"segment_content": "བཅོམ་ལྡན་འདས་མ་དེ་བཞིན་གཤེགས་པ།", "id": "id_2"},
+                {"segment_content": "སྙིང་པོ།", "id": "id_3"},
+            ])
+
+        self.assertEqual([segment_id for segment_id, _ in alignment], ["id_1", "id_3"])
+        self.assertEqual(aligner.unaligned_ids, ["id_2"])
+        self.assertIn("id_2", "\n".join(logs.output))
+
+    def test_heart_sutra_mapping_matches_uploaded_payload(self):
+
+        src_mapping_dir = Path(__file__).parent.parent.parent / "src" / "mapping"
+        uploaded_mapping_payload = read_json_file(str(src_mapping_dir / "mapping_payload" / "heart_sutra_mapping_data_mapping_payload.json"))
+
+        text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        text_mapping.mapping_data = read_json_file(str(src_mapping_dir / "mapping_data" / "heart_sutra_mapping_data.json"))
+        text_mapping.look_up_list_root = read_json_file(str(src_mapping_dir / "lookup" / "root" / "heart_sutra_root_segment_content_with_segment_id.json"))
+        text_mapping.look_up_list_commentary = read_json_file(str(src_mapping_dir / "lookup" / "commentary" / "heart_sutra_commentary_3_segment_content_with_segment_id.json"))
+        text_mapping.commentary_number = "3"
+
+        text_mapping.replace_mapping_root_display_text_with_id()
+
+        self.assertEqual(
+            text_mapping.get_commentary_and_root_mapping_dict(),
+            {
+                text_mapping_payload["segment_id"]: text_mapping_payload["mappings"][0]["segments"]
+                for text_mapping_payload in uploaded_mapping_payload["text_mappings"]
+            },
+        )
+
+    def test_validate_and_replace_share_one_root_alignment(self):
+
+        text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        text_mapping.mapping_data = self.mapping_data
+        text_mapping.look_up_list_root = self.look_up_list_root
+
+        with patch.object(RootAlignmentPlan, "build", wraps=RootAlignmentPlan.build) as mock_build:
+            text_mapping.validate_mapping_root_segment_present_in_root_lookup_list()
+            text_mapping.replace_mapping_root_display_text_with_id()
+
+        self.assertEqual(mock_build.call_count, 1)
+        self.assertEqual(text_mapping.mapping_data, self.expected_replaced_root_text_with_segment_id)
+        for row in text_mapping.root_alignment_plan.rows:
+            self.assertEqual(row["root_id"], self.look_up_list_root[row["root_index"]]["id"])
+            self.assertGreaterEqual(row["score"], 0.95)
+
+    def test_saved_root_alignment_plan_is_reused_for_unchanged_inputs(self):
+
+        with tempfile.TemporaryDirectory() as plan_dir:
+            def make_text_mapping(mapping_data):
+                text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+                text_mapping.mapping_data = mapping_data
+                text_mapping.look_up_list_root = self.look_up_list_root
+                text_mapping.root_alignment_plan_dir = plan_dir
+                return text_mapping
+
+            first_text_mapping = make_text_mapping(read_json_file(self.mapping_file_name_path))
+            first_text_mapping.replace_mapping_root_display_text_with_id()
+
+            with patch.object(RootAlignmentPlan, "build", wraps=RootAlignmentPlan.build) as mock_build:
+                second_text_mapping = make_text_mapping(read_json_file(self.mapping_file_name_path))
+                second_text_mapping.replace_mapping_root_display_text_with_id()
+                self.assertEqual(mock_build.call_count, 0)
+
+                changed_mapping_data = read_json_file(self.mapping_file_name_path)
+                changed_mapping_data[0]["root_display_text"] = ""
+                make_text_mapping(changed_mapping_data).validate_mapping_root_segment_present_in_root_lookup_list()
+                self.assertEqual(mock_build.call_count, 1)
+
+            self.assertEqual(len(os.listdir(plan_dir)), 2)
+            self.assertEqual(second_text_mapping.mapping_data, first_text_mapping.mapping_data)
+
+    def test_truncated_root_alignment_plan_is_rebuilt(self):
+        mapping_data = read_json_file(self.mapping_file_name_path)
+
+        with tempfile.TemporaryDirectory() as plan_dir:
+            plan = get_root_alignment_plan(mapping_data, self.look_up_list_root, plan_dir=plan_dir)
+            plan_path = Path(plan_dir) / f"{plan.key}.json"
+            plan_path.write_text(plan_path.read_text(encoding="utf-8")[:50], encoding="utf-8")
+
+            with patch.object(RootAlignmentPlan, "build", wraps=RootAlignmentPlan.build) as mock_build:
+                rebuilt_plan = get_root_alignment_plan(mapping_data, self.look_up_list_root, plan_dir=plan_dir)
+                self.assertEqual(mock_build.call_count, 1)
+
+            self.assertEqual(rebuilt_plan.rows, plan.rows)
+            self.assertEqual(read_json_file(plan_path), plan.to_dict())
+            self.assertEqual(os.listdir(plan_dir), [plan_path.name])
+
+
+class TestChunkedMappingUpload(TestCase):
+    def setUp(self):
+        self.server = LocalAPIServer(seed=0).start()
+        self.client = WebBuddhistClient(base_url=self.server.url, max_retries=0, gzip_requests=True)
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        uploaded_mapping_payload = read_json_file(
+            str(Path(__file__).parent.parent.parent / "src" / "mapping" / "mapping_payload" / "heart_sutra_mapping_data_mapping_payload.json")
+        )
+        self.mapping_payload = Mapping(**uploaded_mapping_payload)
+        self.segment_ids = [text_mapping["segment_id"] for text_mapping in uploaded_mapping_payload["text_mappings"]]
+
+        self.text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        self.text_mapping.client = self.client
+        self.text_mapping.mapping_upload_url = config.MAPPINGS_ENDPOINT
+        self.text_mapping.commentary_text_id = "commentary_text_id"
+        self.text_mapping.mapping_payload_file_path = str(Path(self.temp_dir.name) / "heart_sutra_mapping_payload.json")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_payload_is_split_into_chunks_uploaded_concurrently(self):
+        journal = UploadJournal(str(Path(self.temp_dir.name) / "journal.json"))
+
+        chunk_manifest = self.text_mapping.upload_mapping_payload_to_webuddhist(
+            self.mapping_payload, journal=journal, token="token", max_chunk_mappings=20, max_workers=3
+        )
+
+        self.assertEqual(len(chunk_manifest["chunks"]), 4)
+        self.assertEqual(self.server.get_stats()["requests_by_endpoint"][config.MAPPINGS_ENDPOINT], 4)
+        self.assertEqual([chunk["chunk"] for chunk in chunk_manifest["chunks"]], [1, 2, 3, 4])
+        self.assertEqual([segment_id for chunk in chunk_manifest["chunks"] for segment_id in chunk["segment_ids"]], self.segment_ids)
+        self.assertEqual([chunk["response"]["text_mappings"] for chunk in chunk_manifest["chunks"]], [20, 20, 20, 7])
+        self.assertEqual(read_json_file(str(Path(self.temp_dir.name) / "heart_sutra_mapping_payload_chunks.json")), chunk_manifest)
+
+        # Resuming skips the chunks already uploaded
+        resumed_journal = UploadJournal(str(Path(self.temp_dir.name) / "journal.json"), resume=True)
+        self.text_mapping.upload_mapping_payload_to_webuddhist(
+            self.mapping_payload, journal=resumed_journal, token="token", max_chunk_mappings=20, max_workers=3
+        )
+        self.assertEqual(self.server.get_stats()["requests_by_endpoint"][config.MAPPINGS_ENDPOINT], 4)
+
+    def test_chunks_are_capped_by_body_size(self):
+        chunk_manifest = self.text_mapping.upload_mapping_payload_to_webuddhist(
+            self.mapping_payload, token="token", max_chunk_bytes=4096, max_workers=2
+        )
+
+        self.assertGreater(len(chunk_manifest["chunks"]), 1)
+        for chunk in chunk_manifest["chunks"]:
+            self.assertTrue(chunk["bytes"] <= 4096 or chunk["text_mappings"] == 1)
+        self.assertEqual(sum(chunk["text_mappings"] for chunk in chunk_manifest["chunks"]), len(self.segment_ids))
+
+    def test_empty_payload_uploads_nothing(self):
+        empty_mapping_payload = Mapping(**dict(self.mapping_payload.model_dump(), text_mappings=[]))
+
+        chunk_manifest = self.text_mapping.upload_mapping_payload_to_webuddhist(empty_mapping_payload, token="token")
+
+        self.assertIsNone(chunk_manifest)
+        self.assertNotIn(config.MAPPINGS_ENDPOINT, self.server.get_stats()["requests_by_endpoint"])
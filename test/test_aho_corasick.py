@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import aho_corasick
+from aho_corasick import AhoCorasick
+from mapping.text_mapping import CommentaryTextMapping
+
+
+def find_all(pattern, text):
+    offsets = []
+    offset = text.find(pattern)
+    while offset != -1:
+        offsets.append(offset)
+        offset = text.find(pattern, offset + 1)
+    return offsets
+
+
+class TestAhoCorasick(TestCase):
+    def setUp(self):
+        self.patterns = ["ཤེས་རབ", "རབ", "ཤེས་རབ་ཀྱི་ཕ་རོལ", "ཕ་རོལ་ཏུ་ཕྱིན་པ", "", "སྙིང་པོ", "རབ"]
+        self.texts = [
+            "ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པ། ཤེས་རབ།",
+            None,
+            "བཅོམ་ལྡན་འདས་མ་ཤེས་",
+            "རབ་ཀྱི་སྙིང་པོ། ཤེས་རབ་ཤེས་རབ",
+        ]
+
+    def get_expected_occurrences(self):
+        return {
+            pattern: [(text_index, offset) for text_index, text in enumerate(self.texts) for offset in find_all(pattern, text or "")]
+            for pattern in dict.fromkeys(pattern for pattern in self.patterns if pattern)
+        }
+
+    def test_pure_python_automaton_finds_every_occurrence(self):
+        with patch.object(aho_corasick, "ahocorasick", None):
+            matcher = AhoCorasick(self.patterns)
+
+            self.assertEqual(matcher.get_occurrences(self.texts), self.get_expected_occurrences())
+
+    def test_patterns_never_match_across_texts(self):
+        with patch.object(aho_corasick, "ahocorasick", None):
+            occurrences = AhoCorasick(["ཤེས་རབ"]).get_occurrences(["བཅོམ་ལྡན་འདས་མ་ཤེས་", "རབ་ཀྱི"])
+
+        self.assertEqual(occurrences, {"ཤེས་རབ": []})
+
+    def test_without_patterns_nothing_matches(self):
+        self.assertEqual(AhoCorasick(["", ""]).get_occurrences(self.texts), {})
+
+
+class TestCommentaryContainment(TestCase):
+    def setUp(self):
+        self.text_mapping = CommentaryTextMapping.__new__(CommentaryTextMapping)
+        self.text_mapping.commentary_number = "1"
+        self.text_mapping.mapping_data = [
+            {"root_display_text": "ཀ", "commentary_1": "ཤེས་རབ་ཀྱི་ཕ་རོལ།\nཏུ་ཕྱིན་པ།"},
+            {"root_display_text": "", "commentary_1": None},
+            {"root_display_text": "ཁ", "commentary_1": "སྙིང་པོ། ཤེས་རབ།"},
+        ]
+
+    def test_segments_found_in_order(self):
+        self.text_mapping.look_up_list_commentary = [
+            {"segment_content": "ཏུ་ཕྱིན་པ།", "id": "id_1"},
+            {"segment_content": "", "id": "id_2"},
+            {"segment_content": "ཤེས་རབ", "id": "id_3"},
+        ]
+
+        self.assertTrue(self.text_mapping.validate_commentary_lookup_list_present_in_mapping_data())
+        self.assertEqual(self.text_mapping.get_commentary_occurrences(), {"ཏུ་ཕྱིན་པ།": [(0, 18)], "ཤེས་རབ": [(0, 0), (2, 9)]})
+
+    def test_segment_only_in_an_earlier_row_is_not_found(self):
+        self.text_mapping.look_up_list_commentary = [
+            {"segment_content": "སྙིང་པོ", "id": "id_1"},
+            {"segment_content": "ཏུ་ཕྱིན་པ།", "id": "id_2"},
+        ]
+
+        with self.assertRaisesRegex(ValueError, "Commentary ཏུ་ཕྱིན་པ། not found in mapping data"):
+            self.text_mapping.validate_commentary_lookup_list_present_in_mapping_data()
@@ -0,0 +1,102 @@
+import copy
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from artifact_cache import ArtifactCache
+from toc_uploader_webuddhist import TableOfContentsUploader
+from utils import read_json_file
+
+
+class TestArtifactCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.artifact_cache = ArtifactCache(cache_dir=self.temp_dir.name, max_bytes=10_000)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_key_changes_with_inputs_and_version(self):
+        key = ArtifactCache.get_key("toc_resolve", 1, payload_data={"a": 1})
+
+        self.assertEqual(key, ArtifactCache.get_key("toc_resolve", 1, payload_data={"a": 1}))
+        self.assertNotEqual(key, ArtifactCache.get_key("toc_resolve", 1, payload_data={"a": 2}))
+        self.assertNotEqual(key, ArtifactCache.get_key("toc_resolve", 2, payload_data={"a": 1}))
+        self.assertNotEqual(key, ArtifactCache.get_key("mapping_payload", 1, payload_data={"a": 1}))
+
+    def test_built_once_then_read_from_cache(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return {"sections": ["seg_001"]}
+
+        first = self.artifact_cache.get_or_build("toc_resolve", "key", build)
+        second = self.artifact_cache.get_or_build("toc_resolve", "key", build)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(builds), 1)
+        stats = self.artifact_cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+        self.assertEqual(stats["kinds"]["toc_resolve"]["entries"], 1)
+
+    def test_least_recently_used_artifacts_are_evicted_first(self):
+        for index, key in enumerate(["old", "used", "new"]):
+            self.artifact_cache.put("mapping_payload", key, {"value": "x" * 100})
+            os.utime(self.artifact_cache.get_path("mapping_payload", key), (1000 + index, 1000 + index))
+        # Reading "used" makes it the most recently used one
+        self.artifact_cache.get("mapping_payload", "used")
+
+        size = os.path.getsize(self.artifact_cache.get_path("mapping_payload", "new"))
+        self.assertEqual(self.artifact_cache.evict(max_bytes=size * 2), 1)
+
+        self.assertIsNone(self.artifact_cache.get("mapping_payload", "old"))
+        self.assertIsNotNone(self.artifact_cache.get("mapping_payload", "used"))
+        self.assertIsNotNone(self.artifact_cache.get("mapping_payload", "new"))
+
+    def test_clear_deletes_everything(self):
+        self.artifact_cache.put("toc_resolve", "key_1", {"a": 1})
+        self.artifact_cache.put("mapping_payload", "key_2", {"b": 2})
+
+        self.assertEqual(self.artifact_cache.clear(), 2)
+        self.assertEqual(self.artifact_cache.get_stats()["entries"], 0)
+
+
+class TestTocResolveCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        data_dir = Path(__file__).parent / "data"
+        self.payload_data = read_json_file(str(data_dir / "dummy_toc_payload.json"))
+        self.text_id_look_up_list = read_json_file(str(data_dir / "dummy_segment_content_with_segment_id.json"))
+        self.expected_toc_payload = read_json_file(str(data_dir / "expected_dummy_toc_payload.json"))
+
+        self.uploader = TableOfContentsUploader.__new__(TableOfContentsUploader)
+        self.uploader.artifact_cache = ArtifactCache(cache_dir=self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_resolved_toc_is_taken_from_cache(self):
+        first = self.uploader.replace_segment_content_with_id_in_toc(copy.deepcopy(self.payload_data), self.text_id_look_up_list)
+
+        with patch.object(TableOfContentsUploader, "resolve_segment_ids_in_toc") as mock_resolve:
+            second = self.uploader.replace_segment_content_with_id_in_toc(copy.deepcopy(self.payload_data), self.text_id_look_up_list)
+
+        mock_resolve.assert_not_called()
+        self.assertEqual(first, self.expected_toc_payload)
+        self.assertEqual(second, self.expected_toc_payload)
+
+    def test_changed_look_up_list_is_resolved_again(self):
+        self.uploader.replace_segment_content_with_id_in_toc(copy.deepcopy(self.payload_data), self.text_id_look_up_list)
+        changed_look_up_list = [dict(look_up, id=f"new_{look_up['id']}") for look_up in self.text_id_look_up_list]
+
+        with patch.object(TableOfContentsUploader, "resolve_segment_ids_in_toc", return_value={}) as mock_resolve:
+            self.uploader.match_stats = {}
+            self.uploader.replace_segment_content_with_id_in_toc(copy.deepcopy(self.payload_data), changed_look_up_list)
+
+        mock_resolve.assert_called_once()
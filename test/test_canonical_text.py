@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from canonical_text import canonicalize, canonicalize_with_offsets, get_original_span, show_hidden_literals
+
+
+class TestCanonicalText(TestCase):
+    def test_canonicalize_strips_hidden_characters_and_whitespace(self):
+        self.assertEqual(canonicalize(" \u200bབམ་པོ་\u202aགཅིག་གོ །\n"), "བམ་པོ་གཅིག་གོ །")
+
+    def test_canonicalize_collapses_whitespace_runs(self):
+        self.assertEqual(canonicalize("ཤེས་རབ་\n\t  ཀྱི་"), "ཤེས་རབ་ ཀྱི་")
+
+    def test_canonicalize_normalizes_tsheg_and_double_shad(self):
+        self.assertEqual(canonicalize("ཕྱག་འཚལ\u0f0cལོ། །"), "ཕྱག་འཚལ་ལོ།།")
+
+    def test_canonicalize_normalizes_unicode_form(self):
+        self.assertEqual(canonicalize("e\u0301"), "\u00e9")
+
+    def test_canonicalize_empty(self):
+        self.assertEqual(canonicalize(""), "")
+        self.assertEqual(canonicalize(" \n\u200b"), "")
+
+    def test_canonicalize_with_offsets_matches_canonicalize(self):
+        for text in (" \u200bབམ་པོ་གཅིག་གོ །\n", "ཕྱག་འཚལ\u0f0cལོ། ། \n", "e\u0301 x", "  "):
+            canonical, offsets = canonicalize_with_offsets(text)
+            self.assertEqual(canonical, canonicalize(text))
+            self.assertEqual(len(offsets), len(canonical))
+
+    def test_get_original_span(self):
+        text = " \u200bབམ་པོ་ གཅིག་གོ །\n"
+        canonical = canonicalize(text)
+        start = canonical.index("གཅིག")
+        original_start, original_end = get_original_span(text, start, start + len("གཅིག"))
+
+        self.assertEqual(text[original_start:original_end], "གཅིག")
+
+    def test_show_hidden_literals(self):
+        self.assertEqual(show_hidden_literals("a\u200bb"), "a[U+200B ZERO WIDTH SPACE]b")
@@ -0,0 +1,81 @@
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from corpus_index import CorpusIndex, get_ngrams, split_syllables
+
+
+class TestCorpusIndex(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.temp_path = Path(self.temp_dir.name)
+
+        self.look_up_file_path = self.temp_path / "heart_sutra_root_segment_content_with_segment_id.json"
+        with open(self.look_up_file_path, "w", encoding="utf-8") as file:
+            json.dump([
+                {"segment_content": "འཕགས་པ་ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པའི་སྙིང་པོ།\n", "id": "seg_001"},
+                {"segment_content": "བཅོམ་ལྡན་འདས་མ་ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པ་ལ་ཕྱག་འཚལ་ལོ། །\n", "id": "seg_002"},
+                {"segment_content": "འདི་སྐད་བདག་གིས་ཐོས་པ་དུས་གཅིག་ན།\n", "id": "seg_003"},
+            ], file, ensure_ascii=False)
+
+        self.mapping_file_path = self.temp_path / "heart_sutra.json"
+        with open(self.mapping_file_path, "w", encoding="utf-8") as file:
+            json.dump([
+                {"root_display_text": "འདི་སྐད་བདག་གིས་ཐོས་པ་དུས་གཅིག་ན།\n", "commentary_1": "དུས་གཅིག་ན་ཞེས་པ་ནི།"},
+            ], file, ensure_ascii=False)
+
+        self.corpus_index = CorpusIndex.build([self.look_up_file_path, self.mapping_file_path])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_split_syllables(self):
+        self.assertEqual(split_syllables("འདི་སྐད་བདག་གིས། །\n"), ["འདི", "སྐད", "བདག", "གིས"])
+
+    def test_get_ngrams(self):
+        self.assertEqual(get_ngrams(["ཀ", "ཁ", "ག", "ང"], 3), ["ཀ་ཁ་ག", "ཁ་ག་ང"])
+        self.assertEqual(get_ngrams(["ཀ", "ཁ"], 3), ["ཀ་ཁ"])
+
+    def test_query_returns_text_segment_id_and_position(self):
+        candidates = self.corpus_index.query("ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པ")
+
+        self.assertEqual(
+            [(candidate["text"], candidate["segment_id"], candidate["position"]) for candidate in candidates],
+            [("heart_sutra_root", "seg_002", 1), ("heart_sutra_root", "seg_001", 0)],
+        )
+        self.assertEqual(candidates[0]["score"], 1.0)
+        self.assertLess(candidates[1]["score"], 1.0)
+
+    def test_query_finds_mapping_columns(self):
+        candidates = self.corpus_index.query("བདག་གིས་ཐོས་པ", source_text="heart_sutra:root_display_text")
+
+        self.assertEqual([(candidate["text"], candidate["position"]) for candidate in candidates], [("heart_sutra:root_display_text", 0)])
+
+    def test_short_query(self):
+        candidates = self.corpus_index.query("དུས་གཅིག")
+
+        self.assertEqual(
+            {(candidate["text"], candidate["position"]) for candidate in candidates},
+            {("heart_sutra_root", 2), ("heart_sutra:root_display_text", 0), ("heart_sutra:commentary_1", 0)},
+        )
+
+    def test_shortlist_positions(self):
+        self.assertEqual(
+            self.corpus_index.shortlist_positions("ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པ", source_text="heart_sutra_root"),
+            [0, 1],
+        )
+
+    def test_save_and_load(self):
+        index_path = self.temp_path / "corpus_index.json.gz"
+        self.corpus_index.save(index_path)
+
+        loaded_index = CorpusIndex.load(index_path)
+
+        self.assertEqual(
+            loaded_index.query("ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པ"),
+            self.corpus_index.query("ཤེས་རབ་ཀྱི་ཕ་རོལ་ཏུ་ཕྱིན་པ"),
+        )
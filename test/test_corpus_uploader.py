@@ -0,0 +1,110 @@
+import json
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from corpus_uploader import (
+    CorpusUploader,
+    discover_upload_jobs,
+    parse_payload_file_name,
+)
+from utils import get_segment_hash, read_json_file
+
+
+class TestCorpusUploader(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.payload_dir = Path(self.temp_dir.name) / "payloads"
+        self.payload_dir.mkdir()
+        self.output_dir = Path(self.temp_dir.name) / "output"
+        self.log_dir = Path(self.temp_dir.name) / "logs"
+        self.journal_dir = Path(self.temp_dir.name) / "journals"
+
+        for file_name in [
+            "heart_sutra_commentary_1.json",
+            "heart_sutra_root_text.json",
+            "dorjee_choepa_commentary_2.json",
+            "dorjee_choepa_root_text.json",
+        ]:
+            payload = {
+                "text_id": file_name,
+                "segments": [{"content": f"{file_name} segment\n", "type": "source", "mapping": []}],
+            }
+            with open(self.payload_dir / file_name, "w", encoding="utf-8") as file:
+                json.dump(payload, file)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parse_payload_file_name(self):
+        self.assertEqual(parse_payload_file_name("choejuk_root_text.json"), ("choejuk", "root"))
+        self.assertEqual(parse_payload_file_name("dorjee_choepa_commentary_3.json"), ("dorjee_choepa", "commentary_3"))
+        self.assertEqual(
+            parse_payload_file_name("heart_sutra_commentary_1_text_segment_payload.json"),
+            ("heart_sutra", "commentary_1"),
+        )
+        with self.assertRaises(ValueError):
+            parse_payload_file_name("metadata.json")
+
+    def test_discover_upload_jobs_orders_root_first(self):
+        jobs = discover_upload_jobs([self.payload_dir])
+
+        self.assertEqual(
+            [(job["text_name"], job["root_or_commentary"]) for job in jobs],
+            [
+                ("dorjee_choepa", "root"),
+                ("dorjee_choepa", "commentary_2"),
+                ("heart_sutra", "root"),
+                ("heart_sutra", "commentary_1"),
+            ],
+        )
+
+    def test_run_uploads_roots_before_commentaries(self):
+        jobs = discover_upload_jobs([self.payload_dir])
+        corpus_uploader = CorpusUploader(jobs, max_workers=4, output_dir=self.output_dir, log_dir=self.log_dir, journal_dir=self.journal_dir)
+
+        completed = []
+        lock = threading.Lock()
+
+        def fake_upload(uploader, payload_data, token):
+            with lock:
+                completed.append(uploader.root_or_commentary + ":" + uploader.text_name)
+            return {
+                "text_id": payload_data["text_id"],
+                "segments": [{"id": "id_1", "content": payload_data["segments"][0]["content"]}],
+            }
+
+        with patch("segment_uploader_webuddhist.SegmentUploader.upload_segments_to_webuddhist", autospec=True, side_effect=fake_upload):
+            results = corpus_uploader.run(token="test_token")
+
+        self.assertEqual([result["status"] for result in results], ["uploaded"] * 4)
+        self.assertLess(completed.index("root:dorjee_choepa"), completed.index("commentary_2:dorjee_choepa"))
+        self.assertLess(completed.index("root:heart_sutra"), completed.index("commentary_1:heart_sutra"))
+
+        output = read_json_file(str(self.output_dir / "heart_sutra_root_segment_content_with_segment_id.json"))
+        self.assertEqual(
+            output,
+            [{
+                "segment_content": "heart_sutra_root_text.json segment\n",
+                "id": "id_1",
+                "content_hash": get_segment_hash("heart_sutra_root_text.json segment\n"),
+            }],
+        )
+        self.assertTrue((self.log_dir / "heart_sutra_commentary_1_upload_log.txt").exists())
+
+    def test_run_skips_commentaries_when_root_fails(self):
+        jobs = discover_upload_jobs([self.payload_dir / "heart_sutra_root_text.json", self.payload_dir / "heart_sutra_commentary_1.json"])
+        corpus_uploader = CorpusUploader(jobs, max_workers=2, output_dir=self.output_dir, log_dir=self.log_dir, journal_dir=self.journal_dir)
+
+        with patch(
+            "segment_uploader_webuddhist.SegmentUploader.upload_segments_to_webuddhist",
+            side_effect=ConnectionError("Network error"),
+        ):
+            results = corpus_uploader.run(token="test_token")
+
+        self.assertEqual([result["status"] for result in results], ["failed", "skipped"])
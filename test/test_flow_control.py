@@ -0,0 +1,130 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import config
+from flow_control import FlowController
+from local_api_server import LocalAPIServer
+from metrics import MetricsRecorder, metrics_run
+from webuddhist_client import WebBuddhistClient, get_retry_after_seconds
+
+
+class TestFlowController(TestCase):
+    def test_limit_grows_while_saturated_and_halves_on_overload(self):
+        controller = FlowController(initial_limit=2, max_limit=8, latency_tolerance=100)
+
+        for _ in range(20):
+            slots = [controller.acquire("/api/v1/segments") for _ in range(int(controller.limit))]
+            for slot in slots:
+                controller.release(slot, 201)
+        self.assertEqual(int(controller.limit), 8)
+
+        slots = [controller.acquire("/api/v1/segments") for _ in range(3)]
+        controller.release(slots[0], 429)
+        # Sent before the decrease, they do not decrease the limit again
+        controller.release(slots[1], 503)
+        controller.release(slots[2], None)
+        self.assertEqual(controller.get_stats()["limit"], 4)
+        self.assertEqual(controller.get_stats()["decisions"]["decrease"], 1)
+
+    def test_rising_latency_decreases_the_limit(self):
+        controller = FlowController(initial_limit=8, latency_tolerance=2)
+        for _ in range(5):
+            controller.release(controller.acquire("/api/v1/texts"), 201)
+
+        slot = controller.acquire("/api/v1/texts")
+        slot.started_at -= 10
+        controller.release(slot, 201)
+
+        self.assertEqual(controller.get_stats()["limit"], 4)
+
+    def test_requests_wait_for_a_free_slot(self):
+        controller = FlowController(initial_limit=1, max_limit=1)
+        slot = controller.acquire("/api/v1/texts")
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: acquired.set() if controller.acquire("/api/v1/texts") else None)
+        thread.start()
+
+        self.assertFalse(acquired.wait(0.1))
+        controller.release(slot, 201)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_retry_after_pauses_every_request(self):
+        controller = FlowController(initial_limit=4)
+        controller.release(controller.acquire("/api/v1/texts"), 429, retry_after_seconds=0.2)
+
+        start_time = time.monotonic()
+        controller.acquire("/api/v1/groups")
+
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.15)
+        self.assertEqual(controller.get_stats()["decisions"]["pause"], 1)
+
+    def test_token_bucket_caps_the_rate(self):
+        controller = FlowController(rate=50, burst=1, initial_limit=64)
+
+        start_time = time.monotonic()
+        for _ in range(11):
+            controller.release(controller.acquire("/api/v1/texts"), 201)
+
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.18)
+
+    def test_decisions_are_recorded_as_spans(self):
+        recorder = MetricsRecorder()
+        controller = FlowController(initial_limit=4)
+        with metrics_run("flow_control", metrics_path="", recorder=recorder), patch("flow_control.span", recorder.span):
+            controller.release(controller.acquire("/api/v1/texts"), 429, retry_after_seconds=0.01)
+
+        flow_control_summary = next(row for row in recorder.get_summary() if row["span"] == "flow_control")
+        self.assertEqual(flow_control_summary["status"], {"decrease": 1, "pause": 1})
+
+
+class TestClientFlowControl(TestCase):
+    def test_retry_after_parsing(self):
+        self.assertEqual(get_retry_after_seconds(Mock(headers={"Retry-After": "3"})), 3.0)
+        self.assertIsNone(get_retry_after_seconds(Mock(headers={})))
+        self.assertIsNone(get_retry_after_seconds(Mock(headers={"Retry-After": "soon"})))
+        self.assertEqual(get_retry_after_seconds(Mock(headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0.0)
+
+    @patch("webuddhist_client.time.sleep")
+    @patch("webuddhist_client.requests.Session.request")
+    def test_retry_waits_for_retry_after(self, mock_request, mock_sleep):
+        mock_request.side_effect = [Mock(status_code=429, headers={"Retry-After": "0.05"}), Mock(status_code=201)]
+        client = WebBuddhistClient(base_url="https://api.example.com", max_retries=1, backoff_base_seconds=0.001)
+
+        self.assertEqual(client.post("/api/v1/texts", json={"title": "title"}).status_code, 201)
+        client.close()
+
+        mock_sleep.assert_called_once_with(0.05)
+        self.assertEqual(client.flow_controller.get_stats()["decisions"], {"increase": 0, "decrease": 1, "pause": 1})
+
+    def test_concurrency_climbs_to_what_the_server_sustains(self):
+        server = LocalAPIServer(latency_seconds=0.05, seed=0, max_in_flight=6).start()
+        client = WebBuddhistClient(base_url=server.url, max_retries=0, flow_controller=FlowController(initial_limit=2, max_limit=16))
+
+        def post_texts():
+            for _ in range(10):
+                client.post(config.TEXTS_ENDPOINT, json={"title": "title"}, token="token")
+
+        threads = [threading.Thread(target=post_texts) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+        server.stop()
+
+        stats = client.flow_controller.get_stats()
+        server_stats = server.get_stats()
+        # Climbs past the initial limit, is pushed back by the 503s above 6 in flight and stays around 6
+        self.assertGreater(stats["decisions"]["increase"], 0)
+        self.assertGreater(stats["decisions"]["decrease"], 0)
+        self.assertGreater(stats["limit"], 2)
+        self.assertLessEqual(stats["limit"], 12)
+        self.assertEqual(server_stats["peak_in_flight"], 6)
+        self.assertGreater(server_stats["responses_by_status"]["201"], server_stats["responses_by_status"]["503"] * 10)
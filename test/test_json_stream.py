@@ -0,0 +1,101 @@
+import gzip
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from json_stream import JsonArrayStream, JsonArrayWriter, iter_json_array
+
+
+class TestJsonStream(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.temp_path = Path(self.temp_dir.name)
+        self.segments = [
+            {"content": f"ཤེས་རབ་ {index} \"quoted\"\n", "type": "source", "mapping": [], "number": 12345 + index}
+            for index in range(50)
+        ]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_json(self, data, file_name="payload.json", **kwargs):
+        file_path = self.temp_path / file_name
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, **kwargs)
+        return file_path
+
+    def test_iter_top_level_array(self):
+        file_path = self.write_json(self.segments, indent=4)
+
+        self.assertEqual(list(iter_json_array(file_path, chunk_size=7)), self.segments)
+
+    def test_iter_array_under_key_collects_header(self):
+        file_path = self.write_json({"text_id": "text_1", "segments": self.segments, "status": "ok"})
+
+        with JsonArrayStream(file_path, key="segments", chunk_size=5) as stream:
+            self.assertEqual(stream.header, {"text_id": "text_1"})
+            self.assertEqual(list(stream), self.segments)
+            self.assertEqual(stream.header, {"text_id": "text_1", "status": "ok"})
+
+    def test_iter_empty_array(self):
+        file_path = self.write_json({"text_id": "text_1", "segments": []}, indent=4)
+
+        self.assertEqual(list(iter_json_array(file_path, key="segments")), [])
+
+    def test_missing_key_raises(self):
+        file_path = self.write_json({"text_id": "text_1"})
+
+        with self.assertRaisesRegex(ValueError, "Key 'segments' not found"):
+            JsonArrayStream(file_path, key="segments")
+
+    def test_truncated_file_raises(self):
+        file_path = self.temp_path / "truncated.json"
+        file_path.write_text('[{"content": "a"}, {"content": "b', encoding="utf-8")
+
+        with self.assertRaises(ValueError):
+            list(iter_json_array(file_path))
+
+    def test_writer_matches_json_dump(self):
+        file_path = self.temp_path / "lookup.json"
+
+        with JsonArrayWriter(file_path) as writer:
+            for segment in self.segments:
+                writer.write(segment)
+
+        self.assertEqual(file_path.read_text(encoding="utf-8"), json.dumps(self.segments, ensure_ascii=False, indent=4))
+
+    def test_writer_empty_array(self):
+        file_path = self.temp_path / "lookup.json"
+
+        with JsonArrayWriter(file_path):
+            pass
+
+        self.assertEqual(file_path.read_text(encoding="utf-8"), "[]")
+
+    def test_writer_keeps_previous_file_on_error(self):
+        file_path = self.write_json(["previous"], file_name="lookup.json")
+
+        with self.assertRaises(ConnectionError):
+            with JsonArrayWriter(file_path) as writer:
+                writer.write("partial")
+                raise ConnectionError("Network error")
+
+        self.assertEqual(json.loads(file_path.read_text(encoding="utf-8")), ["previous"])
+        self.assertEqual(list(self.temp_path.glob("*.tmp")), [])
+
+    def test_compressed_writer_is_streamed_back(self):
+        file_path = self.temp_path / "lookup.json"
+
+        with JsonArrayWriter(file_path, indent=None, compress=True) as writer:
+            for segment in self.segments:
+                writer.write(segment)
+
+        self.assertEqual(
+            gzip.decompress(file_path.read_bytes()).decode("utf-8"),
+            json.dumps(self.segments, ensure_ascii=False, separators=(",", ":")),
+        )
+        self.assertEqual(list(iter_json_array(file_path)), self.segments)
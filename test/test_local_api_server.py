@@ -0,0 +1,133 @@
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import config
+from local_api_server import LocalAPIServer
+from token_provider import decode_jwt_expiry
+from upload_benchmark import run_upload_benchmark
+from corpus_uploader import discover_upload_jobs
+from webuddhist_client import WebBuddhistClient
+
+
+class TestLocalAPIServer(TestCase):
+    def setUp(self):
+        self.server = LocalAPIServer(seed=0).start()
+        self.client = WebBuddhistClient(base_url=self.server.url, max_retries=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_login_returns_token_with_expiry(self):
+        response = self.client.post(config.AUTH_ENDPOINT, json={"email": "a@example.com", "password": "secret"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(decode_jwt_expiry(response.json()["auth"]["access_token"]))
+
+    def test_segments_get_generated_ids(self):
+        segments = [{"content": "ཀ་ཁ།\n", "type": "source", "mapping": []}, {"content": "ག་ང།\n", "type": "source", "mapping": []}]
+
+        response = self.client.post(config.SEGMENTS_ENDPOINT, json={"text_id": "text_1", "segments": segments}, token="token")
+
+        self.assertEqual(response.status_code, 201)
+        response_data = response.json()
+        self.assertEqual(response_data["text_id"], "text_1")
+        self.assertEqual([segment["content"] for segment in response_data["segments"]], ["ཀ་ཁ།\n", "ག་ང།\n"])
+        self.assertEqual(len({segment["id"] for segment in response_data["segments"]}), 2)
+
+    def test_requests_without_token_are_rejected(self):
+        response = self.client.post(config.GROUPS_ENDPOINT, json={"type": "text"})
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_unknown_endpoint_returns_404(self):
+        self.assertEqual(self.client.post("/api/v1/unknown", json={}, token="token").status_code, 404)
+
+    def test_injected_rate_limit_sends_retry_after(self):
+        self.server.rate_limit_rate = 1.0
+        self.server.retry_after_seconds = 7
+
+        response = self.client.post(config.TEXTS_ENDPOINT, json={"title": "title"}, token="token")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "7")
+
+    def test_gzip_bodies_are_decompressed_or_rejected(self):
+        client = WebBuddhistClient(base_url=self.server.url, max_retries=0, gzip_requests=True)
+
+        response = client.post(config.TEXTS_ENDPOINT, json={"title": "ཤེས་རབ་སྙིང་པོ།"}, token="token")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["title"], "ཤེས་རབ་སྙིང་པོ།")
+        self.assertFalse(client.gzip_rejected)
+
+        self.server.accept_gzip = False
+        response = client.post(config.TEXTS_ENDPOINT, json={"title": "title"}, token="token")
+        client.close()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(client.gzip_rejected)
+        self.assertEqual(self.server.get_stats()["responses_by_status"], {"201": 2, "415": 1})
+
+    def post_concurrently(self, count: int, json_body) -> list:
+        responses = [None] * count
+
+        def post(index):
+            responses[index] = self.client.post(config.TEXTS_ENDPOINT, json=json_body, token="token")
+
+        threads = [threading.Thread(target=post, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_throughput_cap_is_shared_by_concurrent_requests(self):
+        json_body = {"title": "x" * 1000}
+        self.server.bytes_per_second = len(json.dumps(json_body)) * 10
+
+        start_time = time.monotonic()
+        responses = self.post_concurrently(4, json_body)
+
+        # 4 bodies of 0.1s each through one link, not 4 links in parallel
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.4)
+        self.assertEqual([response.status_code for response in responses], [201] * 4)
+
+    def test_requests_over_max_in_flight_are_rejected(self):
+        self.server.latency_seconds = 0.3
+        self.server.max_in_flight = 2
+
+        responses = self.post_concurrently(4, {"title": "title"})
+
+        self.assertEqual(sorted(response.status_code for response in responses), [201, 201, 503, 503])
+        self.assertEqual(self.server.get_stats()["peak_in_flight"], 2)
+
+    @patch("webuddhist_client.time.sleep")
+    def test_client_retries_injected_server_errors(self, mock_sleep):
+        self.server.server_error_rate = 1.0
+        client = WebBuddhistClient(base_url=self.server.url, max_retries=2)
+
+        response = client.post(config.MAPPINGS_ENDPOINT, json={"text_mappings": []}, token="token")
+        client.close()
+
+        self.assertIn(response.status_code, (500, 502, 503, 504))
+        self.assertEqual(self.server.get_stats()["requests_by_endpoint"][config.MAPPINGS_ENDPOINT], 3)
+
+    def test_upload_benchmark_runs_corpus_upload_end_to_end(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for file_name in ["heart_sutra_root_text.json", "heart_sutra_commentary_1.json"]:
+                with open(Path(temp_dir) / file_name, "w", encoding="utf-8") as file:
+                    json.dump({"text_id": file_name, "segments": [{"content": "ཀ་ཁ།\n", "type": "source", "mapping": []}] * 3}, file)
+
+            run = run_upload_benchmark(discover_upload_jobs([temp_dir]), self.server.url, workers=2, max_batch_segments=2)
+
+        self.assertEqual(run["uploaded_texts"], 2)
+        self.assertEqual(run["segments"], 6)
+        self.assertEqual(self.server.get_stats()["requests_by_endpoint"][config.SEGMENTS_ENDPOINT], 4)
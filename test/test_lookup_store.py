@@ -0,0 +1,78 @@
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lookup_store import LookupStore, convert_look_up_json, open_lookup_store, write_lookup_store
+from segment_index import SegmentContentIndex
+from utils import read_json_file
+
+LOOK_UP_JSON_PATH = (
+    Path(__file__).parent.parent / "src" / "mapping" / "lookup" / "root" / "heart_sutra_root_segment_content_with_segment_id.json"
+)
+
+
+class TestLookupStore(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.temp_path = Path(self.temp_dir.name)
+        self.look_up_json_path = self.temp_path / LOOK_UP_JSON_PATH.name
+        shutil.copy(LOOK_UP_JSON_PATH, self.look_up_json_path)
+        self.look_up_list = read_json_file(str(self.look_up_json_path))
+        self.lookup_store = LookupStore(convert_look_up_json(self.look_up_json_path))
+
+    def tearDown(self):
+        self.lookup_store.close()
+        self.temp_dir.cleanup()
+
+    def test_store_reads_like_the_json_list(self):
+        self.assertEqual(len(self.lookup_store), len(self.look_up_list))
+        self.assertEqual(list(self.lookup_store), self.look_up_list)
+        self.assertEqual(self.lookup_store[-1], self.look_up_list[-1])
+        self.assertEqual(self.lookup_store[2:4], self.look_up_list[2:4])
+
+    def test_index_of_id(self):
+        for index, look_up in enumerate(self.look_up_list):
+            self.assertEqual(self.lookup_store.index_of_id(look_up["id"]), index)
+        with self.assertRaises(KeyError):
+            self.lookup_store.index_of_id("00000000-0000-0000-0000-000000000000")
+
+    def test_positions_of_content_uses_canonical_form(self):
+        content = self.look_up_list[5]["segment_content"]
+
+        self.assertEqual(self.lookup_store.positions_of_content(" " + content.strip() + "\u200b\n"), [5])
+        self.assertEqual(self.lookup_store.positions_of_content("not in the text"), [])
+
+    def test_duplicate_contents_come_back_in_order(self):
+        look_up_list = [
+            {"segment_content": "ཀ་ཁ།\n", "id": "60689d66-c987-461e-a577-93d860873a4b"},
+            {"segment_content": "ག་ང།\n", "id": "ac9fc1b9-e020-4233-8348-dfdffc782cfe"},
+            {"segment_content": "ཀ་ཁ།", "id": "0b7c7f4e-0b5e-4d3c-9d0f-7c9c1f5b2a11"},
+        ]
+        lookup_store_path = self.temp_path / "duplicates.lookup"
+        write_lookup_store(look_up_list, lookup_store_path)
+
+        with LookupStore(lookup_store_path) as lookup_store:
+            self.assertEqual(lookup_store.positions_of_content("ཀ་ཁ།"), [0, 2])
+            segment_index = SegmentContentIndex(lookup_store)
+            self.assertEqual(segment_index.find("ཀ་ཁ།", 1), 2)
+            self.assertEqual(segment_index.get_stats()["exact_matches"], 1)
+
+    def test_non_uuid_ids_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, "must be UUIDs"):
+            write_lookup_store([{"segment_content": "a", "id": "seg_001"}], self.temp_path / "invalid.lookup")
+
+    def test_open_lookup_store_ignores_stale_store(self):
+        lookup_store = open_lookup_store(self.look_up_json_path)
+        self.assertIsNotNone(lookup_store)
+        lookup_store.close()
+
+        lookup_store_stat = self.look_up_json_path.with_suffix(".lookup").stat()
+        os.utime(self.look_up_json_path, (lookup_store_stat.st_atime + 10, lookup_store_stat.st_mtime + 10))
+        self.assertIsNone(open_lookup_store(self.look_up_json_path))
+
+        self.assertIsNone(open_lookup_store(self.temp_path / "missing_segment_content_with_segment_id.json"))
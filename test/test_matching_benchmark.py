@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from matching_benchmark import (
+    benchmark_fuzzy_match,
+    benchmark_toc_replace,
+    compare_results,
+    make_look_up_list,
+    make_toc_payload,
+    run_stage,
+)
+from toc_uploader_webuddhist import TableOfContentsUploader
+
+
+def make_results(median_seconds, fuzzy_calls):
+    return {
+        "stages": {
+            "toc_replace": {
+                "median_seconds": median_seconds,
+                "fuzzy_calls": {"fuzzy_match": fuzzy_calls, "fuzzy_substring_match": 0},
+                "peak_memory_bytes": 1024,
+            }
+        }
+    }
+
+
+class TestMatchingBenchmark(TestCase):
+    def setUp(self):
+        self.segment_payloads = {"test_text": [f"ཀ་ཁ་ག {index}།\n" for index in range(45)] + [""]}
+
+    def test_toc_payload_resolves_against_look_up_list(self):
+        contents = self.segment_payloads["test_text"]
+        look_up_list = make_look_up_list("test_text", contents)
+        toc_payload = make_toc_payload("test_text", contents)
+
+        toc_uploader = TableOfContentsUploader.__new__(TableOfContentsUploader)
+        resolved = toc_uploader.replace_segment_content_with_id_in_toc(toc_payload, look_up_list)
+
+        self.assertEqual([len(section["segments"]) for section in resolved["sections"]], [20, 20, 5])
+        self.assertEqual(
+            [segment["segment_id"] for section in resolved["sections"] for segment in section["segments"]],
+            [look_up["id"] for look_up in look_up_list[:45]],
+        )
+
+    def test_run_stage_records_time_fuzzy_calls_and_memory(self):
+        stage = run_stage(benchmark_fuzzy_match, self.segment_payloads, repeat=2)
+
+        self.assertEqual(len(stage["seconds"]), 2)
+        self.assertEqual(stage["fuzzy_calls"], {"fuzzy_match": 90, "fuzzy_substring_match": 0})
+        self.assertGreater(stage["peak_memory_bytes"], 0)
+
+    def test_run_stage_does_not_modify_the_dataset(self):
+        run_stage(benchmark_toc_replace, self.segment_payloads, repeat=1)
+
+        self.assertEqual(self.segment_payloads["test_text"][0], "ཀ་ཁ་ག 0།\n")
+
+    def test_compare_results_flags_slowdown_above_threshold(self):
+        rows = compare_results(make_results(1.0, 10), make_results(1.2, 10), threshold=0.1)
+
+        self.assertEqual(rows[0]["time_change"], 0.2)
+        self.assertTrue(rows[0]["regressed"])
+
+    def test_compare_results_accepts_slowdown_within_threshold(self):
+        rows = compare_results(make_results(1.0, 10), make_results(1.05, 10), threshold=0.1)
+
+        self.assertFalse(rows[0]["regressed"])
+
+    def test_compare_results_flags_more_fuzzy_calls(self):
+        rows = compare_results(make_results(1.0, 10), make_results(0.9, 11), threshold=0.1)
+
+        self.assertTrue(rows[0]["regressed"])
@@ -0,0 +1,94 @@
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import config
+from local_api_server import LocalAPIServer
+from metadata_uploader import MetadataUploader, get_group_key
+from upload_journal import UploadJournal
+from utils import read_json_file
+from webuddhist_client import WebBuddhistClient
+
+
+def make_metadata(title: str, group_type: str, group: str = None) -> dict:
+    metadata = {
+        "group_type": group_type,
+        "title": title,
+        "language": "bo",
+        "published_by": "pecha",
+        "category_id": "67dd2402d9f06ab28feedc94",
+        "text_type": "version",
+    }
+    if group:
+        metadata["group"] = group
+    return metadata
+
+
+class TestBulkMetadataUpload(TestCase):
+    def setUp(self):
+        self.server = LocalAPIServer(seed=0).start()
+        self.client = WebBuddhistClient(base_url=self.server.url, max_retries=0)
+        self.uploader = MetadataUploader(api_key="token", base_url=self.server.url + "/api/v1", client=self.client)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.records = []
+        for text_name in ["heart_sutra", "choejuk", "dorjee_choepa", "phakpa_duepa"]:
+            self.records.append(make_metadata(f"{text_name}_root", "text"))
+            for commentary_number in range(1, 4):
+                self.records.append(make_metadata(f"{text_name}_commentary_{commentary_number}", "commentary", group=f"{text_name}_commentaries"))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        self.temp_dir.cleanup()
+
+    def test_group_key_defaults_to_the_title(self):
+        self.assertEqual(get_group_key(make_metadata("heart_sutra_root", "text")), ("text", "heart_sutra_root"))
+        self.assertEqual(get_group_key(make_metadata("a", "commentary", group="g")), ("commentary", "g"))
+
+    def test_each_group_is_created_once_and_texts_concurrently(self):
+        manifest_path = Path(self.temp_dir.name) / "metadata_manifest.json"
+
+        manifest = self.uploader.upload_metadata_records(self.records, max_workers=8, manifest_path=manifest_path)
+
+        requests_by_endpoint = self.server.get_stats()["requests_by_endpoint"]
+        self.assertEqual(requests_by_endpoint[config.GROUPS_ENDPOINT], 8)
+        self.assertEqual(requests_by_endpoint[config.TEXTS_ENDPOINT], 16)
+        self.assertEqual(list(manifest["texts"]), [metadata["title"] for metadata in self.records])
+        self.assertEqual(len({text["text_id"] for text in manifest["texts"].values()}), 16)
+        commentary_group_ids = {manifest["texts"][f"choejuk_commentary_{number}"]["group_id"] for number in range(1, 4)}
+        self.assertEqual(len(commentary_group_ids), 1)
+        self.assertNotIn(manifest["texts"]["choejuk_root"]["group_id"], commentary_group_ids)
+        self.assertEqual(read_json_file(manifest_path), manifest)
+
+    def test_resume_skips_groups_and_texts_already_created(self):
+        journal_path = Path(self.temp_dir.name) / "metadata.jsonl"
+        first_manifest = self.uploader.upload_metadata_records(self.records[:6], journal=UploadJournal(journal_path))
+
+        manifest = self.uploader.upload_metadata_records(self.records, journal=UploadJournal(journal_path, resume=True))
+
+        requests_by_endpoint = self.server.get_stats()["requests_by_endpoint"]
+        self.assertEqual(requests_by_endpoint[config.GROUPS_ENDPOINT], 8)
+        self.assertEqual(requests_by_endpoint[config.TEXTS_ENDPOINT], 16)
+        for title, text in first_manifest["texts"].items():
+            self.assertEqual(manifest["texts"][title], text)
+
+    def test_duplicate_titles_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, "Duplicate metadata titles"):
+            self.uploader.upload_metadata_records([self.records[0], self.records[0]])
+
+    def test_texts_are_not_created_again_when_their_group_is(self):
+        journal_path = Path(self.temp_dir.name) / "metadata.jsonl"
+        first_manifest = self.uploader.upload_metadata_records(self.records[:4], journal=UploadJournal(journal_path))
+        # Lose the group checkpoints, as if the groups had to be created again
+        journal_lines = journal_path.read_text(encoding="utf-8").splitlines()
+        journal_path.write_text("".join(f"{line}\n" for line in journal_lines if '"key": "group:' not in line), encoding="utf-8")
+
+        manifest = self.uploader.upload_metadata_records(self.records[:4], journal=UploadJournal(journal_path, resume=True))
+
+        requests_by_endpoint = self.server.get_stats()["requests_by_endpoint"]
+        self.assertEqual(requests_by_endpoint[config.GROUPS_ENDPOINT], 2)
+        self.assertEqual(requests_by_endpoint[config.TEXTS_ENDPOINT], 4)
+        self.assertEqual(manifest, first_manifest)
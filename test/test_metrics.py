@@ -0,0 +1,104 @@
+import io
+import json
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from metrics import MetricsRecorder, get_default_recorder, metrics_run, span, timed
+from webuddhist_client import WebBuddhistClient
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.metrics_path = Path(self.temp_dir.name) / "metrics" / "run.jsonl"
+        self.recorder = MetricsRecorder()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_lines(self):
+        with open(self.metrics_path, "r", encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_spans_are_written_as_json_lines_with_parent(self):
+        self.recorder.start_run("segment_upload", self.metrics_path)
+        with self.recorder.span("upload", text_id="text_1"):
+            with self.recorder.span("http POST /api/v1/segments") as request_span:
+                request_span.set(status=201, bytes=120, items=3)
+        self.recorder.finish_run()
+
+        lines = self.read_lines()
+        self.assertEqual([line.get("span") for line in lines], ["http POST /api/v1/segments", "upload", None])
+        self.assertEqual(lines[0]["parent"], "upload")
+        self.assertEqual((lines[0]["status"], lines[0]["bytes"], lines[0]["items"]), (201, 120, 3))
+        self.assertIsNone(lines[1]["parent"])
+        self.assertEqual(lines[1]["text_id"], "text_1")
+        self.assertEqual({line["run_id"] for line in lines}, {self.recorder.run_id})
+        self.assertEqual([row["span"] for row in lines[2]["summary"]], ["upload", "http POST /api/v1/segments"])
+
+    def test_summary_totals_spans_by_name(self):
+        self.recorder.start_run("toc_upload")
+        for status in (201, 201, 503):
+            with self.recorder.span("http POST /toc") as request_span:
+                request_span.set(status=status, bytes=10)
+        with self.assertRaises(ValueError):
+            with self.recorder.span("toc_resolve"):
+                raise ValueError("not found")
+
+        summary = {row["span"]: row for row in self.recorder.get_summary()}
+
+        self.assertEqual(summary["http POST /toc"]["count"], 3)
+        self.assertEqual(summary["http POST /toc"]["bytes"], 30)
+        self.assertEqual(summary["http POST /toc"]["status"], {"201": 2, "503": 1})
+        self.assertEqual(summary["toc_resolve"]["errors"], 1)
+
+        table = self.recorder.format_summary()
+        self.assertIn("201x2 503x1", table)
+        self.assertTrue(table.startswith("span"))
+
+    def test_without_metrics_path_nothing_is_written(self):
+        self.recorder.start_run("mapping", "")
+        with self.recorder.span("mapping_align"):
+            pass
+        self.recorder.finish_run()
+
+        self.assertEqual(self.recorder.get_summary()[0]["count"], 1)
+        self.assertFalse(self.metrics_path.exists())
+
+    def test_timed_and_metrics_run_use_the_default_recorder(self):
+        @timed("double")
+        def double(value):
+            return value * 2
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            with metrics_run("benchmark", metrics_path=str(self.metrics_path)):
+                self.assertEqual(double(2), 4)
+                with span("read_json", items=2):
+                    pass
+
+        spans = {line["span"]: line for line in self.read_lines() if "span" in line}
+        self.assertEqual(spans["double"]["parent"], "benchmark")
+        self.assertEqual(spans["read_json"]["items"], 2)
+        self.assertIn("double", output.getvalue())
+        self.assertIsNone(get_default_recorder().file)
+
+    @patch("webuddhist_client.requests.Session.request")
+    def test_client_requests_are_recorded(self, mock_request):
+        mock_request.return_value = Mock(status_code=201, content=b'{"status": "success"}', request=Mock(body=b'{"segments": []}'))
+        recorder = get_default_recorder()
+        recorder.start_run("client")
+
+        with WebBuddhistClient(base_url="https://api.example.com", max_retries=0) as client:
+            client.post("/api/v1/segments", json={"segments": []}, token="test_token")
+
+        row = recorder.get_summary()[0]
+        self.assertEqual(row["span"], "http POST /api/v1/segments")
+        self.assertEqual(row["status"], {"201": 1})
+        self.assertEqual(row["bytes"], len(b'{"segments": []}'))
@@ -0,0 +1,174 @@
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from local_api_server import LocalAPIServer
+from pipeline_runner import PipelineRunner, build_stages, load_manifest
+from utils import read_json_file
+from webuddhist_client import WebBuddhistClient
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+HEART_SUTRA_PAYLOAD_DIR = SRC_DIR / "data" / "heart_sutra" / "heart_sutra_payload"
+
+
+class TestPipelineRunner(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.temp_path = Path(self.temp_dir.name)
+        self.manifest = {
+            "texts": [
+                {
+                    "name": "heart_sutra_commentary_3",
+                    "metadata": {
+                        "group_type": "commentary",
+                        "title": "heart_sutra_commentary_3",
+                        "language": "bo",
+                        "published_by": "pecha",
+                        "category_id": "category_id",
+                        "text_type": "commentary",
+                    },
+                    "segment_payload": str(HEART_SUTRA_PAYLOAD_DIR / "heart_sutra_commentary_3_text_segment_payload.json"),
+                    "toc_payload": str(HEART_SUTRA_PAYLOAD_DIR / "heart_sutra_commentary_3_text_toc_payload.json"),
+                    "commentary_of": "heart_sutra_root",
+                    "commentary_number": 3,
+                    "mapping_data": str(SRC_DIR / "mapping" / "mapping_data" / "heart_sutra_mapping_data.json"),
+                },
+                {
+                    "name": "heart_sutra_root",
+                    "segment_payload": str(HEART_SUTRA_PAYLOAD_DIR / "heart_sutra_root_text_segment_payload.json"),
+                    "toc_payload": str(HEART_SUTRA_PAYLOAD_DIR / "heart_sutra_root_text_toc_payload.json"),
+                },
+            ]
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_manifest(self, manifest) -> Path:
+        manifest_path = self.temp_path / "manifest.json"
+        with open(manifest_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        return manifest_path
+
+    def test_load_manifest_resolves_paths_relative_to_manifest(self):
+        manifest_path = self.write_manifest({"texts": [{"name": "text", "segment_payload": "payloads/text.json"}]})
+
+        manifest = load_manifest(manifest_path)
+
+        self.assertEqual(manifest["texts"][0]["segment_payload"], str((self.temp_path / "payloads" / "text.json").resolve()))
+
+    def test_load_manifest_rejects_unknown_root(self):
+        self.manifest["texts"][0]["commentary_of"] = "diamond_cutter_root"
+
+        with self.assertRaisesRegex(ValueError, "commentary of unknown text diamond_cutter_root"):
+            load_manifest(self.write_manifest(self.manifest))
+
+    def test_build_stages_links_mapping_to_both_texts(self):
+        stages = {stage.name: stage.depends_on for stage in build_stages(self.manifest)}
+
+        self.assertEqual(stages["heart_sutra_commentary_3:metadata"], [])
+        self.assertEqual(stages["heart_sutra_commentary_3:segments"], ["heart_sutra_commentary_3:metadata"])
+        self.assertEqual(stages["heart_sutra_root:segments"], [])
+        self.assertEqual(stages["heart_sutra_root:toc"], ["heart_sutra_root:segments"])
+        self.assertEqual(
+            stages["heart_sutra_commentary_3:mapping"],
+            ["heart_sutra_commentary_3:segments", "heart_sutra_root:segments"],
+        )
+
+    def test_failed_stage_skips_its_dependents_only(self):
+        runner = PipelineRunner(self.manifest, max_workers=2, output_dir=str(self.temp_path / "output"), journal_dir=str(self.temp_path / "journals"))
+
+        def run_segments(stage):
+            if stage.text["name"] == "heart_sutra_root":
+                raise ValueError("upload failed")
+
+        with patch.object(runner, "run_metadata"), patch.object(runner, "run_segments", side_effect=run_segments), \
+                patch.object(runner, "run_toc"), patch.object(runner, "run_mapping") as mock_run_mapping:
+            results = {result["stage"]: result for result in runner.run(token="token")}
+
+        self.assertEqual(results["heart_sutra_root:segments"]["status"], "failed")
+        self.assertEqual(results["heart_sutra_root:toc"]["status"], "skipped")
+        self.assertEqual(results["heart_sutra_commentary_3:mapping"]["status"], "skipped")
+        self.assertEqual(results["heart_sutra_commentary_3:toc"]["status"], "done")
+        mock_run_mapping.assert_not_called()
+
+    def test_pipeline_passes_ids_between_stages(self):
+        with LocalAPIServer(seed=0) as server, patch.object(Config, "API_BASE_URL", server.url), \
+                WebBuddhistClient(base_url=server.url, max_retries=0) as client:
+            runner = PipelineRunner(
+                self.manifest,
+                output_dir=str(self.temp_path / "output"),
+                journal_dir=str(self.temp_path / "journals"),
+                client=client,
+            )
+            results = runner.run(token="token")
+            stats = server.get_stats()
+
+        self.assertEqual([result["status"] for result in results], ["done"] * 6)
+        self.assertEqual(stats["requests_by_endpoint"][Config.MAPPINGS_ENDPOINT], 1)
+
+        root_text_id = runner.state["heart_sutra_root"]["text_id"]
+        commentary_text_id = runner.state["heart_sutra_commentary_3"]["text_id"]
+        root_segment_ids = {look_up["id"] for look_up in runner.state["heart_sutra_root"]["look_up_list"]}
+        mapping_payload = read_json_file(str(self.temp_path / "output" / "heart_sutra_commentary_3_mapping_payload.json"))
+        for text_mapping in mapping_payload["text_mappings"]:
+            self.assertEqual(text_mapping["text_id"], commentary_text_id)
+            self.assertEqual(text_mapping["mappings"][0]["parent_text_id"], root_text_id)
+            self.assertTrue(set(text_mapping["mappings"][0]["segments"]) <= root_segment_ids)
+
+        pipeline_results = read_json_file(str(self.temp_path / "output" / "pipeline_results.json"))
+        self.assertEqual(pipeline_results["texts"]["heart_sutra_commentary_3"]["text_id"], commentary_text_id)
+
+    def test_diff_run_only_uploads_changes(self):
+        # Edit one commentary segment in its payload and TOC (a trailing newline, so it still aligns)
+        payload = read_json_file(self.manifest["texts"][0]["segment_payload"])
+        toc = read_json_file(self.manifest["texts"][0]["toc_payload"])
+        edited_content = payload["segments"][10]["content"]
+        payload["segments"][10]["content"] = edited_content + "\n"
+        for section in toc["sections"]:
+            for segment in section["segments"]:
+                if segment["segment_id"] == edited_content:
+                    segment["segment_id"] = edited_content + "\n"
+        edited_text = dict(
+            self.manifest["texts"][0],
+            segment_payload=str(self.temp_path / "commentary_segment_payload.json"),
+            toc_payload=str(self.temp_path / "commentary_toc_payload.json"),
+        )
+        for file_path, data in [(edited_text["segment_payload"], payload), (edited_text["toc_payload"], toc)]:
+            with open(file_path, "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False)
+
+        with LocalAPIServer(seed=0) as server, patch.object(Config, "API_BASE_URL", server.url), \
+                WebBuddhistClient(base_url=server.url, max_retries=0) as client:
+            def run_pipeline(manifest):
+                runner = PipelineRunner(
+                    manifest,
+                    output_dir=str(self.temp_path / "output"),
+                    journal_dir=str(self.temp_path / "journals"),
+                    client=client,
+                    diff=True,
+                )
+                self.assertEqual({result["status"] for result in runner.run(token="token")}, {"done"})
+                return runner
+
+            first_runner = run_pipeline(self.manifest)
+            first_stats = server.get_stats()["requests_by_endpoint"]
+            second_runner = run_pipeline({"texts": [edited_text, self.manifest["texts"][1]]})
+            second_stats = server.get_stats()["requests_by_endpoint"]
+
+        new_requests = {endpoint: second_stats.get(endpoint, 0) - first_stats.get(endpoint, 0) for endpoint in second_stats}
+        self.assertEqual(new_requests[Config.TEXTS_ENDPOINT], 0)
+        self.assertEqual(new_requests[Config.SEGMENTS_ENDPOINT], 1)
+        self.assertEqual(new_requests[Config.TOC_ENDPOINT], 1)
+        self.assertEqual(new_requests[Config.MAPPINGS_ENDPOINT], 1)
+
+        first_ids = [look_up["id"] for look_up in first_runner.state["heart_sutra_commentary_3"]["look_up_list"]]
+        second_ids = [look_up["id"] for look_up in second_runner.state["heart_sutra_commentary_3"]["look_up_list"]]
+        self.assertEqual(second_runner.state["heart_sutra_commentary_3"]["text_id"], first_runner.state["heart_sutra_commentary_3"]["text_id"])
+        self.assertEqual([index for index, (first, second) in enumerate(zip(first_ids, second_ids)) if first != second], [10])
@@ -0,0 +1,87 @@
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from segment_diff import SegmentDiff
+from segment_uploader_webuddhist import SegmentUploader, get_look_up_entry
+from utils import get_segment_hash, read_json_file
+
+
+def make_segments(contents):
+    return [{"content": content, "type": "source", "mapping": []} for content in contents]
+
+
+class TestSegmentDiff(TestCase):
+    def setUp(self):
+        self.previous_look_up_list = [
+            get_look_up_entry({"content": content, "id": f"id_{index}"})
+            for index, content in enumerate(["ཀ།\n", "ཁ།\n", "ག།\n", "ཀ།\n", "ང།\n"])
+        ]
+
+    def test_unchanged_payload_reuses_every_id(self):
+        segment_diff = SegmentDiff(self.previous_look_up_list, make_segments(["ཀ།\n", "ཁ།\n", "ག།\n", "ཀ།\n", "ང།\n"]))
+
+        self.assertFalse(segment_diff.has_changes())
+        self.assertEqual(segment_diff.changed_segments, [])
+        self.assertEqual([segment["id"] for segment in segment_diff.get_segments([])], [f"id_{index}" for index in range(5)])
+
+    def test_only_inserted_and_edited_segments_need_an_upload(self):
+        # ཁ edited, ཅ inserted after the duplicate ཀ, ང removed
+        segments = make_segments(["ཀ།\n", "ཁ། །\n", "ག།\n", "ཀ།\n", "ཅ།\n"])
+
+        segment_diff = SegmentDiff(self.previous_look_up_list, segments)
+
+        self.assertEqual([segment["content"] for segment in segment_diff.changed_segments], ["ཁ། །\n", "ཅ།\n"])
+        self.assertEqual(segment_diff.removed_ids, ["id_1", "id_4"])
+        self.assertEqual(segment_diff.get_stats(), {"segments": 5, "reused": 3, "changed": 2, "removed": 2})
+        self.assertEqual(
+            [segment["id"] for segment in segment_diff.get_segments(["new_1", "new_2"])],
+            ["id_0", "new_1", "id_2", "id_3", "new_2"],
+        )
+
+    def test_look_up_lists_without_hashes_are_fingerprinted(self):
+        previous_look_up_list = [{"segment_content": "ཀ།\n", "id": "id_0"}, {"segment_content": "ཁ།\n", "id": "id_1"}]
+
+        segment_diff = SegmentDiff(previous_look_up_list, make_segments(["ཀ།\n", "ཁ།\n", "ག།\n"]))
+
+        self.assertEqual(segment_diff.ids, ["id_0", "id_1", None])
+
+    def test_uploaded_ids_must_match_changed_segments(self):
+        segment_diff = SegmentDiff([], make_segments(["ཀ།\n"]))
+
+        with self.assertRaises(ValueError):
+            segment_diff.get_segments([])
+
+    def test_diff_upload_sends_only_changed_segments(self):
+        uploader = SegmentUploader.__new__(SegmentUploader)
+        uploader.payload_data = {"text_id": "text_id", "segments": make_segments(["ཀ།\n", "ཁ།\n", "ག། །\n", "ཀ།\n", "ང།\n"])}
+
+        def fake_upload(payload_data, token):
+            return {
+                "text_id": payload_data["text_id"],
+                "segments": [{"id": f"new_{index}", "content": segment["content"]} for index, segment in enumerate(payload_data["segments"])],
+            }
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            uploader.segment_content_with_segment_id_file_path = str(Path(temp_dir) / "lookup.json")
+            with patch.object(uploader, "upload_segments_to_webuddhist", side_effect=fake_upload) as mock_upload:
+                look_up_list = uploader.upload_segments(token="test_token", diff=True)
+                self.assertEqual(mock_upload.call_count, 1)
+                self.assertEqual(len(mock_upload.call_args[0][0]["segments"]), 5)
+
+                uploader.payload_data["segments"][2]["content"] = "ག།\n"
+                look_up_list_after_edit = uploader.upload_segments(token="test_token", diff=True)
+                stored_look_up_list = read_json_file(uploader.segment_content_with_segment_id_file_path)
+
+        self.assertEqual(mock_upload.call_count, 2)
+        self.assertEqual(mock_upload.call_args[0][0]["segments"], make_segments(["ག།\n"]))
+        self.assertEqual(
+            [look_up["id"] for look_up in look_up_list_after_edit],
+            [look_up_list[0]["id"], look_up_list[1]["id"], "new_0", look_up_list[3]["id"], look_up_list[4]["id"]],
+        )
+        self.assertEqual(stored_look_up_list, look_up_list_after_edit)
+        self.assertEqual(stored_look_up_list[2]["content_hash"], get_segment_hash("ག།\n"))
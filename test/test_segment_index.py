@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from segment_index import SegmentContentIndex
+
+
+class TestSegmentContentIndex(TestCase):
+    def setUp(self):
+        self.look_up_list = [
+            {"segment_content": "This is the first segment\n", "id": "seg_001"},
+            {"segment_content": "This is the second segment\n", "id": "seg_002"},
+            {"segment_content": "This is the first segment\n", "id": "seg_003"},
+            {"segment_content": "A completely different fourth segment\n", "id": "seg_004"},
+        ]
+
+    def test_exact_match_ignores_surrounding_whitespace(self):
+        segment_index = SegmentContentIndex(self.look_up_list)
+
+        self.assertEqual(segment_index.find(" This is the second segment", 0), 1)
+        self.assertEqual(segment_index.get_stats()["exact_matches"], 1)
+        self.assertEqual(segment_index.get_stats()["fuzzy_comparisons"], 0)
+
+    def test_duplicates_resolve_in_order(self):
+        segment_index = SegmentContentIndex(self.look_up_list)
+
+        self.assertEqual(segment_index.find("This is the first segment\n", 0), 0)
+        self.assertEqual(segment_index.find("This is the first segment\n", 1), 2)
+
+    def test_fuzzy_match_inside_window(self):
+        segment_index = SegmentContentIndex(self.look_up_list, fuzzy_window=4)
+
+        self.assertEqual(segment_index.find("A completely different fourth segmen\n", 0), 3)
+        self.assertEqual(segment_index.get_stats()["fuzzy_matches"], 1)
+
+    def test_fuzzy_match_outside_window_raises(self):
+        segment_index = SegmentContentIndex(self.look_up_list, fuzzy_window=2)
+
+        with self.assertRaises(ValueError):
+            segment_index.find("A completely different fourth segmen\n", 0)
+
+    def test_missing_content_raises(self):
+        segment_index = SegmentContentIndex(self.look_up_list)
+
+        with self.assertRaisesRegex(ValueError, "not found in look_up_list"):
+            segment_index.find("Not in the look up list", 0)
+
+    def test_fuzzy_match_near_expected_position_wins_over_distant_exact_match(self):
+        content = "A completely different fourth segment\n"
+        look_up_list = [{"segment_content": f"Filler segment {index}\n", "id": f"seg_{index}"} for index in range(303)]
+        look_up_list[1] = {"segment_content": "A completely different fourth segmen\n", "id": "seg_fuzzy"}
+        look_up_list[302] = {"segment_content": content, "id": "seg_exact"}
+        segment_index = SegmentContentIndex(look_up_list)
+
+        self.assertEqual(segment_index.find(content, 1), 1)
+        self.assertEqual(segment_index.find(content, 2), 302)
+        self.assertEqual(segment_index.get_stats()["fuzzy_matches"], 1)
+        self.assertEqual(segment_index.get_stats()["exact_matches"], 1)
@@ -1,16 +1,19 @@
 import json
 import os
 import sys
+import tempfile
 import requests
 from pathlib import Path
 from unittest import TestCase
-from unittest.mock import Mock, patch, mock_open
+from unittest.mock import Mock, patch
 
 # Add the parent directory to the Python path to import modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from segment_uploader_webuddhist import SegmentUploader
-from utils import read_json_file
+from segment_uploader_webuddhist import SegmentUploader, split_segments_into_batches
+from upload_journal import UploadJournal
+from utils import get_segment_hash, read_json_file
+from webuddhist_client import WebBuddhistAPIError
 
 
 class TestSegmentUploader(TestCase):
@@ -55,55 +58,58 @@ class TestSegmentUploader(TestCase):
         )
         self.assertEqual(uploader.payload_data_file_path, expected_payload_path)
 
-    @patch('segment_uploader_webuddhist.requests.post')
-    def test_upload_segments_to_webuddhist_success(self, mock_post):
+    def test_upload_segments_to_webuddhist_success(self):
         """Test successful segment upload to webuddhist API."""
         # Mock successful API response
         mock_response = Mock()
         mock_response.json.return_value = self.expected_api_response
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_client = Mock()
+        mock_client.post.return_value = mock_response
         
         # Create uploader instance with manual setup to avoid input prompts
         uploader = SegmentUploader.__new__(SegmentUploader)
         uploader.segment_upload_url = self.segment_upload_url
+        uploader.client = mock_client
         
         # Test the upload method
         token = "test_token"
         result = uploader.upload_segments_to_webuddhist(self.payload_data, token)
         
         # Assertions
-        mock_post.assert_called_once_with(
+        mock_client.post.assert_called_once_with(
             self.segment_upload_url,
             json=self.payload_data,
-            headers={"Authorization": f"Bearer {token}"}
+            token=token
         )
         self.assertEqual(result, self.expected_api_response)
 
-    @patch('segment_uploader_webuddhist.requests.post')
-    def test_upload_segments_to_webuddhist_failure(self, mock_post):
+    def test_upload_segments_to_webuddhist_failure(self):
         """Test failed segment upload to webuddhist API."""
         # Mock failed API response
         mock_response = Mock()
         mock_response.json.return_value = {"error": "Authentication failed"}
         mock_response.status_code = 401
-        mock_post.return_value = mock_response
+        mock_response.text = '{"error": "Authentication failed"}'
+        mock_client = Mock()
+        mock_client.post.return_value = mock_response
         
         # Create uploader instance with manual setup
         uploader = SegmentUploader.__new__(SegmentUploader)
         uploader.segment_upload_url = self.segment_upload_url
+        uploader.client = mock_client
         
-        # Test the upload method
+        # Test that the error status is raised instead of returning the error body
         token = "invalid_token"
-        result = uploader.upload_segments_to_webuddhist(self.payload_data, token)
+        with self.assertRaises(WebBuddhistAPIError) as context:
+            uploader.upload_segments_to_webuddhist(self.payload_data, token)
         
         # Assertions
-        mock_post.assert_called_once()
-        self.assertEqual(result, {"error": "Authentication failed"})
+        mock_client.post.assert_called_once()
+        self.assertEqual(context.exception.status_code, 401)
 
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('segment_uploader_webuddhist.json.dump')
-    def test_store_segment_content_with_segment_id_in_json(self, mock_json_dump, mock_file_open):
+    @patch('segment_uploader_webuddhist.write_json_file')
+    def test_store_segment_content_with_segment_id_in_json(self, mock_write_json_file):
         """Test storing segment content with segment ID in JSON file."""
         # Create uploader instance with manual setup
         uploader = SegmentUploader.__new__(SegmentUploader)
@@ -113,12 +119,12 @@ class TestSegmentUploader(TestCase):
         uploader.store_segment_content_with_segment_id_in_json(self.expected_api_response)
         
         # Assertions
-        mock_file_open.assert_called_once_with(str(self.segment_content_with_segment_id_file_path), "w", encoding="utf-8")
-        mock_json_dump.assert_called_once()
+        mock_write_json_file.assert_called_once()
+        self.assertEqual(mock_write_json_file.call_args[0][1], str(self.segment_content_with_segment_id_file_path))
         
-        # Check the data structure passed to json.dump
-        call_args = mock_json_dump.call_args
-        dumped_data = call_args[0][0]  # First argument to json.dump
+        # Check the data structure passed to write_json_file
+        call_args = mock_write_json_file.call_args
+        dumped_data = call_args[0][0]  # First argument to write_json_file
         
         # Verify the structure of dumped data
         self.assertEqual(len(dumped_data), len(self.expected_api_response["segments"]))
@@ -131,11 +137,10 @@ class TestSegmentUploader(TestCase):
     @patch('segment_uploader_webuddhist.input')
     @patch('segment_uploader_webuddhist.read_json_file')
     @patch('segment_uploader_webuddhist.get_token')
-    @patch('segment_uploader_webuddhist.requests.post')
-    @patch('builtins.open', new_callable=mock_open)
-    @patch('segment_uploader_webuddhist.json.dump')
-    def test_upload_segments_full_workflow(self, mock_json_dump, mock_file_open, 
-                                         mock_post, mock_get_token, mock_read_json, mock_input):
+    @patch('segment_uploader_webuddhist.get_default_client')
+    @patch('segment_uploader_webuddhist.write_json_file')
+    def test_upload_segments_full_workflow(self, mock_write_json_file,
+                                         mock_get_client, mock_get_token, mock_read_json, mock_input):
         """Test the complete upload segments workflow."""
         # Setup mocks
         mock_input.side_effect = [self.test_text_name, self.test_root_or_commentary]
@@ -145,6 +150,7 @@ class TestSegmentUploader(TestCase):
         mock_response = Mock()
         mock_response.json.return_value = self.expected_api_response
         mock_response.status_code = 200
+        mock_post = mock_get_client.return_value.post
         mock_post.return_value = mock_response
         
         # Create and test uploader
@@ -154,8 +160,7 @@ class TestSegmentUploader(TestCase):
         # Assertions
         mock_get_token.assert_called_once()
         mock_post.assert_called_once()
-        mock_file_open.assert_called_once()
-        mock_json_dump.assert_called_once()
+        mock_write_json_file.assert_called_once()
 
     def test_payload_data_structure(self):
         """Test that the payload data has the expected structure."""
@@ -196,8 +201,8 @@ class TestSegmentUploader(TestCase):
 
     @patch('segment_uploader_webuddhist.input')
     @patch('segment_uploader_webuddhist.read_json_file')
-    @patch('segment_uploader_webuddhist.requests.post')
-    def test_upload_with_empty_segments(self, mock_post, mock_read_json, mock_input):
+    @patch('segment_uploader_webuddhist.get_default_client')
+    def test_upload_with_empty_segments(self, mock_get_client, mock_read_json, mock_input):
         """Test upload behavior with empty segments list."""
         mock_input.side_effect = [self.test_text_name, self.test_root_or_commentary]
         
@@ -210,7 +215,7 @@ class TestSegmentUploader(TestCase):
         mock_response = Mock()
         mock_response.json.return_value = {"segments": [], "text_id": "test_id", "status": "success"}
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_get_client.return_value.post.return_value = mock_response
         
         uploader = SegmentUploader()
         result = uploader.upload_segments_to_webuddhist(empty_payload, "test_token")
@@ -219,14 +224,14 @@ class TestSegmentUploader(TestCase):
 
     @patch('segment_uploader_webuddhist.input')
     @patch('segment_uploader_webuddhist.read_json_file')
-    @patch('segment_uploader_webuddhist.requests.post')
-    def test_upload_segments_network_error(self, mock_post, mock_read_json, mock_input):
+    @patch('segment_uploader_webuddhist.get_default_client')
+    def test_upload_segments_network_error(self, mock_get_client, mock_read_json, mock_input):
         """Test upload behavior when network error occurs."""
         mock_input.side_effect = [self.test_text_name, self.test_root_or_commentary]
         mock_read_json.return_value = self.payload_data
         
         # Mock network error
-        mock_post.side_effect = requests.exceptions.ConnectionError("Network error")
+        mock_get_client.return_value.post.side_effect = requests.exceptions.ConnectionError("Network error")
         
         uploader = SegmentUploader()
         
@@ -262,8 +267,8 @@ class TestSegmentUploader(TestCase):
 
     @patch('segment_uploader_webuddhist.input')
     @patch('segment_uploader_webuddhist.read_json_file')
-    @patch('segment_uploader_webuddhist.requests.post')
-    def test_invalid_json_response(self, mock_post, mock_read_json, mock_input):
+    @patch('segment_uploader_webuddhist.get_default_client')
+    def test_invalid_json_response(self, mock_get_client, mock_read_json, mock_input):
         """Test behavior when API returns invalid JSON."""
         mock_input.side_effect = [self.test_text_name, self.test_root_or_commentary]
         mock_read_json.return_value = self.payload_data
@@ -272,7 +277,7 @@ class TestSegmentUploader(TestCase):
         mock_response = Mock()
         mock_response.json.side_effect = json.JSONDecodeError("Invalid JSON", "", 0)
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_get_client.return_value.post.return_value = mock_response
         
         uploader = SegmentUploader()
         
@@ -309,14 +314,13 @@ class TestSegmentUploader(TestCase):
         # Test with empty segments
         empty_response = {"segments": []}
         
-        with patch('builtins.open', mock_open()) as mock_file:
-            with patch('segment_uploader_webuddhist.json.dump') as mock_json_dump:
-                uploader.store_segment_content_with_segment_id_in_json(empty_response)
-                
-                # Check that empty list is dumped
-                call_args = mock_json_dump.call_args
-                dumped_data = call_args[0][0]
-                self.assertEqual(len(dumped_data), 0)
+        with patch('segment_uploader_webuddhist.write_json_file') as mock_write_json_file:
+            uploader.store_segment_content_with_segment_id_in_json(empty_response)
+            
+            # Check that empty list is dumped
+            call_args = mock_write_json_file.call_args
+            dumped_data = call_args[0][0]
+            self.assertEqual(len(dumped_data), 0)
 
     @patch('segment_uploader_webuddhist.input')
     @patch('segment_uploader_webuddhist.read_json_file')
@@ -333,6 +337,141 @@ class TestSegmentUploader(TestCase):
         with self.assertRaises(Exception):
             uploader.upload_segments()
 
+    def test_split_segments_into_batches_respects_segment_count(self):
+        """Test that batches never exceed the maximum number of segments."""
+        segments = [{"content": f"segment {i}\n", "type": "source", "mapping": []} for i in range(5)]
+
+        batches = split_segments_into_batches(segments, max_batch_bytes=10_000, max_batch_segments=2)
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual([segment for batch in batches for segment in batch], segments)
+
+    def test_split_segments_into_batches_respects_byte_size(self):
+        """Test that batches are capped by size and oversized segments go alone."""
+        small_segment = {"content": "a", "type": "source", "mapping": []}
+        large_segment = {"content": "b" * 500, "type": "source", "mapping": []}
+
+        batches = split_segments_into_batches(
+            [small_segment, small_segment, large_segment, small_segment],
+            max_batch_bytes=200,
+            max_batch_segments=100,
+        )
+
+        self.assertEqual(batches, [[small_segment, small_segment], [large_segment], [small_segment]])
+
+    def test_upload_segments_to_webuddhist_in_batches_merges_responses(self):
+        """Test that batched upload sends batches in order and merges returned segments."""
+        uploader = SegmentUploader.__new__(SegmentUploader)
+        uploader.segment_upload_url = self.segment_upload_url
+
+        def fake_upload(batch_payload, token):
+            return {
+                "text_id": batch_payload["text_id"],
+                "segments": [
+                    {"id": f"id_{segment['content'].strip()}", "content": segment["content"]}
+                    for segment in batch_payload["segments"]
+                ],
+                "status": "success",
+            }
+
+        with patch.object(uploader, "upload_segments_to_webuddhist", side_effect=fake_upload) as mock_upload:
+            result = uploader.upload_segments_to_webuddhist_in_batches(
+                self.payload_data, "test_token", max_batch_segments=2
+            )
+
+        self.assertEqual(mock_upload.call_count, 2)
+        self.assertEqual(result["text_id"], self.payload_data["text_id"])
+        self.assertEqual(
+            [segment["content"] for segment in result["segments"]],
+            [segment["content"] for segment in self.payload_data["segments"]],
+        )
+        self.assertEqual(len(uploader.batch_stats), 2)
+        self.assertEqual(uploader.batch_stats[0]["segments"], 2)
+
+    def test_upload_segments_to_webuddhist_in_batches_segment_count_mismatch(self):
+        """Test that a batch returning fewer segments than sent raises an error."""
+        uploader = SegmentUploader.__new__(SegmentUploader)
+        uploader.segment_upload_url = self.segment_upload_url
+
+        with patch.object(uploader, "upload_segments_to_webuddhist", return_value={"segments": []}):
+            with self.assertRaises(ValueError):
+                uploader.upload_segments_to_webuddhist_in_batches(self.payload_data, "test_token")
+
+    def test_upload_segments_in_batches_resumes_from_journal(self):
+        """Test that batches recorded in the journal are not uploaded again."""
+        uploader = SegmentUploader.__new__(SegmentUploader)
+        uploader.segment_upload_url = self.segment_upload_url
+
+        def fake_upload(batch_payload, token):
+            return {
+                "text_id": batch_payload["text_id"],
+                "segments": [
+                    {"id": f"id_{index}", "content": segment["content"]}
+                    for index, segment in enumerate(batch_payload["segments"])
+                ],
+            }
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_path = Path(temp_dir) / "journal.jsonl"
+
+            # First run fails on the second batch
+            with patch.object(
+                uploader,
+                "upload_segments_to_webuddhist",
+                side_effect=[fake_upload({"text_id": "t", "segments": self.payload_data["segments"][:2]}, None), ConnectionError("Network error")],
+            ):
+                with self.assertRaises(ConnectionError):
+                    uploader.upload_segments_to_webuddhist_in_batches(
+                        self.payload_data, "test_token", max_batch_segments=2, journal=UploadJournal(journal_path)
+                    )
+
+            # Resumed run only uploads the failed batch
+            with patch.object(uploader, "upload_segments_to_webuddhist", side_effect=fake_upload) as mock_upload:
+                result = uploader.upload_segments_to_webuddhist_in_batches(
+                    self.payload_data, "test_token", max_batch_segments=2, journal=UploadJournal(journal_path, resume=True)
+                )
+
+        self.assertEqual(mock_upload.call_count, 1)
+        self.assertEqual([segment["id"] for segment in result["segments"]], ["id_0", "id_1", "id_0"])
+        self.assertEqual(
+            [segment["content"] for segment in result["segments"]],
+            [segment["content"] for segment in self.payload_data["segments"]],
+        )
+
+    def test_upload_segments_streaming_writes_lookup_incrementally(self):
+        """Test that a streamed payload is uploaded batch by batch into the lookup file."""
+        uploader = SegmentUploader.__new__(SegmentUploader)
+        uploader.segment_upload_url = self.segment_upload_url
+        uploader.payload_data_file_path = self.payload_data_file_path
+
+        def fake_upload(batch_payload, token):
+            return {
+                "text_id": batch_payload["text_id"],
+                "segments": [
+                    {"id": f"id_{segment['content'].strip()}", "content": segment["content"]}
+                    for segment in batch_payload["segments"]
+                ],
+            }
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            uploader.segment_content_with_segment_id_file_path = str(Path(temp_dir) / "lookup.json")
+            with patch.object(uploader, "upload_segments_to_webuddhist", side_effect=fake_upload) as mock_upload:
+                uploader.upload_segments_streaming(max_batch_segments=2, token="test_token")
+            lookup = read_json_file(uploader.segment_content_with_segment_id_file_path)
+
+        self.assertEqual(mock_upload.call_count, 2)
+        self.assertEqual(
+            lookup,
+            [
+                {
+                    "segment_content": segment["content"],
+                    "id": f"id_{segment['content'].strip()}",
+                    "content_hash": get_segment_hash(segment["content"]),
+                }
+                for segment in self.payload_data["segments"]
+            ],
+        )
+
     def tearDown(self):
         """Clean up after each test method."""
         # Remove any temporary files that might have been created
@@ -64,20 +64,21 @@ class TestTableOfContentUploader(TestCase):
         self.assertEqual(replaced_payload_data, self.expected_toc_payload)
 
         
-    @patch('toc_uploader_webuddhist.requests.post')
-    def test_upload_toc_to_webuddhist_success(self, mock_post):
+    def test_upload_toc_to_webuddhist_success(self):
 
         mock_response = Mock()
         mock_response.json.return_value = self.expected_toc_payload
         mock_response.status_code = 200
-        mock_post.return_value = mock_response
+        mock_client = Mock()
+        mock_client.post.return_value = mock_response
 
         uploader = TableOfContentsUploader.__new__(TableOfContentsUploader)
         uploader.toc_upload_url = self.toc_upload_url
+        uploader.client = mock_client
 
         token = "test_token"
         result = uploader.upload_toc_to_webuddhist(self.payload_data, token)
 
         self.assertEqual(result, self.expected_toc_payload)
 
-        mock_post.assert_called_once_with(self.toc_upload_url, json=self.payload_data, headers={"Authorization": f"Bearer {token}"})
\ No newline at end of file
+        mock_client.post.assert_called_once_with(self.toc_upload_url, json=self.payload_data, token=token)
\ No newline at end of file
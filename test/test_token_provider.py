@@ -0,0 +1,111 @@
+import base64
+import json
+import os
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import Mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from token_provider import TokenProvider, decode_jwt_expiry
+
+
+def make_jwt(expires_at):
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode({'email': 'user@example.com', 'exp': expires_at})}.signature"
+
+
+class TestTokenProvider(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.temp_dir.name) / "webuddhist" / "token.json"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_provider(self, tokens):
+        mock_client = Mock()
+        mock_client.post.side_effect = [
+            Mock(status_code=200, json=Mock(return_value={"auth": {"access_token": token}}))
+            for token in tokens
+        ]
+        provider = TokenProvider(
+            cache_path=str(self.cache_path),
+            refresh_margin_seconds=60,
+            client=mock_client,
+            email="user@example.com",
+            password="password",
+        )
+        return provider, mock_client
+
+    def test_decode_jwt_expiry(self):
+        self.assertEqual(decode_jwt_expiry(make_jwt(1759900490)), 1759900490)
+        self.assertIsNone(decode_jwt_expiry("not-a-jwt"))
+
+    def test_token_is_reused_within_process(self):
+        token = make_jwt(time.time() + 3600)
+        provider, mock_client = self.make_provider([token])
+
+        self.assertEqual(provider.get_token(), token)
+        self.assertEqual(provider.get_token(), token)
+        self.assertEqual(mock_client.post.call_count, 1)
+
+    def test_token_is_shared_through_cache_file(self):
+        token = make_jwt(time.time() + 3600)
+        first_provider, _ = self.make_provider([token])
+        first_provider.get_token()
+
+        second_provider, second_client = self.make_provider([])
+        self.assertEqual(second_provider.get_token(), token)
+        second_client.post.assert_not_called()
+
+    def test_cache_file_is_user_only(self):
+        provider, _ = self.make_provider([make_jwt(time.time() + 3600)])
+        provider.get_token()
+
+        if os.name == "posix":
+            self.assertEqual(stat.S_IMODE(os.stat(self.cache_path).st_mode), 0o600)
+
+    def test_token_is_refreshed_before_expiry(self):
+        expiring_token = make_jwt(time.time() + 30)
+        fresh_token = make_jwt(time.time() + 3600)
+        provider, mock_client = self.make_provider([expiring_token, fresh_token])
+
+        self.assertEqual(provider.get_token(), expiring_token)
+        self.assertEqual(provider.get_token(), fresh_token)
+        self.assertEqual(mock_client.post.call_count, 2)
+
+    def test_invalidate_forces_login(self):
+        first_token = make_jwt(time.time() + 3600)
+        second_token = make_jwt(time.time() + 7200)
+        provider, mock_client = self.make_provider([first_token, second_token])
+
+        provider.get_token()
+        provider.invalidate()
+
+        self.assertEqual(provider.get_token(), second_token)
+        self.assertEqual(mock_client.post.call_count, 2)
+
+    def test_rejected_token_is_replaced_by_one_login(self):
+        first_token = make_jwt(time.time() + 3600)
+        second_token = make_jwt(time.time() + 7200)
+        provider, mock_client = self.make_provider([first_token, second_token])
+
+        provider.get_token()
+
+        self.assertEqual(provider.refresh(first_token), second_token)
+        # Another thread rejected with the same token gets the new one without a login
+        self.assertEqual(provider.refresh(first_token), second_token)
+        self.assertIsNone(provider.refresh("token_from_elsewhere"))
+        self.assertEqual(mock_client.post.call_count, 2)
+
+        # The rejected token is no longer served from the cache file
+        other_provider, other_client = self.make_provider([])
+        self.assertEqual(other_provider.get_token(), second_token)
+        other_client.post.assert_not_called()
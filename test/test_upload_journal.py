@@ -0,0 +1,46 @@
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from upload_journal import UploadJournal
+
+
+class TestUploadJournal(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = Path(self.temp_dir.name) / "journals" / "heart_sutra_root_segments.jsonl"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_recorded_steps_survive_reload(self):
+        journal = UploadJournal(self.journal_path)
+        journal.record("segments:text_id:batch_1:hash", ["seg_001", "seg_002"])
+
+        reloaded_journal = UploadJournal(self.journal_path, resume=True)
+
+        self.assertTrue(reloaded_journal.is_done("segments:text_id:batch_1:hash"))
+        self.assertEqual(reloaded_journal.get_result("segments:text_id:batch_1:hash"), ["seg_001", "seg_002"])
+        self.assertFalse(reloaded_journal.is_done("segments:text_id:batch_2:hash"))
+
+    def test_without_resume_journal_starts_empty(self):
+        UploadJournal(self.journal_path).record("toc:text_id:hash", {"status": "success"})
+
+        fresh_journal = UploadJournal(self.journal_path, resume=False)
+
+        self.assertFalse(fresh_journal.is_done("toc:text_id:hash"))
+        self.assertFalse(self.journal_path.exists())
+
+    def test_truncated_last_line_is_ignored(self):
+        journal = UploadJournal(self.journal_path)
+        journal.record("segments:text_id:batch_1:hash", ["seg_001"])
+        with open(self.journal_path, "a", encoding="utf-8") as file:
+            file.write('{"key": "segments:text_id:batch_2:hash", "res')
+
+        reloaded_journal = UploadJournal(self.journal_path, resume=True)
+
+        self.assertTrue(reloaded_journal.is_done("segments:text_id:batch_1:hash"))
+        self.assertFalse(reloaded_journal.is_done("segments:text_id:batch_2:hash"))
@@ -1,7 +1,14 @@
+import gzip
+import json
+import tempfile
+from pathlib import Path
 from unittest import TestCase
 from utils import (
+    FuzzyMatcher,
     fuzzy_match,
     fuzzy_substring_match,
+    read_json_file,
+    write_json_file,
 )
 
 
@@ -19,6 +26,9 @@ class TestUtils(TestCase):
         self.assertFalse(fuzzy_match("hello", ""))
         self.assertFalse(fuzzy_match("", "hello"))
 
+    def test_fuzzy_match_ignores_hidden_characters_and_whitespace(self):
+        self.assertTrue(fuzzy_match(" \u200bབམ་པོ་གཅིག་གོ །\n", "བམ་པོ་གཅིག་གོ །", threshold=1.0))
+
     def test_fuzzy_substring_match_exact_substring_returns_true(self):
         self.assertTrue(fuzzy_substring_match("hello world", "Say hello world to everyone"))
     
@@ -34,3 +44,79 @@ class TestUtils(TestCase):
     def test_fuzzy_substring_match_one_empty_returns_false(self):
         self.assertFalse(fuzzy_substring_match("", "text"))
         self.assertFalse(fuzzy_substring_match("text", ""))
+
+
+class TestJsonFiles(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.temp_dir.name) / "lookup.json"
+        self.data = [{"segment_content": "ཤེས་རབ་སྙིང་པོ།\n", "id": "id_1"}, {"segment_content": "བཅོམ་ལྡན་འདས།", "id": "id_2"}]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_compact_is_the_default_layout(self):
+        write_json_file(self.data, self.file_path, pretty=False, compress=False)
+
+        self.assertEqual(self.file_path.read_text(encoding="utf-8"), json.dumps(self.data, ensure_ascii=False, separators=(",", ":")))
+        self.assertEqual(read_json_file(self.file_path), self.data)
+
+    def test_pretty_layout_is_indented(self):
+        write_json_file(self.data, self.file_path, pretty=True, compress=False)
+
+        self.assertEqual(self.file_path.read_text(encoding="utf-8"), json.dumps(self.data, ensure_ascii=False, indent=4))
+
+    def test_compressed_files_are_detected_on_read(self):
+        write_json_file(self.data, self.file_path, compress=True)
+
+        self.assertEqual(json.loads(gzip.decompress(self.file_path.read_bytes())), self.data)
+        self.assertEqual(read_json_file(self.file_path), self.data)
+
+
+class TestFuzzyMatcher(TestCase):
+    def setUp(self):
+        self.candidates = [
+            "hello world",
+            "",
+            "\u200b\n",
+            "Say hello world to everyone",
+            "hello wrold",
+            "བམ་པོ་གཅིག་གོ །\n",
+        ]
+        self.queries = ["hello world", "hello wo", "", "\n", " \u200bབམ་པོ་གཅིག་གོ །", "hello world to everyone", "goodbye"]
+        self.matcher = FuzzyMatcher(self.candidates)
+
+    def test_find_matches_the_first_fuzzy_match_candidate(self):
+        for query in self.queries:
+            for start in range(len(self.candidates)):
+                expected = next(
+                    (index for index in range(start, len(self.candidates)) if fuzzy_match(self.candidates[index], query)), None
+                )
+                self.assertEqual(self.matcher.find(query, start=start), expected, (query, start))
+
+    def test_find_substring_matches_the_first_fuzzy_substring_match_candidate(self):
+        for query in self.queries:
+            for start in range(len(self.candidates)):
+                expected = next(
+                    (index for index in range(start, len(self.candidates)) if fuzzy_substring_match(query, self.candidates[index])), None
+                )
+                self.assertEqual(self.matcher.find_substring(query, start=start), expected, (query, start))
+
+    def test_find_stops_at_end(self):
+        self.assertIsNone(self.matcher.find("བམ་པོ་གཅིག་གོ །", start=0, end=5))
+        self.assertEqual(self.matcher.find("བམ་པོ་གཅིག་གོ །", start=0, end=6), 5)
+
+    def test_match_matrix_matches_fuzzy_match(self):
+        matrix = self.matcher.match_matrix(self.queries)
+
+        self.assertEqual(
+            matrix,
+            [[fuzzy_match(candidate, query) for candidate in self.candidates] for query in self.queries],
+        )
+
+    def test_key_and_blocks_over_many_candidates(self):
+        look_up_list = [{"segment_content": f"segment number {index}"} for index in range(3000)]
+        matcher = FuzzyMatcher(look_up_list, threshold=1.0, key=lambda look_up: look_up["segment_content"])
+
+        self.assertEqual(matcher.find("segment number 2500", start=10), 2500)
+        self.assertEqual(matcher.comparisons, 2491)
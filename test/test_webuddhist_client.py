@@ -0,0 +1,149 @@
+import gzip
+import json
+import sys
+import requests
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from webuddhist_client import WebBuddhistAPIError, WebBuddhistClient, check_response, get_default_client
+
+
+class TestWebBuddhistClient(TestCase):
+    def setUp(self):
+        self.client = WebBuddhistClient(
+            base_url="https://api.example.com/",
+            pool_size=4,
+            connect_timeout=1,
+            read_timeout=2,
+            max_retries=2,
+            backoff_base_seconds=0.5,
+            backoff_max_seconds=5,
+        )
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_build_url(self):
+        self.assertEqual(self.client.build_url("/api/v1/segments"), "https://api.example.com/api/v1/segments")
+        self.assertEqual(self.client.build_url("https://other.example.com/x"), "https://other.example.com/x")
+
+    def test_session_uses_pooled_adapter(self):
+        adapter = self.client.session.get_adapter("https://api.example.com/api/v1/segments")
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter._pool_connections, 4)
+
+    @patch("webuddhist_client.requests.Session.request")
+    def test_gzip_post_falls_back_to_plain_json_after_415(self, mock_request):
+        mock_request.side_effect = [Mock(status_code=415), Mock(status_code=201), Mock(status_code=201)]
+        client = WebBuddhistClient(base_url="https://api.example.com", max_retries=0, gzip_requests=True)
+
+        self.assertEqual(client.post("/api/v1/mappings", json={"text_mappings": []}).status_code, 201)
+        self.assertEqual(client.post("/api/v1/mappings", json={"text_mappings": []}).status_code, 201)
+        client.close()
+
+        first_call, retry_call, second_post_call = mock_request.call_args_list
+        self.assertEqual(first_call.kwargs["headers"]["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(first_call.kwargs["data"]), json.dumps({"text_mappings": []}).encode("utf-8"))
+        for call in (retry_call, second_post_call):
+            self.assertNotIn("Content-Encoding", call.kwargs["headers"])
+            self.assertEqual(call.kwargs["json"], {"text_mappings": []})
+
+    @patch("webuddhist_client.requests.Session.request")
+    def test_post_sends_token_and_default_timeout(self, mock_request):
+        mock_request.return_value = Mock(status_code=201)
+
+        response = self.client.post("/api/v1/segments", json={"segments": []}, token="test_token")
+
+        self.assertEqual(response.status_code, 201)
+        mock_request.assert_called_once_with(
+            "POST",
+            "https://api.example.com/api/v1/segments",
+            headers={"Authorization": "Bearer test_token"},
+            timeout=(1, 2),
+            json={"segments": []},
+        )
+
+    @patch("webuddhist_client.requests.Session.request")
+    def test_rejected_token_is_replaced_after_login(self, mock_request):
+        mock_request.side_effect = [Mock(status_code=401), Mock(status_code=201), Mock(status_code=201)]
+        token_provider = Mock()
+        token_provider.refresh.return_value = "new_token"
+        client = WebBuddhistClient(base_url="https://api.example.com", max_retries=0, token_provider=token_provider)
+
+        self.assertEqual(client.post("/api/v1/segments", json={"segments": []}, token="expired_token").status_code, 201)
+        # Later requests with the rejected token are sent with the new one right away
+        self.assertEqual(client.post("/api/v1/segments", json={"segments": []}, token="expired_token").status_code, 201)
+        client.close()
+
+        token_provider.refresh.assert_called_once_with("expired_token")
+        self.assertEqual(
+            [call.kwargs["headers"]["Authorization"] for call in mock_request.call_args_list],
+            ["Bearer expired_token", "Bearer new_token", "Bearer new_token"],
+        )
+
+    @patch("webuddhist_client.requests.Session.request")
+    def test_unknown_token_rejected_is_not_retried(self, mock_request):
+        mock_request.return_value = Mock(status_code=401)
+        token_provider = Mock()
+        token_provider.refresh.return_value = None
+        client = WebBuddhistClient(base_url="https://api.example.com", max_retries=0, token_provider=token_provider)
+
+        self.assertEqual(client.post("/api/v1/segments", json={"segments": []}, token="other_token").status_code, 401)
+        client.close()
+
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_set_token_sets_default_authorization_header(self):
+        self.client.set_token("session_token")
+        self.assertEqual(self.client.session.headers["Authorization"], "Bearer session_token")
+
+    def test_get_default_client_is_shared(self):
+        self.assertIs(get_default_client(), get_default_client())
+
+    @patch("webuddhist_client.time.sleep")
+    @patch("webuddhist_client.requests.Session.request")
+    def test_transient_errors_are_retried(self, mock_request, mock_sleep):
+        mock_request.side_effect = [
+            Mock(status_code=503),
+            requests.exceptions.Timeout("Read timed out"),
+            Mock(status_code=201),
+        ]
+
+        response = self.client.post("/api/v1/segments", json={"segments": []})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("webuddhist_client.time.sleep")
+    @patch("webuddhist_client.requests.Session.request")
+    def test_retries_stop_after_max_retries(self, mock_request, mock_sleep):
+        mock_request.return_value = Mock(status_code=429)
+
+        response = self.client.post("/api/v1/segments", json={"segments": []})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(mock_request.call_count, 3)
+
+    @patch("webuddhist_client.time.sleep")
+    @patch("webuddhist_client.requests.Session.request")
+    def test_client_errors_are_not_retried(self, mock_request, mock_sleep):
+        mock_request.return_value = Mock(status_code=400)
+
+        self.client.post("/api/v1/segments", json={"segments": []})
+
+        self.assertEqual(mock_request.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_backoff_is_capped(self):
+        for attempt in range(10):
+            self.assertLessEqual(self.client.get_backoff_seconds(attempt), 5)
+
+    def test_check_response_raises_for_error_status(self):
+        with self.assertRaises(WebBuddhistAPIError):
+            check_response(Mock(status_code=500, text="Internal Server Error"))
+        response = Mock(status_code=201)
+        self.assertIs(check_response(response), response)